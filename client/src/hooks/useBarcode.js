@@ -1,37 +1,44 @@
 import { useState, useEffect } from 'react';
-import { connectScale, disconnectScale, onScaleEvent } from '../services/scaleSocket';
+import { connectScale, onScaleEvent, matchesStation } from '../services/scaleSocket';
 
 /**
  * React hook для получения сканов штрихкодов через Socket.io.
  *
+ * @param {string|null} [station] — станция Pi (весы + сканер); по умолчанию основная
  * @returns {{
  *   lastBarcode: string|null,       — последний отсканированный штрихкод
  *   scanTime: number|null,          — timestamp последнего скана (Date.now())
  *   barcodeWeight: number|null,     — вес на момент скана (если передан от Pi)
  *   barcodeWeightUnit: string|null, — единица измерения веса
  *   barcodeWeightStable: boolean,   — стабильно ли показание
- *   barcodeBuffered: boolean        — был ли скан из оффлайн-буфера Pi
+ *   barcodeBuffered: boolean,       — был ли скан из оффлайн-буфера Pi
+ *   barcodeKnown: boolean|null,     — есть ли штрихкод в индексе Pi (null — индекса нет)
+ *   barcodePlants: Array            — совпадения из индекса: [{ room, roomName, strain, harvested }]
  * }}
  */
-export function useBarcode() {
+export function useBarcode(station = null) {
   const [lastBarcode, setLastBarcode] = useState(null);
   const [scanTime, setScanTime] = useState(null);
   const [barcodeWeight, setBarcodeWeight] = useState(null);
   const [barcodeWeightUnit, setBarcodeWeightUnit] = useState(null);
   const [barcodeWeightStable, setBarcodeWeightStable] = useState(false);
   const [barcodeBuffered, setBarcodeBuffered] = useState(false);
+  const [barcodeKnown, setBarcodeKnown] = useState(null);
+  const [barcodePlants, setBarcodePlants] = useState([]);
 
   useEffect(() => {
     connectScale();
 
     const unsubscribe = onScaleEvent((event, data) => {
-      if (event === 'barcode') {
+      if (event === 'barcode' && matchesStation(data, station)) {
         setLastBarcode(data.barcode || null);
         setScanTime(Date.now());
         setBarcodeWeight(data.weight != null ? data.weight : null);
         setBarcodeWeightUnit(data.unit || null);
         setBarcodeWeightStable(!!data.stable);
         setBarcodeBuffered(!!data.buffered);
+        setBarcodeKnown(data.known != null ? !!data.known : null);
+        setBarcodePlants(Array.isArray(data.plants) ? data.plants : []);
       }
     });
 
@@ -39,7 +46,10 @@ export function useBarcode() {
       unsubscribe();
     };
     // Не вызываем disconnectScale() — useScale тоже использует тот же socket
-  }, []);
+  }, [station]);
 
-  return { lastBarcode, scanTime, barcodeWeight, barcodeWeightUnit, barcodeWeightStable, barcodeBuffered };
+  return {
+    lastBarcode, scanTime, barcodeWeight, barcodeWeightUnit, barcodeWeightStable, barcodeBuffered,
+    barcodeKnown, barcodePlants
+  };
 }
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { connectScale, disconnectScale, onScaleEvent } from '../services/scaleSocket';
+import { connectScale, disconnectScale, onScaleEvent, getStations, matchesStation } from '../services/scaleSocket';
 
 /**
  * Конвертировать вес в граммы.
@@ -18,34 +18,48 @@ function toGrams(weight, unit) {
  * React hook для получения live-данных с весов через Socket.io.
  * Вес всегда возвращается в граммах (округлённый).
  *
+ * @param {string|null} [station] — станция Pi (весы + сканер); по умолчанию основная
  * @returns {{
  *   weight: number|null,       — текущий вес в граммах (null если нет данных)
  *   unit: string,              — всегда 'g'
- *   stable: boolean,           — показание стабильно
+ *   stable: boolean,           — показание стабильно (флаг весов)
+ *   settled: boolean,          — вес успокоился по детектору на Pi (обычно раньше stable)
  *   scaleConnected: boolean,   — весы подключены к серверу (Pi online)
  *   socketConnected: boolean,  — WebSocket соединение с сервером активно
- *   debug: object|null         — диагностика от Pi (обновляется каждые 5 сек)
+ *   debug: object|null,        — диагностика от Pi (обновляется каждые 5 сек)
+ *   stations: string[]         — станции Pi (пусто — старый Pi без станций)
  * }}
  */
-export function useScale() {
+export function useScale(station = null) {
   const [weight, setWeight] = useState(null);
   const [stable, setStable] = useState(false);
+  const [settled, setSettled] = useState(false);
   const [scaleConnected, setScaleConnected] = useState(false);
   const [socketConnected, setSocketConnected] = useState(false);
   const [debug, setDebug] = useState(null);
   const [syncing, setSyncing] = useState(false);
   const [syncCount, setSyncCount] = useState(0);
   const [bufferedBarcodes, setBufferedBarcodes] = useState(0);
+  const [stations, setStations] = useState(() => getStations().stations);
 
   useEffect(() => {
     connectScale();
+    // Смена станции — показания прежней не показываем
+    setWeight(null);
+    setStable(false);
+    setSettled(false);
 
     const unsubscribe = onScaleEvent((event, data) => {
+      if ((event === 'weight' || event === 'status') && !matchesStation(data, station)) return;
       switch (event) {
+        case 'stations':
+          setStations(data.stations);
+          break;
         case 'weight': {
           const grams = toGrams(data.weight, data.unit || 'g');
           setWeight(grams != null ? Math.round(grams) : null);
           setStable(data.stable ?? false);
+          setSettled(data.settled ?? false);
           setScaleConnected(true);
           break;
         }
@@ -54,6 +68,7 @@ export function useScale() {
           if (!data.connected) {
             setWeight(null);
             setStable(false);
+            setSettled(false);
           }
           break;
         case 'debug':
@@ -82,7 +97,7 @@ export function useScale() {
       unsubscribe();
       disconnectScale();
     };
-  }, []);
+  }, [station]);
 
-  return { weight, unit: 'g', stable, scaleConnected, socketConnected, debug, syncing, syncCount, bufferedBarcodes };
+  return { weight, unit: 'g', stable, settled, scaleConnected, socketConnected, debug, syncing, syncCount, bufferedBarcodes, stations };
 }
@@ -28,8 +28,19 @@ const Harvest = () => {
   const { t, i18n } = useTranslation();
   const { hasPermission, user } = useAuth();
   const canDoHarvest = hasPermission && hasPermission('harvest:record');
-  const { weight: scaleWeight, unit: scaleUnit, stable: scaleStable, scaleConnected, socketConnected, debug: scaleDebug, syncing, syncCount, bufferedBarcodes } = useScale();
-  const { lastBarcode, scanTime, barcodeWeight, barcodeWeightUnit, barcodeWeightStable, barcodeBuffered } = useBarcode();
+  // Станция Pi (весы + сканер) этого рабочего места; пусто — основная
+  const [scaleStation, setScaleStation] = useState(() => localStorage.getItem('harvest-scale-station') || null);
+  const { weight: scaleWeight, unit: scaleUnit, stable: scaleStable, settled: scaleSettled, scaleConnected, socketConnected, debug: scaleDebug, syncing, syncCount, bufferedBarcodes, stations: scaleStations } = useScale(scaleStation);
+  const {
+    lastBarcode, scanTime, barcodeWeight, barcodeWeightUnit, barcodeWeightStable, barcodeBuffered,
+    barcodeKnown, barcodePlants
+  } = useBarcode(scaleStation);
+
+  const changeScaleStation = (id) => {
+    setScaleStation(id || null);
+    if (id) localStorage.setItem('harvest-scale-station', id);
+    else localStorage.removeItem('harvest-scale-station');
+  };
 
   const CREW_ROLES = getCREW_ROLES(t);
   const getRoleInfo = (key) => CREW_ROLES.find(r => r.key === key) || { emoji: '❓', label: key, desc: '' };
@@ -62,6 +73,7 @@ const Harvest = () => {
   const [completionData, setCompletionData] = useState(null); // { crewData, roomSquareMeters, roomName, strain }
   const [scanFlash, setScanFlash] = useState(false);
   const [duplicateError, setDuplicateError] = useState(null);
+  const [scanInfo, setScanInfo] = useState(null); // куст из индекса штрихкодов Pi: { room, roomName, strain }
   const [successMsg, setSuccessMsg] = useState(null);
   const [showDebug, setShowDebug] = useState(false);
   const undoTimerRef = useRef(null);
@@ -282,8 +294,14 @@ const Harvest = () => {
       return;
     }
 
+    // Проверка по индексу штрихкодов на Pi (null — индекса нет): чужой куст
+    // подставляем, но автоматически не записываем
+    const match = barcodePlants.find(p => p.room === session.roomNumber) || null;
+    const notInRoom = barcodeKnown === false || (barcodeKnown === true && !match);
+    setScanInfo(match);
+
     setPlantNumber(String(num));
-    setError('');
+    setError(notInRoom ? t('harvest.barcodeNotInRoom', { num }) : '');
 
     let shouldAutoRecord = false;
     if (barcodeBuffered && barcodeWeight != null && barcodeWeight > 0) {
@@ -298,7 +316,7 @@ const Harvest = () => {
 
     // Auto-record directly — don't rely on plantNumber state change
     // (if scanned number equals current plantNumber, React won't re-render)
-    if (shouldAutoRecord) {
+    if (shouldAutoRecord && !notInRoom) {
       setTimeout(() => handleRecordPlant(null, String(num)), 0);
     }
   }, [scanTime]); // eslint-disable-line react-hooks/exhaustive-deps
@@ -1130,7 +1148,24 @@ const Harvest = () => {
           {/* Scale and plant recording — ONLY for weighing */}
           {isWeigher && (
             <div className="bg-dark-800 rounded-xl p-6 border border-dark-700 mb-6">
-              <h2 className="text-lg font-semibold text-white mb-4">{t('harvest.recordPlant')}</h2>
+              <div className="flex items-center justify-between gap-3 mb-4">
+                <h2 className="text-lg font-semibold text-white">{t('harvest.recordPlant')}</h2>
+                {/* Выбор станции — если у Pi несколько пар весы + сканер */}
+                {scaleStations.length > 1 && (
+                  <label className="flex items-center gap-2 text-sm text-dark-300">
+                    {t('harvest.station')}
+                    <select
+                      value={scaleStation && scaleStations.includes(scaleStation) ? scaleStation : scaleStations[0]}
+                      onChange={(e) => changeScaleStation(e.target.value === scaleStations[0] ? null : e.target.value)}
+                      className="px-2 py-1 bg-dark-700 border border-dark-600 rounded-lg text-white text-sm"
+                    >
+                      {scaleStations.map(id => (
+                        <option key={id} value={id}>{id}</option>
+                      ))}
+                    </select>
+                  </label>
+                )}
+              </div>
 
               {/* Live scale display */}
               <div className={`flex items-center gap-3 mb-4 p-3 rounded-lg border ${
@@ -1146,7 +1181,7 @@ const Harvest = () => {
                     <div className="text-3xl font-mono font-bold text-white leading-none">
                       {scaleWeight != null ? `${scaleWeight} ${t('common.grams')}` : `--- ${t('common.grams')}`}
                     </div>
-                    {scaleStable && (
+                    {(scaleStable || scaleSettled) && (
                       <span className="text-xs bg-green-600/20 text-green-400 px-2 py-0.5 rounded">
                         {t('harvest.stable')}
                       </span>
@@ -1177,12 +1212,15 @@ const Harvest = () => {
                     type="number"
                     min="1"
                     value={plantNumber}
-                    onChange={(e) => setPlantNumber(e.target.value)}
+                    onChange={(e) => { setPlantNumber(e.target.value); setScanInfo(null); }}
                     placeholder="1"
                     className={`w-28 px-3 py-2 bg-dark-700 border rounded-lg text-white text-lg focus:ring-2 focus:ring-primary-500 transition-colors duration-300 ${
                       scanFlash ? 'border-green-500 ring-2 ring-green-500/50' : 'border-dark-600'
                     }`}
                   />
+                  {scanInfo?.strain && (
+                    <p className="text-xs text-dark-400 mt-1 w-28 truncate" title={scanInfo.strain}>{scanInfo.strain}</p>
+                  )}
                 </div>
                 <div>
                   <label className="block text-sm text-dark-400 mb-1">{t('harvest.weightG')}</label>
@@ -3,6 +3,16 @@ import { useSystemStatus } from '../../hooks/useSystemStatus';
 
 // ── Формирователи индикаторов: из snapshot → {status, label, detail} ──
 // status: 'ok' | 'warn' | 'fail' | 'unknown'
+
+// Чек не уложился в свой дедлайн на Pi (probe.py CHECKS) — результата нет
+function timedOutIndicator(key, label, check) {
+  return { key, label, status: 'warn', detail: check.error || 'timed out' };
+}
+
+function guard(check, key, label, build) {
+  return check?.timedOut ? timedOutIndicator(key, label, check) : build(check);
+}
+
 function servicesList(services) {
   if (!services) return [];
   return Object.entries(services).map(([name, state]) => {
@@ -14,6 +24,11 @@ function servicesList(services) {
 function scannerIndicator(scanner) {
   if (!scanner) return { key: 'scanner', label: 'Scanner', status: 'unknown', detail: '—' };
   if (!scanner.found) return { key: 'scanner', label: 'Scanner', status: 'fail', detail: 'not found' };
+  if (scanner.grabbedByScaleClient == null) {
+    // scale-client не ответил по status-сокету — probe сам grab не пробует
+    return { key: 'scanner', label: 'Scanner', status: 'warn',
+             detail: `found at ${scanner.devicePath}, grab state unknown` };
+  }
   if (!scanner.grabbedByScaleClient) {
     return { key: 'scanner', label: 'Scanner', status: 'warn',
              detail: `found at ${scanner.devicePath}, no exclusive grab` };
@@ -28,8 +43,9 @@ function scaleIndicator(scale) {
   const sa = scale.secondsAgo;
   if (sa == null) return { key: 'scale-activity', label: 'Scale activity', status: 'warn', detail: 'no recent events' };
   const status = sa <= 120 ? 'ok' : (sa <= 600 ? 'warn' : 'fail');
+  const queue = scale.queueDepth ? `, ${scale.queueDepth} scans queued` : '';
   return { key: 'scale-activity', label: 'Scale activity',
-           status, detail: `last event ${sa}s ago` };
+           status, detail: `last event ${sa}s ago${queue}` };
 }
 
 function haIndicator(ha) {
@@ -105,18 +121,29 @@ function systemIndicators(sys) {
 function buildIndicators(checks) {
   if (!checks) return [];
   return [
-    ...servicesList(checks.services),
-    scannerIndicator(checks.scanner),
-    scaleIndicator(checks.scale),
-    haIndicator(checks.ha),
-    tailscaleIndicator(checks.tailscale),
-    iptablesIndicator(checks.iptables),
-    piZeroIndicator(checks.piZero),
-    usbIndicator(checks.usb),
-    ...systemIndicators(checks.system),
+    ...(checks.services?.timedOut
+      ? [timedOutIndicator('services', 'systemd units', checks.services)]
+      : servicesList(checks.services)),
+    guard(checks.scanner, 'scanner', 'Scanner', scannerIndicator),
+    guard(checks.scale, 'scale-activity', 'Scale activity', scaleIndicator),
+    guard(checks.ha, 'ha', 'Home Assistant', haIndicator),
+    guard(checks.tailscale, 'tailscale', 'Tailscale', tailscaleIndicator),
+    guard(checks.iptables, 'iptables', 'UDP-block (iptables)', iptablesIndicator),
+    guard(checks.piZero, 'pi-zero', 'Pi Zero (sensors)', piZeroIndicator),
+    guard(checks.usb, 'usb', 'USB devices', usbIndicator),
+    ...(checks.system?.timedOut
+      ? [timedOutIndicator('system', 'System', checks.system)]
+      : systemIndicators(checks.system)),
   ];
 }
 
+// Три самых долгих чека snapshot'а: "piZero 10012 ms, ha 80 ms, ..."
+function slowestChecks(durations) {
+  if (!durations) return null;
+  const top = Object.entries(durations).sort((a, b) => b[1] - a[1]).slice(0, 3);
+  return top.length ? top.map(([name, ms]) => `${name} ${ms} ms`).join(', ') : null;
+}
+
 const DOT = {
   ok:      'bg-green-400',
   warn:    'bg-yellow-400',
@@ -215,6 +242,12 @@ export default function SystemStatus() {
           {t('systemStatus.host')}: <code className="text-dark-300">{snapshot.host}</code>
           {' · '}
           {t('systemStatus.probeTook')}: <code className="text-dark-300">{snapshot.durationMs} ms</code>
+          {slowestChecks(snapshot.checkDurationsMs) && (
+            <>
+              {' · '}
+              {t('systemStatus.slowest')}: <code className="text-dark-300">{slowestChecks(snapshot.checkDurationsMs)}</code>
+            </>
+          )}
           {' · '}
           {t('systemStatus.takenAt')}: <code className="text-dark-300">{new Date(snapshot.timestamp).toLocaleString()}</code>
         </div>
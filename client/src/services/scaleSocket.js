@@ -2,6 +2,8 @@ import { io } from 'socket.io-client';
 
 let socket = null;
 let listeners = new Set();
+// Станции Pi (весы + сканер): список id и основная (первая)
+let stationInfo = { stations: [], primary: null };
 
 /**
  * Подключиться к Socket.io серверу для получения данных с весов и сканера штрихкодов.
@@ -34,6 +36,14 @@ export function connectScale() {
     listeners.forEach(cb => cb('status', data));
   });
 
+  socket.on('scale:stations', (data) => {
+    stationInfo = {
+      stations: Array.isArray(data?.stations) ? data.stations : [],
+      primary: data?.primary || null
+    };
+    listeners.forEach(cb => cb('stations', stationInfo));
+  });
+
   socket.on('barcode:scan', (data) => {
     listeners.forEach(cb => cb('barcode', data));
   });
@@ -103,10 +113,29 @@ export function disconnectScale() {
   }
 }
 
+/**
+ * Станции Pi, известные на данный момент.
+ * @returns {{ stations: string[], primary: string|null }}
+ */
+export function getStations() {
+  return stationInfo;
+}
+
+/**
+ * Относится ли событие весов/сканера к станции.
+ * Событие без station (старый Pi, общий статус) — ко всем станциям;
+ * station не задана — основная.
+ */
+export function matchesStation(data, station) {
+  if (!data?.station) return true;
+  const target = station || stationInfo.primary;
+  return !target || data.station === target;
+}
+
 /**
  * Подписаться на события весов.
  * @param {Function} callback - (event, data) => void
- *   event: 'weight' | 'status' | 'barcode' | 'debug' | 'socketConnected' | 'socketDisconnected'
+ *   event: 'weight' | 'status' | 'barcode' | 'debug' | 'stations' | 'socketConnected' | 'socketDisconnected'
  * @returns {Function} unsubscribe
  */
 export function onScaleEvent(callback) {
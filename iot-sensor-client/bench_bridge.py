@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for mqtt_bridge.py.
+
+Publishes synthetic grow/zone/<id>/sensors and zigbee2mqtt/<device> traffic
+into a local broker, runs the real bridge against a local stand-in of the
+Railway ingest API, and reports how the pipeline keeps up:
+
+    throughput           readings acknowledged by the stand-in per second
+    forward latency      publish → stand-in received, p50 / p99 / max
+    buffer growth        peak rows in the bridge's SQLite retry buffer
+    drain time           end of outage / traffic → buffer empty + all delivered
+
+The stand-in can inject latency, random 5xx errors and a hard outage window
+(connections are closed without a response, like a dead uplink).
+
+Usage:
+    python3 bench_bridge.py --rate 50 --duration 60
+    python3 bench_bridge.py --rate 200 --zones 8 --zigbee 20 --latency-ms 80 --error-rate 0.02
+    python3 bench_bridge.py --rate 50 --duration 120 --outage 30:40 --spawn-broker
+    python3 bench_bridge.py ... --json > result.json
+
+Needs a broker on --broker/--port (or --spawn-broker, which starts
+`mosquitto -p <port>`). Sensor readings carry a `bench_sent` field that the
+bridge forwards untouched; zigbee readings are reshaped by the bridge, so
+they only count towards throughput, not latency.
+"""
+
+import argparse
+import http.server
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import yaml
+import paho.mqtt.client as mqtt
+
+HERE = Path(__file__).parent
+
+
+# ── Stand-in for the Railway ingest API ──
+class StandIn:
+    """Records every reading POSTed to /api/sensor-data (+ /status)."""
+
+    def __init__(self, latency_ms=0, error_rate=0.0, outage=None):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.outage = outage  # (start, end) in seconds since t0, or None
+        self.t0 = None
+        self.lock = threading.Lock()
+        self.latencies = []   # seconds, grow/zone readings only
+        self.seen = set()     # bench_seq values delivered
+        self.duplicates = 0
+        self.zigbee = 0
+        self.status_posts = 0
+        self.requests = 0
+        self.errors_injected = 0
+        self.dropped_in_outage = 0
+        self.last_delivery = None
+
+    def in_outage(self):
+        if not self.outage or self.t0 is None:
+            return False
+        elapsed = time.time() - self.t0
+        return self.outage[0] <= elapsed < self.outage[1]
+
+    def handle(self, path, body):
+        """Returns an HTTP status, or None to drop the connection."""
+        with self.lock:
+            self.requests += 1
+        if self.in_outage():
+            with self.lock:
+                self.dropped_in_outage += 1
+            return None
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            with self.lock:
+                self.errors_injected += 1
+            return 503
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400
+        if path.endswith("/status"):
+            with self.lock:
+                self.status_posts += 1
+            return 200
+        received = time.time()
+        with self.lock:
+            for reading in data if isinstance(data, list) else [data]:
+                if reading.get("zigbee_sensors"):
+                    self.zigbee += 1
+                    continue
+                seq = reading.get("bench_seq")
+                if seq is None:
+                    continue
+                if seq in self.seen:
+                    self.duplicates += 1
+                    continue
+                self.seen.add(seq)
+                sent = reading.get("bench_sent")
+                if sent is not None:
+                    self.latencies.append(received - sent)
+            self.last_delivery = received
+        return 201
+
+    def serve(self, port):
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                status = standin.handle(self.path, body)
+                if status is None:
+                    self.close_connection = True  # no response: client sees a dropped connection
+                    return
+                payload = b'{"saved":1}' if status < 300 else b'{"message":"bench"}'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# ── Helpers ──
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def buffer_rows(db_path):
+    if not db_path.exists():
+        return 0
+    try:
+        conn = sqlite3.connect(str(db_path), timeout=1)
+        count = conn.execute("SELECT COUNT(*) FROM api_queue").fetchone()[0]
+        conn.close()
+        return count
+    except sqlite3.Error:
+        return 0
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[idx]
+
+
+def write_bench_config(workdir, args, api_port, http_port):
+    base = yaml.safe_load((HERE / "bridge_config.yaml").read_text())
+    config = {
+        "mqtt": {"broker": args.broker, "port": args.port},
+        "api": {"url": f"http://127.0.0.1:{api_port}", "key": "bench"},
+        "routes": base.get("routes"),
+        "lanes": dict(base.get("lanes") or {}, retry_interval=args.retry_interval),
+        "metrics": {"interval": 10, "topic": "bench/bridge/{instance}/stats"},
+        "http": {"host": "127.0.0.1", "port": http_port},
+        "buffer_dir": str(workdir),
+        "zigbee_sensors": {
+            f"bench-zb-{i}": {"zone_id": f"bench-{i % max(args.zones, 1)}", "location": f"zb-{i}"}
+            for i in range(args.zigbee)
+        },
+    }
+    path = Path(workdir) / "bench_config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+def sensor_payload(zone_id, seq):
+    return {
+        "zoneId": zone_id,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "temperatures": [
+            {"sensorId": "28-bench-a", "location": "canopy", "value": round(random.uniform(22, 27), 2)},
+            {"sensorId": "sht45", "location": "ambient-sht45", "value": round(random.uniform(22, 27), 2)},
+        ],
+        "co2": round(random.uniform(600, 1200)),
+        "temperature": round(random.uniform(22, 27), 1),
+        "humidity": round(random.uniform(45, 70), 1),
+        "humidity_sht45": round(random.uniform(45, 70), 1),
+        "light": random.choice([0, 35000]),
+        "bench_seq": seq,
+        "bench_sent": time.time(),
+    }
+
+
+def publish_traffic(client, args, stop_at):
+    """Publish at args.rate msgs/s, round-robin over zones then zigbee devices."""
+    topics = [("sensors", f"bench-{z}") for z in range(args.zones)]
+    topics += [("zigbee", f"bench-zb-{d}") for d in range(args.zigbee)]
+    interval = 1.0 / args.rate
+    published = {"sensors": 0, "zigbee": 0}
+    seq = 0
+    next_at = time.time()
+    i = 0
+    while time.time() < stop_at:
+        kind, name = topics[i % len(topics)]
+        i += 1
+        if kind == "sensors":
+            body = sensor_payload(name, seq)
+            seq += 1
+            client.publish(f"grow/zone/{name}/sensors", json.dumps(body), qos=1)
+        else:
+            body = {"temperature": round(random.uniform(20, 28), 2),
+                    "humidity": round(random.uniform(40, 80), 1),
+                    "battery": 90, "linkquality": 120}
+            client.publish(f"zigbee2mqtt/{name}", json.dumps(body), qos=1)
+        published[kind] += 1
+        next_at += interval
+        delay = next_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+    return published, seq
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test mqtt_bridge against a local API stand-in")
+    parser.add_argument("--broker", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--spawn-broker", action="store_true", help="start mosquitto on a free port")
+    parser.add_argument("--rate", type=float, default=20, help="messages per second (all topics)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic")
+    parser.add_argument("--zones", type=int, default=4, help="synthetic grow/zone/* publishers")
+    parser.add_argument("--zigbee", type=int, default=4, help="synthetic zigbee2mqtt/* devices")
+    parser.add_argument("--latency-ms", type=float, default=0, help="stand-in response delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 503 responses")
+    parser.add_argument("--outage", default=None, help="START:DURATION seconds of dropped connections")
+    parser.add_argument("--retry-interval", type=float, default=5, help="bridge back-off after a failure")
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if args.zones <= 0:
+        parser.error("--zones must be at least 1 (latency is measured on zone readings)")
+
+    outage = None
+    if args.outage:
+        start, length = (float(x) for x in args.outage.split(":"))
+        outage = (start, start + length)
+
+    procs = []
+    workdir = Path(tempfile.mkdtemp(prefix="bench-bridge-"))
+    try:
+        if args.spawn_broker:
+            args.broker, args.port = "127.0.0.1", free_port()
+            procs.append(subprocess.Popen(["mosquitto", "-p", str(args.port)],
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            time.sleep(0.5)
+
+        standin = StandIn(args.latency_ms, args.error_rate, outage)
+        api_port, http_port = free_port(), free_port()
+        server = standin.serve(api_port)
+        config_path = write_bench_config(workdir, args, api_port, http_port)
+        instance = f"bench-{os.getpid()}"
+        db_path = workdir / f"bridge_buffer-{instance}.db"
+
+        env = dict(os.environ, BRIDGE_CONFIG=str(config_path), BRIDGE_INSTANCE=instance,
+                   PYTHONUNBUFFERED="1")
+        bridge_log = open(workdir / "bridge.log", "w")
+        bridge = subprocess.Popen([sys.executable, str(HERE / "mqtt_bridge.py")], env=env,
+                                  stdout=bridge_log, stderr=subprocess.STDOUT)
+        procs.append(bridge)
+        time.sleep(1.5)  # let the bridge connect and subscribe
+        if bridge.poll() is not None:
+            print(f"bridge exited early, see {workdir / 'bridge.log'}", file=sys.stderr)
+            sys.exit(1)
+
+        client = mqtt.Client(client_id=f"bench-publisher-{os.getpid()}")
+        client.connect(args.broker, args.port, keepalive=30)
+        client.loop_start()
+
+        peak_buffer = 0
+        samples = []
+        sampling = threading.Event()
+
+        def sample_buffer():
+            nonlocal peak_buffer
+            while not sampling.is_set():
+                rows = buffer_rows(db_path)
+                peak_buffer = max(peak_buffer, rows)
+                samples.append((round(time.time() - standin.t0, 1), rows))
+                sampling.wait(0.5)
+
+        standin.t0 = time.time()
+        threading.Thread(target=sample_buffer, daemon=True).start()
+        published, sensor_count = publish_traffic(client, args, standin.t0 + args.duration)
+        traffic_end = time.time()
+
+        # Drain: wait until the buffer is empty and every zone reading arrived
+        drain_from = max(traffic_end, standin.t0 + outage[1]) if outage else traffic_end
+        deadline = traffic_end + args.drain_timeout
+        drained_at = None
+        while time.time() < deadline:
+            if (time.time() >= drain_from and buffer_rows(db_path) == 0
+                    and len(standin.seen) >= sensor_count):
+                drained_at = time.time()
+                break
+            time.sleep(0.2)
+        sampling.set()
+
+        client.loop_stop()
+        client.disconnect()
+        server.shutdown()
+
+        active = (standin.last_delivery or traffic_end) - standin.t0
+        delivered = len(standin.seen) + standin.zigbee
+        lat = standin.latencies
+        report = {
+            "config": {
+                "rate": args.rate, "duration": args.duration, "zones": args.zones,
+                "zigbee": args.zigbee, "latencyMs": args.latency_ms,
+                "errorRate": args.error_rate, "outage": args.outage,
+            },
+            "published": published,
+            "delivered": {"sensors": len(standin.seen), "zigbee": standin.zigbee,
+                          "duplicates": standin.duplicates, "statusPosts": standin.status_posts},
+            "lost": sensor_count - len(standin.seen),
+            "apiRequests": standin.requests,
+            "injected": {"errors": standin.errors_injected, "outageDrops": standin.dropped_in_outage},
+            "throughputPerSec": round(delivered / active, 1) if active > 0 else None,
+            "latencyMs": {
+                "p50": round(percentile(lat, 0.50) * 1000, 1) if lat else None,
+                "p99": round(percentile(lat, 0.99) * 1000, 1) if lat else None,
+                "max": round(max(lat) * 1000, 1) if lat else None,
+            },
+            "bufferPeakRows": peak_buffer,
+            "drainSec": round(drained_at - drain_from, 1) if drained_at else None,
+            "bufferSamples": samples if args.json else None,
+            "bridgeLog": str(workdir / "bridge.log"),
+        }
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def print_report(r):
+    lat = r["latencyMs"]
+    print("=== mqtt_bridge benchmark ===")
+    c = r["config"]
+    print(f"load:        {c['rate']} msg/s for {c['duration']}s "
+          f"({c['zones']} zones, {c['zigbee']} zigbee devices)")
+    print(f"faults:      latency={c['latencyMs']}ms errors={c['errorRate']} outage={c['outage'] or '-'}")
+    print(f"published:   {r['published']['sensors']} sensor + {r['published']['zigbee']} zigbee")
+    print(f"delivered:   {r['delivered']['sensors']} sensor + {r['delivered']['zigbee']} zigbee "
+          f"({r['lost']} lost, {r['delivered']['duplicates']} duplicate)")
+    print(f"throughput:  {r['throughputPerSec']} readings/s")
+    print(f"latency:     p50={lat['p50']}ms p99={lat['p99']}ms max={lat['max']}ms")
+    print(f"buffer:      peak {r['bufferPeakRows']} rows, drain {r['drainSec']}s")
+    print(f"bridge log:  {r['bridgeLog']}")
+
+
+if __name__ == "__main__":
+    main()
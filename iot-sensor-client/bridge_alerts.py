@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Local threshold alerting in the MQTT-to-API bridge.
+
+Rules are evaluated in-stream on every reading the bridge forwards, so a
+breach is noticed within the same MQTT callback instead of after the
+Railway round-trip + scheduler poll, and keeps working without uplink.
+
+Per zone and metric (temperature, humidity, co2, vpd: min/max; offline:
+seconds without a reading) an alert state machine mirrors the portal's
+schedulers/alerts.js:
+    - breach must persist `sustain_s` before firing (flapping guard)
+    - recovery needs the value back inside the range by a hysteresis
+      margin (`recover_margin_pct` of the min↔max span, capped)
+Metric values are taken the same way as getMetricValue() on the server.
+
+Each alert/recovery event is
+    - published on MQTT `grow/alerts/<zone>/<metric>` (local consumers)
+    - sent to Telegram if configured (own thread, never on the MQTT loop)
+    - forwarded to POST /api/sensor-data/alerts through the status lane;
+      buffered to SQLite while the API is unreachable, replayed later
+"""
+
+import json
+import math
+import os
+import queue
+import threading
+import time
+import types
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+from bridge_lanes import LANE_STATUS, Item
+
+LABELS = {
+    "temperature": "🌡 Температура",
+    "humidity": "💧 Влажность",
+    "co2": "🫧 CO2",
+    "vpd": "🌱 VPD",
+    "offline": "🔌 Связь",
+}
+UNITS = {"temperature": "°C", "humidity": "%", "co2": " ppm", "vpd": " kPa", "offline": " s"}
+
+
+def metric_value(reading, metric):
+    """Same selection as getMetricValue() in server/schedulers/alerts.js."""
+    if metric == "temperature":
+        return reading.get("temperature")
+    if metric == "humidity":
+        rh = reading.get("humidity_sht45")
+        return rh if rh is not None else reading.get("humidity")
+    if metric == "co2":
+        return reading.get("co2")
+    if metric == "vpd":
+        sht45_t = next((t.get("value") for t in reading.get("temperatures") or []
+                        if t.get("sensorId") == "sht45" or "sht45" in (t.get("location") or "")), None)
+        air_t = sht45_t if sht45_t is not None else reading.get("temperature")
+        rh = metric_value(reading, "humidity")
+        if air_t is None or rh is None:
+            return None
+        svp = 0.6108 * math.exp(17.27 * air_t / (air_t + 237.3))
+        return max(0.0, svp * (1 - rh / 100))
+    return None
+
+
+class _State:
+    __slots__ = ("active", "pending_since", "recover_since")
+
+    def __init__(self):
+        self.active = False
+        self.pending_since = None
+        self.recover_since = None
+
+
+class AlertEngine:
+    def __init__(self, conf, publish=None, submit=None):
+        """
+        conf:    bridge_config.yaml → alerts
+        publish: fn(topic, payload_str) — local MQTT notification
+        submit:  fn(Item) — upstream forwarding (PriorityLanes.submit)
+        """
+        self.rules = {}  # zone → {metric: {min, max}} / {"offline": seconds}
+        defaults = conf.get("defaults") or {}
+        for zone, rules in (conf.get("zones") or {}).items():
+            merged = dict(defaults, **(rules or {}))
+            self.rules[zone] = {m: r for m, r in merged.items() if r}
+        self.sustain_s = float(conf.get("sustain_s", 0))
+        self.recover_margin_pct = float(conf.get("recover_margin_pct", 0.05))
+        self.topic = conf.get("topic", "grow/alerts/{zone}/{metric}")
+        self.route = types.SimpleNamespace(
+            name="alerts", endpoint=conf.get("endpoint", "/api/sensor-data/alerts"),
+            buffer=True, lane=LANE_STATUS)
+        self.publish = publish
+        self.submit = submit if conf.get("forward", True) else None
+        self._state = {}      # (zone, metric) → _State
+        self._last_seen = {}  # zone → received_at
+        self._lock = threading.Lock()
+        self._telegram = None
+        tg = conf.get("telegram") or {}
+        token = tg.get("token") or os.environ.get("TELEGRAM_BOT_TOKEN")
+        if token and tg.get("chat_id"):
+            self._telegram = queue.Queue(maxsize=100)
+            threading.Thread(target=self._telegram_loop, args=(token, str(tg["chat_id"])),
+                             name="bridge-telegram", daemon=True).start()
+        self.counters = {"alerts": 0, "recoveries": 0}
+
+    def watches(self, zone):
+        return zone in self.rules
+
+    # ── Evaluation ──
+    def evaluate(self, data, received_at):
+        """Called on the MQTT thread with each decoded reading of a watched zone."""
+        for r in data if isinstance(data, list) else [data]:
+            zone = r.get("zoneId")
+            rules = self.rules.get(zone)
+            if not rules or r.get("source") == "zigbee":
+                continue
+            events = []
+            with self._lock:
+                self._last_seen[zone] = received_at
+                offline = self._state.get((zone, "offline"))
+                if offline and offline.active:
+                    offline.active = False
+                    events.append(self._event(zone, "offline", "recovery", None, None, received_at))
+                for metric, rule in rules.items():
+                    if metric == "offline":
+                        continue
+                    value = metric_value(r, metric)
+                    if value is not None:
+                        event = self._step(zone, metric, rule, value, received_at)
+                        if event:
+                            events.append(event)
+            for event in events:
+                self._emit(event)
+
+    def _step(self, zone, metric, rule, value, now):
+        lo, hi = rule.get("min"), rule.get("max")
+        state = self._state.setdefault((zone, metric), _State())
+        breach = (lo is not None and value < lo) or (hi is not None and value > hi)
+        if not state.active:
+            state.recover_since = None
+            if not breach:
+                state.pending_since = None
+                return None
+            if state.pending_since is None:
+                state.pending_since = now
+            if now - state.pending_since < self.sustain_s:
+                return None
+            state.active = True
+            state.pending_since = None
+            threshold = f"<{lo}" if lo is not None and value < lo else f">{hi}"
+            return self._event(zone, metric, "alert", value, threshold, now)
+
+        # Active: recover only inside the range by the hysteresis margin
+        span = (hi - lo) if lo is not None and hi is not None else None
+        margin = min(span * self.recover_margin_pct, 1.0) if span else 0.0
+        inside = ((lo is None or value >= lo + margin) and (hi is None or value <= hi - margin))
+        if not inside:
+            state.recover_since = None
+            return None
+        if state.recover_since is None:
+            state.recover_since = now
+        if now - state.recover_since < self.sustain_s:
+            return None
+        state.active = False
+        state.recover_since = None
+        return self._event(zone, metric, "recovery", value, None, now)
+
+    def tick(self, now=None):
+        """Offline rules; called from the bridge main loop."""
+        now = now or time.time()
+        events = []
+        with self._lock:
+            for zone, rules in self.rules.items():
+                limit = rules.get("offline")
+                last = self._last_seen.get(zone)
+                if not limit or last is None:
+                    continue  # never seen since start: nothing to compare against
+                state = self._state.setdefault((zone, "offline"), _State())
+                silent = now - last
+                if not state.active and silent > float(limit):
+                    state.active = True
+                    events.append(self._event(zone, "offline", "alert", round(silent), f">{limit}", now))
+        for event in events:
+            self._emit(event)
+
+    # ── Notification ──
+    def _event(self, zone, metric, kind, value, threshold, at):
+        if metric == "vpd" and value is not None:
+            shown = f"{value:.2f}"
+        elif value is not None:
+            shown = f"{round(value, 1)}"
+        else:
+            shown = None
+        label = LABELS.get(metric, metric)
+        if kind == "alert":
+            message = f"⚠️ <b>Зона: {zone}</b>\n{label}: <b>{shown}{UNITS.get(metric, '')}</b> ({threshold})"
+        else:
+            message = f"✅ <b>Зона: {zone}</b>\n{label} в норме" + (f": {shown}{UNITS.get(metric, '')}" if shown else "")
+        return {
+            "eventId": uuid.uuid4().hex,
+            "zoneId": zone,
+            "metric": metric,
+            "type": kind,
+            "value": round(value, 2) if value is not None else None,
+            "threshold": threshold,
+            "message": message,
+            "timestamp": datetime.fromtimestamp(at, timezone.utc).isoformat(),
+            "source": "bridge",
+        }
+
+    def _emit(self, event):
+        self.counters["alerts" if event["type"] == "alert" else "recoveries"] += 1
+        print(f"[Alert] {event['zoneId']} {event['metric']} {event['type']}"
+              + (f" value={event['value']} {event['threshold'] or ''}" if event["value"] is not None else ""))
+        body = json.dumps(event)
+        if self.publish:
+            self.publish(self.topic.format(zone=event["zoneId"], metric=event["metric"]), body)
+        if self.submit:
+            self.submit(Item(self.route, body.encode("utf-8"), f"alert:{event['eventId']}",
+                             f"{event['zoneId']} {event['metric']} {event['type']}"))
+        if self._telegram is not None:
+            try:
+                self._telegram.put_nowait(event["message"])
+            except queue.Full:
+                pass
+
+    def _telegram_loop(self, token, chat_id):
+        url = f"https://api.telegram.org/bot{token}/sendMessage"
+        while True:
+            text = self._telegram.get()
+            data = json.dumps({"chat_id": chat_id, "text": text, "parse_mode": "HTML"}).encode("utf-8")
+            req = urllib.request.Request(url, data=data, method="POST")
+            req.add_header("Content-Type", "application/json")
+            try:
+                with urllib.request.urlopen(req, timeout=10):
+                    pass
+            except Exception as e:
+                print(f"[Alert] Telegram failed: {e}")
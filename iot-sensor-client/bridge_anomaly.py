@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Stuck / spiking / drifting sensor detection in the MQTT-to-API bridge.
+
+Every stored body is queued as-is on the MQTT thread (no decode, so the
+pass-through stays cheap). Once per `interval` the main loop decodes the
+queue, flattens each reading (bridge_tsdb.flatten_reading) into
+per-sensor channels, each a fixed-size ring of (time, value) rows in two
+NumPy arrays (channels × window), and runs one vectorized pass over all
+channels:
+
+    frozen   peak-to-peak over the last `frozen_window_s` is ~0 with at
+             least `frozen_min_samples` samples (the BH1750 power-down bug
+             held one value for hours). Light at darkness level is skipped.
+    spike    rate of change between any two consecutive samples that
+             arrived since the previous pass exceeds the metric's
+             `max_rate` (units per minute) — a pass sees several samples
+             per sensor, and a one-sample glitch may have recovered already
+    drift    window means of two sensors measuring the same quantity
+             (e.g. SHT45 vs STCC4 temperature) differ by more than `max_diff`
+
+Current flags are patched into the forwarded payload as `anomalies`
+(no re-encode, bridge_routes.patch_json_object) and reported in the
+metrics summary.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from bridge_tsdb import flatten_reading
+
+DEFAULTS = {
+    "interval": 60,
+    "window": 512,               # samples per channel
+    "queue_max": 20000,          # bodies waiting for the next pass
+    "frozen_window_s": 3 * 3600,
+    "frozen_min_samples": 30,
+    "max_rate": {"temperature": 3.0, "humidity": 15.0, "co2": 800.0},
+    "pairs": [
+        {"metric": "temperature", "sensors": ["sht45", "co2_sensor"], "max_diff": 2.0},
+        {"metric": "humidity", "sensors": ["sht45", "co2_sensor"], "max_diff": 10.0},
+    ],
+}
+
+LIGHT_DARK_LUX = 50  # below this a flat light reading is just night
+
+
+class AnomalyDetector:
+    def __init__(self, conf=None):
+        conf = dict(DEFAULTS, **(conf or {}))
+        self.interval = conf["interval"]
+        self.window = int(conf["window"])
+        self.frozen_window_s = conf["frozen_window_s"]
+        self.frozen_min_samples = conf["frozen_min_samples"]
+        self.max_rate = conf["max_rate"]
+        self.pairs = conf["pairs"]
+        self._lock = threading.Lock()
+        self._index = {}   # (zone, metric, sensor) → row
+        self._keys = []    # row → (zone, metric, sensor)
+        self._values = np.full((0, self.window), np.nan)
+        self._times = np.full((0, self.window), np.nan)
+        self._pos = np.zeros(0, dtype=np.int64)  # next write slot per row
+        self._flags = {}   # zone → [flag, ...] from the last pass
+        self._last_run = time.time()
+        self._checked_until = -np.inf  # samples newer than this are new to the spike check
+        self._pending = deque(maxlen=int(conf["queue_max"]))  # (body, received_at)
+        self.counters = {"frozen": 0, "spike": 0, "drift": 0, "dropped": 0, "skipped": 0}
+
+    # ── MQTT thread ──
+    def push(self, body, received_at):
+        """Queue a forwarded body (bytes, object or batch array); decoded in run()."""
+        if len(self._pending) == self._pending.maxlen:
+            self.counters["dropped"] += 1  # oldest falls out
+        self._pending.append((body, received_at))
+
+    def _ingest(self):
+        """Decode queued bodies into the windows. Caller holds the lock."""
+        while self._pending:
+            body, received_at = self._pending.popleft()
+            try:
+                data = json.loads(body)
+                points = [
+                    (reading.get("zoneId"), metric, sensor, value)
+                    for reading in (data if isinstance(data, list) else [data])
+                    if reading.get("zoneId")
+                    for metric, sensor, value in flatten_reading(reading)
+                ]
+            except Exception:
+                self.counters["skipped"] += 1
+                continue
+            for zone, metric, sensor, value in points:
+                if not isinstance(value, (int, float)):
+                    continue
+                row = self._row((zone, metric, sensor))
+                slot = self._pos[row] % self.window
+                self._values[row, slot] = value
+                self._times[row, slot] = received_at
+                self._pos[row] += 1
+
+    def _row(self, key):
+        row = self._index.get(key)
+        if row is None:
+            row = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            empty = np.full((1, self.window), np.nan)
+            self._values = np.vstack([self._values, empty])
+            self._times = np.vstack([self._times, empty])
+            self._pos = np.append(self._pos, 0)
+        return row
+
+    def flags(self, zone):
+        """Flags for a zone from the last pass (for the forwarded payload)."""
+        return self._flags.get(zone)
+
+    def current(self):
+        return self._flags
+
+    # ── Main loop ──
+    def due(self, now=None):
+        return (now or time.time()) - self._last_run >= self.interval
+
+    def run(self, now=None):
+        """One vectorized pass over every channel; returns {zone: [flags]}."""
+        now = now or time.time()
+        self._last_run = now
+        since, self._checked_until = self._checked_until, now
+        with self._lock:
+            self._ingest()
+            if not self._keys:
+                return {}
+            values = self._values.copy()
+            times = self._times.copy()
+            pos = self._pos.copy()
+            keys = list(self._keys)
+            index = dict(self._index)
+
+        flags = {}
+
+        def flag(row, kind, **extra):
+            zone, metric, sensor = keys[row]
+            flags.setdefault(zone, []).append(dict({"kind": kind, "metric": metric, "sensor": sensor}, **extra))
+            self.counters[kind] += 1
+
+        # frozen: peak-to-peak over the recent window
+        recent = times >= now - self.frozen_window_s
+        masked = np.where(recent, values, np.nan)
+        count = np.sum(recent & ~np.isnan(values), axis=1)
+        with np.errstate(all="ignore"):
+            ptp = np.nanmax(masked, axis=1) - np.nanmin(masked, axis=1)
+            held = np.nanmax(masked, axis=1)
+        is_light = np.array([k[1] == "light" for k in keys])
+        frozen = (count >= self.frozen_min_samples) & (ptp == 0) & ~(is_light & (held <= LIGHT_DARK_LUX))
+        for row in np.flatnonzero(frozen):
+            flag(row, "frozen", value=float(held[row]), samples=int(count[row]))
+
+        # spike: every consecutive pair whose later sample is new since the last pass.
+        # Rings unrolled oldest → newest (unfilled slots are NaN and drop out)
+        order = (pos[:, None] + np.arange(self.window)[None, :]) % self.window
+        ring_v = np.take_along_axis(values, order, axis=1)
+        ring_t = np.take_along_axis(times, order, axis=1)
+        with np.errstate(invalid="ignore"):
+            rate = np.abs(np.diff(ring_v, axis=1)) / np.maximum(np.diff(ring_t, axis=1), 1.0) * 60.0
+            rate = np.where(ring_t[:, 1:] > since, rate, np.nan)
+        limits = np.array([self.max_rate.get(k[1], np.inf) for k in keys], dtype=float)
+        with np.errstate(invalid="ignore"):
+            spike = np.any(rate > limits[:, None], axis=1)
+        for row in np.flatnonzero(spike):
+            worst = int(np.nanargmax(rate[row]))
+            flag(row, "spike", value=round(float(ring_v[row, worst + 1]), 2),
+                 rate=round(float(rate[row, worst]), 2))
+
+        # drift: window means of paired sensors
+        with np.errstate(all="ignore"):
+            means = np.nanmean(masked, axis=1)
+        for pair in self.pairs:
+            a_sensor, b_sensor = pair["sensors"]
+            for row, (zone, metric, sensor) in enumerate(keys):
+                if metric != pair["metric"] or sensor != a_sensor:
+                    continue
+                other = index.get((zone, metric, b_sensor))
+                if other is None or np.isnan(means[row]) or np.isnan(means[other]):
+                    continue
+                diff = float(means[row] - means[other])
+                if abs(diff) > pair["max_diff"]:
+                    flag(row, "drift", against=b_sensor, diff=round(diff, 2))
+
+        self._flags = flags
+        for zone, items in flags.items():
+            print(f"[Anomaly] {zone}: " + ", ".join(f"{f['kind']} {f['metric']}/{f['sensor']}" for f in items))
+        return flags
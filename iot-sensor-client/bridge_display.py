@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+LAN-local latest values + e-ink display payloads served by the bridge.
+
+The bridge already sees every reading, so it keeps the latest sensor_node
+body per zone and the latest body per zigbee device. The MQTT thread only
+stores the forwarded bytes (no decode); they are decoded when a display
+asks, which is rare compared to the reading rate.
+
+GET /display/<zoneId> answers in the same shape as the portal's
+/api/sensor-data/display/:zoneId, so display_proxy.py can serve it to the
+ESPink display without the Railway round-trip. Sparklines, light-cycle hours
+and propagator day min/max come from the local time-series store
+(bridge_tsdb.py) when it is enabled. 404 when the zone has no data yet, so
+the proxy falls back to Railway.
+"""
+
+import json
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from bridge_routes import peek_string_field
+
+# Field names that mark a body as a real reading (not a state-only update)
+SENSOR_KEYS = (b'"temperatures"', b'"temperature"', b'"humidity"', b'"co2"', b'"light"')
+
+HIST_BUCKET_MS = 30 * 60 * 1000  # sparkline: 30-min buckets over 24 h
+LIGHT_DAY_LUX = 50               # same threshold as the portal
+
+
+def _r(value, digits=1):
+    return round(value, digits) if value is not None else None
+
+
+class LatestValues:
+    def __init__(self, tsdb=None, zone_names=None, offline_after=300):
+        self.tsdb = tsdb
+        self.zone_names = zone_names or {}
+        self.offline_after = offline_after
+        self._lock = threading.Lock()
+        self._sensors = {}  # zone → (body, received_at)
+        self._zigbee = {}   # zone → {device: (body, received_at)}
+
+    def update(self, body, received_at, zone=None):
+        """Called on the MQTT thread with the forwarded body bytes."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        zone = zone or peek_string_field(body, "zoneId")
+        if not zone:
+            return
+        device = peek_string_field(body, "zigbee_device")
+        with self._lock:
+            if device:
+                self._zigbee.setdefault(zone, {})[device] = (body, received_at)
+            elif any(key in body for key in SENSOR_KEYS):
+                self._sensors[zone] = (body, received_at)
+
+    def zones(self):
+        with self._lock:
+            return sorted(set(self._sensors) | set(self._zigbee))
+
+    def latest(self, zone):
+        """(reading dict, received_at, {device: (zigbee entry, received_at)})."""
+        with self._lock:
+            sensors = self._sensors.get(zone)
+            devices = dict(self._zigbee.get(zone) or {})
+        reading, received_at = (json.loads(sensors[0]), sensors[1]) if sensors else (None, None)
+        zigbee = {}
+        for device, (body, at) in devices.items():
+            entries = json.loads(body).get("zigbee_sensors") or [{}]
+            zigbee[device] = (entries[0], at)
+        return reading, received_at, zigbee
+
+    # ── Display payload ──
+    def display(self, zone):
+        reading, received_at, zigbee = self.latest(zone)
+        if reading is None and not zigbee:
+            return None
+        name = self.zone_names.get(zone, zone)
+        if reading is None:
+            return {"zone": name, "online": False, "propagators": self._propagators(zone, zigbee)}
+
+        temps = reading.get("temperatures") or []
+        sht45_t = next((t.get("value") for t in temps
+                        if t.get("sensorId") == "sht45" or "sht45" in (t.get("location") or "")), None)
+        air_t = sht45_t if sht45_t is not None else reading.get("temperature")
+        rh = reading.get("humidity_sht45")
+        if rh is None:
+            rh = reading.get("humidity")
+        vpd = None
+        if air_t is not None and rh is not None:
+            svp = 0.6108 * math.exp(17.27 * air_t / (air_t + 237.3))
+            vpd = round(max(0.0, svp * (1 - rh / 100)), 2)
+
+        payload = {
+            "zone": name,
+            "online": time.time() - received_at <= self.offline_after,
+            "ts": reading.get("timestamp")
+                  or datetime.fromtimestamp(received_at, timezone.utc).isoformat(),
+            "temps": [{"loc": t.get("location") or "", "v": _r(t.get("value"))}
+                      for t in temps if t.get("value") is not None],
+            "airT": _r(reading.get("temperature")),
+            "rh": _r(reading.get("humidity")),
+            "rh2": _r(reading.get("humidity_sht45")),
+            "co2": _r(reading.get("co2"), None),
+            "lux": _r(reading.get("light"), None),
+            "vpd": vpd,
+            "photo": None,
+            "hist": [],
+            "canopyHist": [],
+            "propagators": self._propagators(zone, zigbee),
+            "source": "bridge",
+        }
+        if self.tsdb:
+            since = int((time.time() - 24 * 3600) * 1000)
+            payload["photo"] = self._photo(zone, since)
+            payload["hist"] = self._hist(zone, since)
+            canopy = [t.get("sensorId") for t in temps if t.get("location") == "canopy"]
+            payload["canopyHist"] = self._canopy_hist(zone, since, set(canopy))
+        return payload
+
+    def _photo(self, zone, since):
+        rows = self.tsdb.minute_rows(zone, "light", since)
+        if not rows:
+            return None
+        day_h = round(sum(1 for r in rows if r[3] / r[2] > LIGHT_DAY_LUX) / len(rows) * 24, 1)
+        return {"day": day_h, "night": round(24 - day_h, 1)}
+
+    def _buckets(self, rows, sensors=None):
+        """Minute rollups → 30-min averages {bucket: avg}."""
+        acc = {}
+        for sensor, bucket, n, total, _lo, _hi in rows:
+            if sensors is not None and sensor not in sensors:
+                continue
+            b = acc.setdefault(bucket - bucket % HIST_BUCKET_MS, [0, 0.0])
+            b[0] += n
+            b[1] += total
+        return {bucket: total / n for bucket, (n, total) in acc.items()}
+
+    def _hist(self, zone, since):
+        t = self._buckets(self.tsdb.minute_rows(zone, "temperature", since), {"co2_sensor"})
+        humidity = self.tsdb.minute_rows(zone, "humidity", since)
+        rh = self._buckets(humidity, {"sht45"})
+        rh_fallback = self._buckets(humidity, {"co2_sensor"})
+        co2 = self._buckets(self.tsdb.minute_rows(zone, "co2", since))
+        out = []
+        for bucket in sorted(set(t) | set(rh) | set(rh_fallback) | set(co2)):
+            h = rh.get(bucket, rh_fallback.get(bucket))
+            out.append({
+                "t": _r(t.get(bucket)),
+                "rh": _r(h, None),
+                "co2": _r(co2.get(bucket), None),
+            })
+        return out
+
+    def _canopy_hist(self, zone, since, sensors):
+        if not sensors:
+            return []
+        ct = self._buckets(self.tsdb.minute_rows(zone, "temperature", since), sensors)
+        return [_r(ct[b]) for b in sorted(ct)]
+
+    def _propagators(self, zone, zigbee):
+        if not zigbee:
+            return []
+        stats = {}
+        if self.tsdb:
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            start_ms = int(start.timestamp() * 1000)
+            for metric in ("temperature", "humidity"):
+                for sensor, _b, _n, _s, lo, hi in self.tsdb.minute_rows(zone, metric, start_ms):
+                    cur = stats.setdefault((sensor, metric), [lo, hi])
+                    cur[0] = min(cur[0], lo)
+                    cur[1] = max(cur[1], hi)
+        out = []
+        for device, (d, _at) in sorted(zigbee.items()):
+            t = stats.get((f"zigbee-{device}", "temperature"), [None, None])
+            h = stats.get((f"zigbee-{device}", "humidity"), [None, None])
+            out.append({
+                "name": device,
+                "loc": d.get("location") or device,
+                "t": _r(d.get("temperature")),
+                "rh": _r(d.get("humidity")),
+                "bat": d.get("battery"),
+                "tMin": _r(t[0]), "tMax": _r(t[1]),
+                "rhMin": _r(h[0]), "rhMax": _r(h[1]),
+            })
+        return out
+
+    def http_handler(self, path, query):
+        """/display/<zoneId> (display payload) and /display (zones seen)."""
+        zone = path.rstrip("/")[len("/display"):].lstrip("/")
+        if not zone:
+            return 200, {"zones": self.zones()}
+        payload = self.display(zone)
+        if payload is None:
+            return 404, {"error": f"no data for {zone}"}
+        return 200, payload
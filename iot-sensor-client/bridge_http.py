@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Small LAN HTTP server embedded in the MQTT-to-API bridge.
+
+Handlers are registered per path prefix and return (status, payload);
+dict/list payloads are sent as JSON. Runs in its own daemon threads
+(ThreadingHTTPServer), never on the MQTT loop or the lane sender.
+"""
+
+import http.server
+import json
+import threading
+import urllib.parse
+
+
+class BridgeHttpServer:
+    def __init__(self, host="0.0.0.0", port=8095):
+        self.host = host
+        self.port = port
+        self._routes = []  # [(prefix, fn(path, query) -> (status, payload))]
+        self._server = None
+
+    def add(self, prefix, handler):
+        self._routes.append((prefix, handler))
+        # Longest prefix wins
+        self._routes.sort(key=lambda r: len(r[0]), reverse=True)
+
+    def start(self):
+        routes = self._routes
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                for prefix, fn in routes:
+                    if parsed.path == prefix or parsed.path.startswith(prefix.rstrip("/") + "/"):
+                        try:
+                            status, payload = fn(parsed.path, query)
+                        except Exception as e:
+                            status, payload = 500, {"error": str(e)}
+                        self._send(status, payload)
+                        return
+                self._send(404, {"error": "not found"})
+
+            def _send(self, status, payload):
+                if isinstance(payload, (dict, list)):
+                    data = json.dumps(payload).encode("utf-8")
+                    ctype = "application/json"
+                elif isinstance(payload, bytes):
+                    data, ctype = payload, "application/json"
+                else:
+                    data, ctype = str(payload).encode("utf-8"), "text/plain; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # polled often; keep the journal quiet
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="bridge-http", daemon=True).start()
+        print(f"[HTTP] Listening on {self.host}:{self.port} ({', '.join(p for p, _ in routes)})")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Priority lanes for the MQTT-to-API bridge.
+
+One sender thread drains three lanes in strict priority order:
+    status   zone online/offline — coalesced per zone (latest wins); alert
+             events, one entry each
+    live     fresh readings — bounded FIFO
+    backlog  rows replayed from the SQLite retry buffer, a small batch at a
+             time, re-checking the higher lanes before every row
+
+Memory is bounded: when the live lane is full the oldest item is spilled to
+the SQLite buffer (routes with buffer: false are dropped instead). While the
+API is unreachable, live items (and status items with buffer: true, such as
+alert events) go straight to SQLite and the lane only
+probes again after `retry_interval`, so a dead uplink never stacks up
+10-second HTTP timeouts in front of the dashboard data.
+
+The MQTT thread only calls submit() — no HTTP on the network loop.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+LANE_STATUS = "status"
+LANE_LIVE = "live"
+
+DEFAULT_LIMITS = {
+    "status_max": 64,       # distinct zones with a pending status
+    "live_max": 256,        # readings waiting in memory
+    "backlog_batch": 20,    # rows peeked from SQLite per replay step
+    "backlog_pace_ms": 50,  # pause between replayed rows (yields to live)
+    "retry_interval": 30,   # seconds to wait after the API failed
+}
+
+
+class Item:
+    """A body ready to POST, with its route, log strings and latency traces
+    [(zone, sensor_ts, received_at), ...] (see bridge_metrics)."""
+
+    __slots__ = ("route", "body", "label", "summary", "traces")
+
+    def __init__(self, route, body, label, summary, traces=()):
+        self.route = route
+        self.body = body
+        self.label = label
+        self.summary = summary
+        self.traces = traces
+
+
+class PriorityLanes:
+    def __init__(self, post, buffer, limits=None, on_ack=None, on_replay=None):
+        """
+        Args:
+            post:      fn(endpoint, body) -> (status, response_body)
+            buffer:    ApiRetryBuffer used for spill + backlog replay
+            limits:    overrides for DEFAULT_LIMITS (bridge_config.yaml → lanes)
+            on_ack:    fn(item) after a live item was acknowledged
+            on_replay: fn(payload_json, created_at) after a buffered row was
+                       acknowledged
+        """
+        self._post = post
+        self._buffer = buffer
+        self._on_ack = on_ack
+        self._on_replay = on_replay
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._cond = threading.Condition()
+        self._status = OrderedDict()  # coalesce key → Item
+        self._live = deque()
+        self._backlog_hint = buffer.size() > 0
+        self._down_until = 0.0
+        self._running = False
+        self._thread = None
+        self.counters = {"sent": 0, "replayed": 0, "spilled": 0, "dropped": 0, "failed": 0}
+
+    # ── Producer side (MQTT thread) ──
+    def submit(self, item):
+        if item.route.lane == LANE_STATUS:
+            self._submit_status(item)
+        else:
+            self._submit_live(item)
+
+    def _submit_status(self, item):
+        spill = []
+        with self._cond:
+            if item.route.buffer and self._is_down():
+                spill.append(item)
+            else:
+                self._status.pop(item.label, None)
+                self._status[item.label] = item
+                while len(self._status) > self.limits["status_max"]:
+                    spill.append(self._status.popitem(last=False)[1])
+                self._cond.notify()
+        # Buffered status items (alerts) go to SQLite, the rest are dropped
+        for overflow in spill:
+            self._spill(overflow)
+
+    def _submit_live(self, item):
+        spill = None
+        with self._cond:
+            if self._is_down():
+                spill = item
+            else:
+                self._live.append(item)
+                if len(self._live) > self.limits["live_max"]:
+                    spill = self._live.popleft()
+                self._cond.notify()
+        if spill is not None:
+            self._spill(spill)
+
+    def _spill(self, item):
+        """Move an item to SQLite instead of holding it in memory."""
+        if not item.route.buffer:
+            self.counters["dropped"] += 1
+            return
+        size = self._buffer.push(item.route.endpoint, item.body.decode("utf-8"))
+        self.counters["spilled"] += 1
+        self._backlog_hint = True
+        print(f"[{item.label}] {item.summary} -> BUFFERED ({size} pending)")
+
+    # ── Consumer side (sender thread) ──
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="bridge-lanes", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=15):
+        """Stop the sender and move whatever is still in memory to SQLite."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout)
+        with self._cond:
+            leftovers = list(self._status.values()) + list(self._live)
+            self._live.clear()
+            self._status.clear()
+        for item in leftovers:
+            self._spill(item)
+
+    def depths(self):
+        with self._cond:
+            return {"status": len(self._status), "live": len(self._live)}
+
+    def _is_down(self):
+        return time.time() < self._down_until
+
+    def _mark_down(self):
+        self._down_until = time.time() + self.limits["retry_interval"]
+
+    def _next(self):
+        """Pop the highest-priority item, or None. Caller holds the lock."""
+        if self._status:
+            return self._status.popitem(last=False)[1]
+        if self._live:
+            return self._live.popleft()
+        return None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._is_down():
+                        self._cond.wait(self._down_until - time.time())
+                        continue
+                    if self._status or self._live or self._backlog_hint:
+                        break
+                    self._cond.wait(1.0)
+                if not self._running:
+                    return
+                item = self._next()
+            if item is not None:
+                self._deliver(item)
+            else:
+                self._replay_backlog()
+
+    def _deliver(self, item):
+        status, _ = self._post(item.route.endpoint, item.body)
+        if 200 <= status < 300:
+            self.counters["sent"] += 1
+            if self._on_ack:
+                self._on_ack(item)
+            print(f"[{item.label}] {item.summary} -> {status}")
+            return
+        if 400 <= status < 500:
+            # Bad data — retrying won't help
+            self.counters["failed"] += 1
+            print(f"[{item.label}] {item.summary} -> failed ({status})")
+            return
+        # Network error / 5xx: back off, keep the data
+        self._mark_down()
+        if item.route.buffer:
+            self._spill(item)
+        elif item.route.lane == LANE_STATUS:
+            with self._cond:
+                # Re-queue unless a newer status for the same zone arrived
+                self._status.setdefault(item.label, item)
+            print(f"[{item.label}] {item.summary} -> failed ({status}), will retry")
+        else:
+            self.counters["failed"] += 1
+            print(f"[{item.label}] {item.summary} -> failed ({status})")
+
+    def _has_priority_work(self):
+        with self._cond:
+            return bool(self._status or self._live)
+
+    def _replay_backlog(self):
+        """Replay one batch from SQLite, yielding as soon as live work shows up."""
+        batch = self._buffer.peek_batch(self.limits["backlog_batch"])
+        if not batch:
+            self._backlog_hint = False
+            return
+        done_ids = []
+        pace = self.limits["backlog_pace_ms"] / 1000.0
+        for row_id, endpoint, payload_json, created_at in batch:
+            if self._has_priority_work():
+                break
+            status, _ = self._post(endpoint, payload_json)
+            if 200 <= status < 300:
+                done_ids.append(row_id)
+                self.counters["replayed"] += 1
+                if self._on_replay:
+                    self._on_replay(payload_json, created_at)
+            elif 400 <= status < 500:
+                # Client error (bad data) — discard, won't succeed on retry
+                done_ids.append(row_id)
+                print(f"[Buffer] Discarded bad request ({status}): {payload_json[:80]}")
+            else:
+                # Server error or network error — stop retrying for now
+                self._mark_down()
+                break
+            with self._cond:
+                if pace and not (self._status or self._live):
+                    self._cond.wait(pace)
+        self._buffer.remove_batch(done_ids)
+        if done_ids:
+            print(f"[Buffer] Replayed {len(done_ids)} buffered call(s), {self._buffer.size()} remaining")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Pipeline latency metrics for the MQTT-to-API bridge.
+
+Per zone, fixed-bucket histograms (cheap to update, mergeable, no sample
+storage) for each stage of a reading's trip:
+
+    sensor_to_bridge   sensor `timestamp` → bridge received it (incl. broker)
+    bridge_to_ack      bridge received → API acknowledged (live lanes)
+    buffer_dwell       written to ApiRetryBuffer → acknowledged on replay
+    end_to_end         sensor `timestamp` → API acknowledged (any path)
+
+Readings without a timestamp (zigbee) only feed the bridge-side stages.
+Negative spans (clock skew between Pi Zero and master) are clamped to 0.
+
+Histograms are windowed: every `interval` seconds the window is summarised
+(count, mean, p50/p90/p99, max per stage), published on MQTT and kept as
+`last` for the HTTP /metrics endpoint, then reset.
+"""
+
+import bisect
+import json
+import threading
+import time
+from datetime import datetime
+
+# Bucket upper bounds in milliseconds (last bucket = +inf)
+BUCKETS_MS = [
+    5, 10, 25, 50, 100, 250, 500,
+    1000, 2500, 5000, 10000, 30000, 60000,
+    300000, 900000, 3600000, 6 * 3600000,
+]
+
+STAGES = ("sensor_to_bridge", "bridge_to_ack", "buffer_dwell", "end_to_end")
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        if ms < 0:
+            ms = 0.0
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-quantile (capped at max)."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                bound = BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max
+                return round(min(bound, self.max), 1)
+        return round(self.max, 1)
+
+    def summary(self):
+        if not self.total:
+            return {"count": 0}
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 1),
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+            "max": round(self.max, 1),
+        }
+
+
+def parse_sensor_ts(value):
+    """ISO-8601 timestamp from sensor_node → epoch seconds, or None."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (ValueError, AttributeError):
+        return None
+
+
+class PipelineMetrics:
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._zones = {}  # zone → {stage: Histogram}
+        self._window_start = time.time()
+        self.last = None  # last published window summary
+
+    def _hist(self, zone, stage):
+        per_zone = self._zones.get(zone)
+        if per_zone is None:
+            per_zone = self._zones[zone] = {s: Histogram() for s in STAGES}
+        return per_zone[stage]
+
+    def received(self, zone, sensor_ts, received_at):
+        if sensor_ts is None:
+            return
+        with self._lock:
+            self._hist(zone, "sensor_to_bridge").observe((received_at - sensor_ts) * 1000)
+
+    def acked(self, traces, acked_at=None):
+        """Live item acknowledged. traces: [(zone, sensor_ts, received_at), ...]"""
+        acked_at = acked_at or time.time()
+        with self._lock:
+            for zone, sensor_ts, received_at in traces:
+                self._hist(zone, "bridge_to_ack").observe((acked_at - received_at) * 1000)
+                if sensor_ts is not None:
+                    self._hist(zone, "end_to_end").observe((acked_at - sensor_ts) * 1000)
+
+    def replayed(self, zone, sensor_ts, buffered_at, acked_at=None):
+        """Buffered row acknowledged on replay."""
+        acked_at = acked_at or time.time()
+        with self._lock:
+            self._hist(zone, "buffer_dwell").observe((acked_at - buffered_at) * 1000)
+            if sensor_ts is not None:
+                self._hist(zone, "end_to_end").observe((acked_at - sensor_ts) * 1000)
+
+    def snapshot(self, reset=False):
+        """Summary of the current window; reset=True starts a new window."""
+        now = time.time()
+        with self._lock:
+            zones = {
+                zone: {stage: h.summary() for stage, h in stages.items() if h.total}
+                for zone, stages in self._zones.items()
+            }
+            summary = {
+                "windowStart": round(self._window_start, 3),
+                "windowEnd": round(now, 3),
+                "zones": zones,
+            }
+            if reset:
+                self._zones = {}
+                self._window_start = now
+                self.last = summary
+        return summary
+
+    def due(self, now=None):
+        return (now or time.time()) - self._window_start >= self.interval
+
+
+def publish_summary(client, topic, summary):
+    """Publish a window summary on the MQTT stats topic (retained)."""
+    client.publish(topic, json.dumps(summary), qos=0, retain=True)
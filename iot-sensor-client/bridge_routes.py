@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Declarative topic routing for the MQTT-to-API bridge.
+
+Routes come from the `routes:` section of bridge_config.yaml and are compiled
+once at startup into a matcher indexed by the first topic level, plus a small
+per-topic cache (the set of live topics on the farm is tiny and stable).
+
+Route fields:
+    name       label for logs
+    topic      MQTT pattern. {name} captures one level, + matches one level
+               without capturing, # matches the rest (last level only)
+    transform  passthrough | zigbee (see TRANSFORMS)
+    inject     fields patched into the JSON body; "{name}" = topic capture
+    endpoint   API path to POST to
+    lane       status | live (default) — delivery priority, see bridge_lanes.py
+    shared     false → subscribe without $share/ even when the bridge runs
+               in a shared-subscription group (default true)
+    buffer     true → failed POSTs go to the SQLite retry buffer
+    batch      {max_items, linger_ms} — coalesce bodies into one JSON array
+               POST (only for endpoints that accept arrays)
+
+Pass-through bodies are patched as bytes: injected fields are appended before
+the closing brace. JSON.parse keeps the last duplicate key, so injected
+values override whatever the sensor node sent, same as the old
+decode → assign → encode path, without the round trip.
+"""
+
+import json
+import threading
+import time
+
+MATCH_CACHE_SIZE = 1024
+
+# Used when bridge_config.yaml has no `routes:` section — same behaviour as
+# the hand-written on_message handler this module replaced.
+DEFAULT_ROUTES = [
+    {
+        "name": "zone-sensors",
+        "topic": "grow/zone/{zone_id}/sensors",
+        "transform": "passthrough",
+        "inject": {"zoneId": "{zone_id}"},
+        "endpoint": "/api/sensor-data",
+        "buffer": True,
+    },
+    {
+        "name": "zone-status",
+        "topic": "grow/zone/{zone_id}/status",
+        "transform": "passthrough",
+        "inject": {"zoneId": "{zone_id}"},
+        "endpoint": "/api/sensor-data/status",
+        "lane": "status",
+        "buffer": False,
+    },
+    {
+        "name": "zigbee",
+        "topic": "zigbee2mqtt/{device}",
+        "transform": "zigbee",
+        "endpoint": "/api/sensor-data",
+        "buffer": True,
+    },
+]
+
+
+class Message:
+    """One incoming MQTT message. JSON is decoded lazily and at most once."""
+
+    __slots__ = ("topic", "raw", "captures", "_data")
+
+    def __init__(self, topic, raw, captures):
+        self.topic = topic
+        self.raw = raw
+        self.captures = captures
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.raw)
+        return self._data
+
+
+def patch_json_object(raw, fields):
+    """Append pre-encoded `"key": value` pairs (bytes) to a JSON object.
+    Returns None if `raw` does not look like a JSON object."""
+    body = raw.strip()
+    if not body.startswith(b"{") or not body.endswith(b"}"):
+        return None
+    head = body[:-1].rstrip()
+    if head == b"{":
+        return head + fields + b"}"
+    return head + b", " + fields + b"}"
+
+
+def peek_string_field(raw, key):
+    """Value of the last `"key": "string"` pair in raw JSON, without decoding.
+    Good enough for the flat top-level fields we stamp ourselves (zoneId,
+    timestamp); the last occurrence matches JSON.parse's duplicate-key rule."""
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    needle = b'"' + key.encode("ascii") + b'"'
+    i = raw.rfind(needle)
+    if i < 0:
+        return None
+    start = raw.find(b'"', i + len(needle))
+    if start < 0 or raw[i + len(needle):start].strip() != b":":
+        return None
+    end = raw.find(b'"', start + 1)
+    if end < 0:
+        return None
+    return raw[start + 1:end].decode("utf-8", errors="replace")
+
+
+# ── Transforms ──
+# A transform factory takes (route spec, full config) and returns
+# fn(route, msg) -> (body_bytes, label, summary) or None to drop the message.
+
+def _passthrough(spec, config):
+    inject = spec.get("inject") or {}
+    # Pre-encode the constant parts; only capture substitutions vary per call.
+    templates = [(json.dumps(k), v) for k, v in inject.items()]
+    encoded = {}  # captures tuple → encoded fields bytes
+
+    def encode_fields(captures):
+        key = tuple(sorted(captures.items()))
+        fields = encoded.get(key)
+        if fields is None:
+            parts = []
+            for k, v in templates:
+                if isinstance(v, str):
+                    v = v.format(**captures)
+                parts.append(f"{k}: {json.dumps(v)}")
+            fields = ", ".join(parts).encode("utf-8")
+            encoded[key] = fields
+        return fields
+
+    def transform(route, msg):
+        label = msg.captures.get("zone_id") or msg.captures.get("device") or route.name
+        if not templates:
+            return msg.raw, label, f"{route.name} {len(msg.raw)}B"
+        body = patch_json_object(msg.raw, encode_fields(msg.captures))
+        if body is None:
+            # Outer braces missing (array, scalar, trailing garbage) — fall back
+            # to a real decode; non-objects and undecodable JSON stop here.
+            # Brace-wrapped bodies are NOT validated on the fast path: a broken
+            # one (`{"a": }`) is forwarded as-is, the API answers 400 and the
+            # lane counts it as failed without retrying.
+            data = msg.data
+            if not isinstance(data, dict):
+                return None
+            data.update({json.loads(k): (v.format(**msg.captures) if isinstance(v, str) else v)
+                         for k, v in templates})
+            body = json.dumps(data).encode("utf-8")
+        return body, label, f"{route.name} {len(body)}B"
+
+    return transform
+
+
+def _zigbee(spec, config):
+    # friendly_name → {zone_id, location}, resolved once instead of per message
+    devices = {}
+    for name, cfg in (config.get("zigbee_sensors") or {}).items():
+        devices[name] = (cfg["zone_id"], cfg.get("location", name))
+
+    def transform(route, msg):
+        device_name = msg.captures.get("device", "")
+        target = devices.get(device_name)
+        if target is None:
+            return None  # bridge/system topic or unknown device
+        zone_id, location = target
+        payload = msg.data
+        temp = payload.get("temperature")
+        humidity = payload.get("humidity")
+        battery = payload.get("battery")
+        if temp is None and humidity is None:
+            return None  # no sensor data (e.g. just linkquality)
+
+        reading = {
+            "zoneId": zone_id,
+            "source": "zigbee",
+            "zigbee_device": device_name,
+            "zigbee_sensors": [{
+                "device": device_name,
+                "location": location,
+                "temperature": temp,
+                "humidity": humidity,
+                "battery": battery,
+            }]
+        }
+        parts = []
+        if temp is not None:
+            parts.append(f"T={temp}°C")
+        if humidity is not None:
+            parts.append(f"RH={humidity}%")
+        if battery is not None:
+            parts.append(f"bat={battery}%")
+        return json.dumps(reading).encode("utf-8"), f"zigbee:{device_name}", " ".join(parts)
+
+    return transform
+
+
+TRANSFORMS = {
+    "passthrough": _passthrough,
+    "zigbee": _zigbee,
+}
+
+
+class Route:
+    """Compiled route: topic levels + transform + delivery policy."""
+
+    def __init__(self, spec, config):
+        self.name = spec.get("name") or spec["topic"]
+        self.pattern = spec["topic"]
+        self.endpoint = spec["endpoint"]
+        self.buffer = bool(spec.get("buffer", True))
+        self.shared = bool(spec.get("shared", True))
+        self.lane = spec.get("lane", "live")
+        if self.lane not in ("status", "live"):
+            raise ValueError(f"route {self.name}: unknown lane '{self.lane}'")
+        # Readings go to the local time-series store (bridge_tsdb.py)
+        self.store = bool(spec.get("store", self.lane == "live"))
+        batch = spec.get("batch") or {}
+        self.batch_max = int(batch.get("max_items", 1))
+        self.batch_linger = float(batch.get("linger_ms", 0)) / 1000.0
+
+        kind = spec.get("transform", "passthrough")
+        if kind not in TRANSFORMS:
+            raise ValueError(f"route {self.name}: unknown transform '{kind}'")
+        self.transform = TRANSFORMS[kind](spec, config)
+
+        # levels: list of (literal or None, capture name or None); tail: '#' present
+        self.levels = []
+        self.tail = False
+        filter_levels = []
+        raw_levels = self.pattern.split("/")
+        for i, level in enumerate(raw_levels):
+            if level == "#":
+                if i != len(raw_levels) - 1:
+                    raise ValueError(f"route {self.name}: '#' must be the last level")
+                self.tail = True
+                filter_levels.append("#")
+            elif level == "+":
+                self.levels.append((None, None))
+                filter_levels.append("+")
+            elif level.startswith("{") and level.endswith("}"):
+                self.levels.append((None, level[1:-1]))
+                filter_levels.append("+")
+            else:
+                self.levels.append((level, None))
+                filter_levels.append(level)
+        self.filter = "/".join(filter_levels)
+        self.root = self.levels[0][0] if self.levels else None
+
+    def match(self, parts):
+        """Return captures dict if topic levels match, else None."""
+        n = len(self.levels)
+        if len(parts) < n or (len(parts) > n and not self.tail):
+            return None
+        captures = {}
+        for (literal, name), part in zip(self.levels, parts):
+            if literal is not None:
+                if part != literal:
+                    return None
+            elif name is not None:
+                if not part:
+                    return None
+                captures[name] = part
+        return captures
+
+
+class Router:
+    """Routes indexed by first topic level; per-topic match results cached."""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self._by_root = {}
+        self._wild = []  # routes whose first level is a wildcard
+        for route in routes:
+            if route.root is None:
+                self._wild.append(route)
+            else:
+                self._by_root.setdefault(route.root, []).append(route)
+        self._cache = {}
+
+    def match(self, topic):
+        """Return (route, captures) for the first matching route, or None."""
+        try:
+            return self._cache[topic]
+        except KeyError:
+            pass
+        parts = topic.split("/")
+        result = None
+        for route in self._by_root.get(parts[0], ()):
+            captures = route.match(parts)
+            if captures is not None:
+                result = (route, captures)
+                break
+        if result is None:
+            for route in self._wild:
+                captures = route.match(parts)
+                if captures is not None:
+                    result = (route, captures)
+                    break
+        if len(self._cache) >= MATCH_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[topic] = result
+        return result
+
+    def subscriptions(self, shared_group=None):
+        """Unique MQTT subscription filters covering all routes. With a
+        shared group, filters become $share/<group>/<filter> so the broker
+        hands each message to exactly one bridge instance in the group."""
+        seen = []
+        for route in self.routes:
+            topic_filter = route.filter
+            if shared_group and route.shared:
+                topic_filter = f"$share/{shared_group}/{topic_filter}"
+            if topic_filter not in seen:
+                seen.append(topic_filter)
+        return seen
+
+
+def compile_routes(config):
+    """Build a Router from config['routes'] (or DEFAULT_ROUTES)."""
+    specs = config.get("routes") or DEFAULT_ROUTES
+    return Router([Route(spec, config) for spec in specs])
+
+
+def join_batch(bodies):
+    """Encode several JSON bodies as one JSON array without decoding them."""
+    if len(bodies) == 1:
+        return bodies[0]
+    return b"[" + b",".join(bodies) + b"]"
+
+
+class RouteBatcher:
+    """Collects bodies for routes with a batch policy until max_items or
+    linger_ms is reached. Thread-safe: fed from the MQTT network thread,
+    drained from the main loop. Batches are (route, bodies, traces)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # route name → (route, first_added, [bodies], [traces])
+
+    def add(self, route, body, trace=None):
+        """Queue a body. Returns a full batch or None."""
+        with self._lock:
+            entry = self._pending.get(route.name)
+            if entry is None:
+                entry = (route, time.time(), [], [])
+                self._pending[route.name] = entry
+            entry[2].append(body)
+            if trace is not None:
+                entry[3].append(trace)
+            if len(entry[2]) >= route.batch_max:
+                del self._pending[route.name]
+                return route, entry[2], entry[3]
+        return None
+
+    def due(self, now=None):
+        """Pop batches whose linger time has expired."""
+        now = now or time.time()
+        ready = []
+        with self._lock:
+            for name, (route, first_added, bodies, traces) in list(self._pending.items()):
+                if now - first_added >= route.batch_linger:
+                    del self._pending[name]
+                    ready.append((route, bodies, traces))
+        return ready
+
+    def drain(self):
+        """Pop everything (shutdown)."""
+        with self._lock:
+            ready = [(route, bodies, traces) for route, _, bodies, traces in self._pending.values()]
+            self._pending.clear()
+        return ready
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Local full-resolution time-series store on the master Pi.
+
+Every reading the bridge forwards is also written here, so history charts
+can be served on the LAN and survive a Railway outage.
+
+Layout (SQLite, WAL):
+    series                  id ↔ (zone, metric, sensor), interned once
+    raw_YYYYMMDD            (series, ts_ms, value) — one table per UTC day,
+                            WITHOUT ROWID, PK (series, ts_ms); old days are
+                            dropped as whole tables (no slow DELETEs)
+    rollup_1m / rollup_1h   (series, bucket, n, sum, min, max), upserted in
+                            the same transaction as the raw rows
+
+Writes happen on a dedicated thread: the MQTT thread only enqueues the
+forwarded body bytes (bounded queue, dropped + counted when full), and the
+writer decodes and commits in batches to spare the SD card.
+
+Queries pick a resolution from the range (raw ≤ 6 h, 1-minute ≤ 7 days,
+otherwise 1-hour) unless one is requested, and read on a fresh connection
+per call so the HTTP threads never contend with the writer.
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bridge_metrics import parse_sensor_ts
+
+RESOLUTIONS = {"1m": 60_000, "1h": 3_600_000}
+AUTO_RAW_MAX_MS = 6 * 3600 * 1000
+AUTO_1M_MAX_MS = 7 * 86400 * 1000
+
+# Top-level sensor_node fields → (metric, sensor)
+SCALAR_FIELDS = {
+    "temperature": ("temperature", "co2_sensor"),
+    "humidity": ("humidity", "co2_sensor"),
+    "co2": ("co2", "co2_sensor"),
+    "humidity_sht45": ("humidity", "sht45"),
+    "light": ("light", "bh1750"),
+    "pi_temp": ("pi_temp", "pi"),
+    "pi_load": ("pi_load", "pi"),
+}
+
+
+def flatten_reading(data):
+    """Sensor or zigbee reading → [(metric, sensor, value), ...].
+    Sensor ids follow the portal's naming (DS18B20 id / 'sht45',
+    'zigbee-<device>') so local and Railway series line up."""
+    out = []
+    for t in data.get("temperatures") or []:
+        value = t.get("value")
+        if value is not None:
+            out.append(("temperature", t.get("sensorId") or t.get("location") or "unknown", value))
+    for field, (metric, sensor) in SCALAR_FIELDS.items():
+        value = data.get(field)
+        if value is not None:
+            out.append((metric, sensor, value))
+    for zs in data.get("zigbee_sensors") or []:
+        sensor = f"zigbee-{zs.get('device')}"
+        for metric in ("temperature", "humidity", "battery"):
+            value = zs.get(metric)
+            if value is not None:
+                out.append((metric, sensor, value))
+    return out
+
+
+def _day_table(ts_ms):
+    return "raw_" + datetime.fromtimestamp(ts_ms / 1000, timezone.utc).strftime("%Y%m%d")
+
+
+def _parse_time(value, default):
+    """Query param → epoch ms. Accepts epoch seconds/ms or ISO-8601."""
+    if value is None or value == "":
+        return default
+    try:
+        num = float(value)
+        return int(num if num > 1e12 else num * 1000)
+    except ValueError:
+        ts = parse_sensor_ts(value)
+        if ts is None:
+            raise ValueError(f"bad time: {value}")
+        return int(ts * 1000)
+
+
+class TimeSeriesStore:
+    def __init__(self, db_path, raw_days=14, minute_days=90, queue_max=5000):
+        self.db_path = str(db_path)
+        self.raw_days = raw_days
+        self.minute_days = minute_days
+        self._queue = queue.Queue(maxsize=queue_max)
+        self._series = {}  # (zone, metric, sensor) → id (writer thread only)
+        self._tables = set()
+        self._thread = None
+        self.counters = {"written": 0, "dropped": 0, "skipped": 0, "errors": 0}
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS series (
+                id INTEGER PRIMARY KEY,
+                zone TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                sensor TEXT NOT NULL,
+                UNIQUE (zone, metric, sensor)
+            );
+            CREATE TABLE IF NOT EXISTS rollup_1m (
+                series INTEGER NOT NULL, bucket INTEGER NOT NULL,
+                n INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL,
+                PRIMARY KEY (series, bucket)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS rollup_1h (
+                series INTEGER NOT NULL, bucket INTEGER NOT NULL,
+                n INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL,
+                PRIMARY KEY (series, bucket)
+            ) WITHOUT ROWID;
+        """)
+        conn.commit()
+        conn.close()
+
+    # ── Write path ──
+    def submit(self, body, received_at):
+        """Queue a forwarded body (bytes, object or array) for storage."""
+        try:
+            self._queue.put_nowait((body, received_at))
+        except queue.Full:
+            self.counters["dropped"] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="bridge-tsdb", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10):
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _load_caches(self, conn):
+        """Series ids and day tables as committed in the database."""
+        self._series = {(zone, metric, sensor): sid for sid, zone, metric, sensor in
+                        conn.execute("SELECT id, zone, metric, sensor FROM series")}
+        self._tables = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'raw_%'")}
+
+    def _rollback(self, conn):
+        # The rollback also undoes new day tables / series rows — the caches
+        # must not keep pointing at them
+        try:
+            conn.rollback()
+            self._load_caches(conn)
+        except sqlite3.Error as e:
+            print(f"[TSDB] Rollback error: {e}")
+
+    def _run(self):
+        conn = self._connect()
+        self._load_caches(conn)
+        last_prune = 0
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            deadline = time.time() + 1.0
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= 500:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+            if item is None:
+                stopping = True
+            # Nothing may escape: a dead writer thread silently stops all storage
+            if batch:
+                try:
+                    self._write(conn, batch)
+                except Exception as e:
+                    self._rollback(conn)
+                    self.counters["errors"] += 1
+                    print(f"[TSDB] Write error: {e}")
+            if time.time() - last_prune > 3600:
+                try:
+                    self._prune(conn)
+                except Exception as e:
+                    self._rollback(conn)
+                    self.counters["errors"] += 1
+                    print(f"[TSDB] Prune error: {e}")
+                last_prune = time.time()
+        conn.close()
+
+    def _series_id(self, conn, zone, metric, sensor):
+        key = (zone, metric, sensor)
+        sid = self._series.get(key)
+        if sid is None:
+            conn.execute("INSERT OR IGNORE INTO series (zone, metric, sensor) VALUES (?, ?, ?)", key)
+            sid = conn.execute("SELECT id FROM series WHERE zone=? AND metric=? AND sensor=?",
+                               key).fetchone()[0]
+            self._series[key] = sid
+        return sid
+
+    @staticmethod
+    def _points(body, received_at):
+        """Body → [(zone, ts_ms, metric, sensor, value)]. Raises on a malformed body."""
+        data = json.loads(body)
+        points = []
+        for reading in data if isinstance(data, list) else [data]:
+            zone = reading.get("zoneId")
+            if not zone:
+                continue
+            ts = parse_sensor_ts(reading.get("timestamp")) or received_at
+            ts_ms = int(ts * 1000)
+            for metric, sensor, value in flatten_reading(reading):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    continue
+                points.append((zone, ts_ms, metric, sensor, value))
+        return points
+
+    def _write(self, conn, batch):
+        raw_rows = {}  # table → [(series, ts_ms, value)]
+        for body, received_at in batch:
+            # One odd body (e.g. "temperatures": [5]) is skipped, not the whole batch
+            try:
+                points = self._points(body, received_at)
+            except Exception:
+                self.counters["skipped"] += 1
+                continue
+            for zone, ts_ms, metric, sensor, value in points:
+                raw_rows.setdefault(_day_table(ts_ms), []).append(
+                    (self._series_id(conn, zone, metric, sensor), ts_ms, value))
+
+        written = 0
+        for table, rows in raw_rows.items():
+            if table not in self._tables:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        series INTEGER NOT NULL, ts INTEGER NOT NULL, value REAL NOT NULL,
+                        PRIMARY KEY (series, ts)
+                    ) WITHOUT ROWID""")
+                self._tables.add(table)
+            # A repeated (series, ts) keeps the first value and is not rolled up twice
+            inserted = [row for row in rows if conn.execute(
+                f"INSERT OR IGNORE INTO {table} (series, ts, value) VALUES (?, ?, ?)", row).rowcount == 1]
+            for rollup, width in RESOLUTIONS.items():
+                conn.executemany(f"""
+                    INSERT INTO rollup_{rollup} (series, bucket, n, sum, min, max)
+                    VALUES (?, ?, 1, ?, ?, ?)
+                    ON CONFLICT (series, bucket) DO UPDATE SET
+                        n = n + 1, sum = sum + excluded.sum,
+                        min = MIN(min, excluded.min), max = MAX(max, excluded.max)
+                """, [(sid, ts_ms - ts_ms % width, v, v, v) for sid, ts_ms, v in inserted])
+            written += len(inserted)
+        conn.commit()
+        self.counters["written"] += written
+
+    def _prune(self, conn):
+        now_ms = int(time.time() * 1000)
+        cutoff = _day_table(now_ms - self.raw_days * 86400 * 1000)
+        for table in sorted(self._tables):
+            if table < cutoff:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+                self._tables.discard(table)
+                print(f"[TSDB] Dropped partition {table}")
+        conn.execute("DELETE FROM rollup_1m WHERE bucket < ?",
+                     (now_ms - self.minute_days * 86400 * 1000,))
+        conn.commit()
+
+    # ── Read path ──
+    def query(self, zone, metric, start_ms, end_ms, resolution="auto", sensor=None):
+        """Range query. Returns {resolution, series: [{sensor, points}]}.
+        Raw points are [ts_ms, value]; rollups are [bucket_ms, avg, min, max]."""
+        if resolution == "auto":
+            span = end_ms - start_ms
+            resolution = "raw" if span <= AUTO_RAW_MAX_MS else ("1m" if span <= AUTO_1M_MAX_MS else "1h")
+        if resolution not in ("raw",) + tuple(RESOLUTIONS):
+            raise ValueError(f"bad resolution: {resolution}")
+
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            sql = "SELECT id, sensor FROM series WHERE zone = ? AND metric = ?"
+            args = [zone, metric]
+            if sensor:
+                sql += " AND sensor = ?"
+                args.append(sensor)
+            series = conn.execute(sql, args).fetchall()
+            result = []
+            for sid, sensor_name in series:
+                if resolution == "raw":
+                    points = []
+                    day = datetime.fromtimestamp(start_ms / 1000, timezone.utc).date()
+                    last_day = datetime.fromtimestamp(end_ms / 1000, timezone.utc).date()
+                    while day <= last_day:
+                        table = "raw_" + day.strftime("%Y%m%d")
+                        try:
+                            points += conn.execute(
+                                f"SELECT ts, value FROM {table} WHERE series = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+                                (sid, start_ms, end_ms)).fetchall()
+                        except sqlite3.OperationalError:
+                            pass  # no partition for that day
+                        day += timedelta(days=1)
+                else:
+                    points = [
+                        (bucket, round(total / n, 3), lo, hi)
+                        for bucket, n, total, lo, hi in conn.execute(
+                            f"SELECT bucket, n, sum, min, max FROM rollup_{resolution} "
+                            f"WHERE series = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+                            (sid, start_ms - start_ms % RESOLUTIONS[resolution], end_ms))
+                    ]
+                if points:
+                    result.append({"sensor": sensor_name, "points": [list(p) for p in points]})
+            return {"zone": zone, "metric": metric, "resolution": resolution,
+                    "from": start_ms, "to": end_ms, "series": result}
+        finally:
+            conn.close()
+
+    def minute_rows(self, zone, metric, start_ms, end_ms=None):
+        """1-minute rollup rows for a zone/metric: [(sensor, bucket, n, sum, min, max)]."""
+        end_ms = end_ms or int(time.time() * 1000)
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            return conn.execute("""
+                SELECT s.sensor, r.bucket, r.n, r.sum, r.min, r.max
+                FROM series s JOIN rollup_1m r ON r.series = s.id
+                WHERE s.zone = ? AND s.metric = ? AND r.bucket BETWEEN ? AND ?
+                ORDER BY r.bucket
+            """, (zone, metric, start_ms - start_ms % 60_000, end_ms)).fetchall()
+        finally:
+            conn.close()
+
+    def list_series(self):
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            return [{"zone": z, "metric": m, "sensor": s}
+                    for z, m, s in conn.execute("SELECT zone, metric, sensor FROM series ORDER BY zone, metric, sensor")]
+        finally:
+            conn.close()
+
+    def http_handler(self, path, query):
+        """/ts/series and /ts/query?zone=&metric=&from=&to=&res=&sensor= for BridgeHttpServer."""
+        if path.rstrip("/").endswith("/series"):
+            return 200, {"series": self.list_series()}
+        q = {k: v[0] for k, v in query.items()}
+        if not q.get("zone") or not q.get("metric"):
+            return 400, {"error": "zone and metric are required"}
+        now_ms = int(time.time() * 1000)
+        try:
+            end_ms = _parse_time(q.get("to"), now_ms)
+            start_ms = _parse_time(q.get("from"), end_ms - 24 * 3600 * 1000)
+            return 200, self.query(q["zone"], q["metric"], start_ms, end_ms,
+                                   q.get("res", "auto"), q.get("sensor"))
+        except ValueError as e:
+            return 400, {"error": str(e)}
+
+
+def open_store(config, base_dir):
+    """TimeSeriesStore from bridge_config.yaml → tsdb, or None if disabled."""
+    conf = config.get("tsdb")
+    if not conf or conf.get("enabled", True) is False:
+        return None
+    path = Path(conf.get("path", "bridge_tsdb.db"))
+    if not path.is_absolute():
+        path = Path(base_dir) / path
+    return TimeSeriesStore(path, conf.get("raw_days", 14), conf.get("minute_days", 90),
+                           conf.get("queue_max", 5000))
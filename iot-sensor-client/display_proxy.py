@@ -2,6 +2,8 @@
 """HTTP proxy for ESPink display + ESP32-CAM.
 ESP32 devices can't do HTTPS on weak WiFi (mobile hotspot),
 so they hit this local proxy over HTTP, and we forward to Railway over HTTPS.
+/display is answered by mqtt_bridge's LAN endpoint when it has the zone
+(no internet round-trip, works offline); Railway is the fallback.
 """
 import http.server
 import urllib.request
@@ -12,11 +14,14 @@ import os
 REMOTE_BASE = "https://clodv4-production.up.railway.app"
 API_KEY = os.environ.get("SENSOR_API_KEY", "truegrow-sensor-key-2026")
 PORT = 8080
+BRIDGE_DISPLAY_URL = os.environ.get("BRIDGE_DISPLAY_URL", "http://127.0.0.1:8095/display")
+DISPLAY_ZONE = "zone-2"
 
 class ProxyHandler(http.server.BaseHTTPRequestHandler):
     def do_GET(self):
         if self.path == "/display":
-            self._proxy_get(f"{REMOTE_BASE}/api/sensor-data/display/zone-2")
+            if not self._local_display(f"{BRIDGE_DISPLAY_URL}/{DISPLAY_ZONE}"):
+                self._proxy_get(f"{REMOTE_BASE}/api/sensor-data/display/{DISPLAY_ZONE}")
         else:
             self.send_response(404)
             self.end_headers()
@@ -28,6 +33,19 @@ class ProxyHandler(http.server.BaseHTTPRequestHandler):
             self.send_response(404)
             self.end_headers()
 
+    def _local_display(self, url):
+        """Serve the display payload from the bridge on this Pi. False → use Railway."""
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                data = resp.read()
+        except Exception:
+            return False  # bridge down, HTTP disabled or zone not seen yet (404)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(data)
+        return True
+
     def _proxy_get(self, url):
         try:
             req = urllib.request.Request(url)
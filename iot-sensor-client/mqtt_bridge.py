@@ -2,12 +2,16 @@
 """
 TRUE GROW IoT — MQTT-to-API Bridge
 Runs on Master Pi. Subscribes to MQTT broker, forwards sensor data to Railway API.
-Buffers failed API calls to SQLite and retries them automatically.
+Topic → endpoint routing is declared in bridge_config.yaml (see bridge_routes.py).
+Delivery runs in priority lanes (status > live > backlog, see bridge_lanes.py);
+failed or overflowing calls are buffered to SQLite and replayed automatically.
 """
 
 import json
+import os
 import time
 import signal
+import socket
 import sqlite3
 import threading
 import urllib.request
@@ -17,10 +21,18 @@ from pathlib import Path
 import yaml
 import paho.mqtt.client as mqtt
 
-CONFIG_PATH = Path(__file__).parent / "bridge_config.yaml"
+from bridge_alerts import AlertEngine
+from bridge_display import LatestValues
+from bridge_http import BridgeHttpServer
+from bridge_lanes import Item, PriorityLanes
+from bridge_metrics import PipelineMetrics, parse_sensor_ts, publish_summary
+from bridge_routes import Message, RouteBatcher, compile_routes, join_batch, patch_json_object, peek_string_field
+from bridge_tsdb import open_store
+
+CONFIG_PATH = Path(os.environ.get("BRIDGE_CONFIG") or Path(__file__).parent / "bridge_config.yaml")
 BUFFER_DB_PATH = Path(__file__).parent / "bridge_buffer.db"
 MAX_BUFFER_SIZE = 10000
-FLUSH_INTERVAL = 30  # seconds between retry attempts
+FLUSH_INTERVAL = 30  # seconds to back off after the API failed
 
 
 def load_config():
@@ -28,6 +40,29 @@ def load_config():
         return yaml.safe_load(f)
 
 
+def instance_settings(config):
+    """Identity of this bridge process: (instance_id, shared_group, buffer_path).
+
+    Several bridges (processes or hosts) can share the load via MQTT v5
+    shared subscriptions: set mqtt.shared_group and give each one a distinct
+    instance id ($BRIDGE_INSTANCE, mqtt.instance_id, or the hostname). The id
+    is stable across restarts so the broker sees a reconnect rather than a
+    new client, and each instance keeps its own retry buffer — two bridges
+    replaying one SQLite file would double-post every buffered reading.
+    Without a group or explicit id the legacy single-bridge layout is used.
+    """
+    mqtt_conf = config["mqtt"]
+    shared_group = mqtt_conf.get("shared_group")
+    explicit_id = os.environ.get("BRIDGE_INSTANCE") or mqtt_conf.get("instance_id")
+    instance_id = explicit_id or socket.gethostname()
+    buffer_dir = Path(config.get("buffer_dir") or BUFFER_DB_PATH.parent)
+    if shared_group or explicit_id:
+        buffer_path = buffer_dir / f"bridge_buffer-{instance_id}.db"
+    else:
+        buffer_path = buffer_dir / BUFFER_DB_PATH.name
+    return instance_id, shared_group, buffer_path
+
+
 # ── SQLite retry buffer ──
 class ApiRetryBuffer:
     """Persistent queue for failed API calls. SQLite WAL mode for SD card safety."""
@@ -79,11 +114,11 @@ class ApiRetryBuffer:
                 return -1
 
     def peek_batch(self, limit=20):
-        """Get oldest pending calls. Returns [(id, endpoint, payload_json), ...]."""
+        """Get oldest pending calls. Returns [(id, endpoint, payload_json, created_at), ...]."""
         with self._lock:
             conn = sqlite3.connect(self.db_path)
             rows = conn.execute(
-                'SELECT id, endpoint, payload FROM api_queue ORDER BY id ASC LIMIT ?',
+                'SELECT id, endpoint, payload, created_at FROM api_queue ORDER BY id ASC LIMIT ?',
                 (limit,)
             ).fetchall()
             conn.close()
@@ -107,7 +142,12 @@ class ApiRetryBuffer:
 
 
 def post_to_api(api_url, api_key, endpoint, payload):
-    data = json.dumps(payload).encode("utf-8") if isinstance(payload, dict) else payload.encode("utf-8")
+    if isinstance(payload, bytes):
+        data = payload
+    elif isinstance(payload, dict):
+        data = json.dumps(payload).encode("utf-8")
+    else:
+        data = payload.encode("utf-8")
     req = urllib.request.Request(
         f"{api_url}{endpoint}",
         data=data,
@@ -129,37 +169,6 @@ def post_to_api(api_url, api_key, endpoint, payload):
         return 0, str(e)
 
 
-def flush_buffer(api_url, api_key, buffer):
-    """Retry failed API calls from the buffer."""
-    sent = 0
-    while True:
-        batch = buffer.peek_batch(20)
-        if not batch:
-            break
-        sent_ids = []
-        stop = False
-        for row_id, endpoint, payload_json in batch:
-            status, _ = post_to_api(api_url, api_key, endpoint, payload_json)
-            if 200 <= status < 300:
-                sent_ids.append(row_id)
-                sent += 1
-            elif 400 <= status < 500:
-                # Client error (bad data) — discard, won't succeed on retry
-                sent_ids.append(row_id)
-                print(f"[Buffer] Discarded bad request ({status}): {payload_json[:80]}")
-            else:
-                # Server error or network error — stop retrying
-                stop = True
-                break
-            time.sleep(0.05)
-        buffer.remove_batch(sent_ids)
-        if stop:
-            break
-    if sent > 0:
-        remaining = buffer.size()
-        print(f"[Buffer] Flushed {sent} buffered call(s), {remaining} remaining")
-
-
 def main():
     config = load_config()
     api_url = config["api"]["url"].rstrip("/")
@@ -167,126 +176,141 @@ def main():
     broker = config["mqtt"]["broker"]
     port = config["mqtt"].get("port", 1883)
 
+    instance_id, shared_group, buffer_path = instance_settings(config)
+
     print(f"=== TRUE GROW IoT MQTT Bridge ===")
     print(f"MQTT: {broker}:{port}")
     print(f"API:  {api_url}")
+    print(f"Instance: {instance_id}" + (f" (shared group '{shared_group}')" if shared_group else ""))
 
-    # Initialize retry buffer
-    buffer = ApiRetryBuffer()
+    # Initialize retry buffer (one per instance)
+    buffer = ApiRetryBuffer(buffer_path)
     buffered = buffer.size()
     if buffered > 0:
         print(f"[Buffer] {buffered} pending API call(s) from previous session")
 
-    # MQTT callbacks
-    # Zigbee sensor → zone mapping (friendly_name → {zoneId, location})
-    zigbee_sensors = config.get("zigbee_sensors", {})
+    # Topic routing table (bridge_config.yaml → routes), compiled once
+    router = compile_routes(config)
+    batcher = RouteBatcher()
+    for route in router.routes:
+        print(f"[Route] {route.name}: {route.pattern} -> {route.endpoint}"
+              + (f" (batch {route.batch_max}/{int(route.batch_linger * 1000)}ms)" if route.batch_max > 1 else ""))
+
+    # Latency histograms (sensor → bridge → API), summarised every interval
+    metrics_conf = config.get("metrics") or {}
+    metrics = PipelineMetrics(interval=metrics_conf.get("interval", 60))
+    stats_topic = metrics_conf.get("topic", "grow/bridge/{instance}/stats").format(instance=instance_id)
+
+    # Local full-resolution history (written on its own thread)
+    tsdb = open_store(config, Path(__file__).parent)
+
+    # Latest value per zone / zigbee device for LAN displays
+    display_conf = config.get("display") or {}
+    latest = LatestValues(tsdb, display_conf.get("zone_names"), display_conf.get("offline_after", 300))
+
+    def on_replay(payload_json, created_at):
+        zone = peek_string_field(payload_json, "zoneId") or "unknown"
+        sensor_ts = parse_sensor_ts(peek_string_field(payload_json, "timestamp"))
+        metrics.replayed(zone, sensor_ts, created_at)
+
+    # Delivery: status > live > backlog, bounded memory, spill to SQLite
+    lanes = PriorityLanes(
+        lambda endpoint, body: post_to_api(api_url, api_key, endpoint, body),
+        buffer,
+        dict({"retry_interval": FLUSH_INTERVAL}, **(config.get("lanes") or {})),
+        on_ack=lambda item: metrics.acked(item.traces),
+        on_replay=on_replay,
+    )
 
-    def on_connect(client, userdata, flags, rc):
+    def submit_batch(route, bodies, traces):
+        lanes.submit(Item(route, join_batch(bodies), route.name, f"batch of {len(bodies)}", traces))
+
+    # In-stream threshold alerts: MQTT + Telegram locally, upstream via lanes
+    alerts = AlertEngine(
+        config.get("alerts") or {},
+        publish=lambda topic, payload: client.publish(topic, payload, qos=1),
+        submit=lanes.submit,
+    )
+
+    # Stuck / spike / drift detection over rolling windows (needs NumPy)
+    anomalies = None
+    anomaly_conf = config.get("anomalies")
+    if anomaly_conf and anomaly_conf.get("enabled", True):
+        from bridge_anomaly import AnomalyDetector
+        anomalies = AnomalyDetector(anomaly_conf)
+
+    # LAN HTTP endpoints
+    http_conf = config.get("http") or {}
+    http_server = BridgeHttpServer(http_conf.get("host", "0.0.0.0"), http_conf.get("port", 8095))
+    http_server.add("/metrics", lambda path, query: (200, {
+        "instance": instance_id,
+        "last": metrics.last,
+        "current": metrics.snapshot(),
+        "lanes": dict(lanes.depths(), **lanes.counters),
+        "tsdb": tsdb.counters if tsdb else None,
+        "alerts": alerts.counters,
+        "anomalies": {"counters": anomalies.counters, "current": anomalies.current()} if anomalies else None,
+    }))
+    http_server.add("/display", latest.http_handler)
+    if tsdb:
+        http_server.add("/ts", tsdb.http_handler)
+
+    def on_connect(client, userdata, flags, rc, properties=None):
         if rc == 0:
-            print(f"[MQTT] Connected, subscribing to grow/# and zigbee2mqtt/#")
-            client.subscribe("grow/#")
-            client.subscribe("zigbee2mqtt/#")
+            filters = router.subscriptions(shared_group)
+            print(f"[MQTT] Connected, subscribing to {', '.join(filters)}")
+            for topic_filter in filters:
+                client.subscribe(topic_filter)
         else:
             print(f"[MQTT] Connect failed: rc={rc}")
 
     def on_message(client, userdata, msg):
+        received_at = time.time()
         try:
-            topic = msg.topic
-            parts = topic.split("/")
-
-            # grow/zone/{zoneId}/sensors
-            if len(parts) >= 4 and parts[0] == "grow" and parts[1] == "zone":
-                zone_id = parts[2]
-                msg_type = parts[3]
-                payload = json.loads(msg.payload.decode())
-
-                if msg_type == "sensors":
-                    payload["zoneId"] = zone_id
-                    payload_json = json.dumps(payload)
-                    status, body = post_to_api(api_url, api_key, "/api/sensor-data", payload_json)
-
-                    temps = payload.get("temperatures", [])
-                    t_str = ", ".join(f"{t['location']}={t['value']}°C" for t in temps)
-                    co2 = payload.get("co2")
-                    rh = payload.get("humidity")
-                    extra = ""
-                    if co2 is not None:
-                        extra += f" CO2={co2}"
-                    if rh is not None:
-                        extra += f" RH={rh}%"
-
-                    if 200 <= status < 300:
-                        print(f"[{zone_id}] {t_str}{extra} -> {status}")
-                    else:
-                        # API failed — buffer for retry
-                        size = buffer.push("/api/sensor-data", payload_json)
-                        print(f"[{zone_id}] {t_str}{extra} -> BUFFERED ({status}, {size} pending)")
-
-                elif msg_type == "status":
-                    payload["zoneId"] = zone_id
-                    status, _ = post_to_api(api_url, api_key, "/api/sensor-data/status", payload)
-                    if 200 <= status < 300:
-                        print(f"[{zone_id}] status: {'online' if payload.get('online') else 'offline'}")
-                    else:
-                        print(f"[{zone_id}] status update failed ({status})")
-
-            # zigbee2mqtt/{friendly_name} — Zigbee sensor data
-            if parts[0] == "zigbee2mqtt" and len(parts) == 2:
-                device_name = parts[1]
-                # Skip bridge/system topics
-                if device_name in ("bridge", ""):
-                    return
-                sensor_cfg = zigbee_sensors.get(device_name)
-                if not sensor_cfg:
-                    return  # unknown device, ignore
-
-                payload = json.loads(msg.payload.decode())
-                temp = payload.get("temperature")
-                humidity = payload.get("humidity")
-                battery = payload.get("battery")
-
-                if temp is None and humidity is None:
-                    return  # no sensor data (e.g. just linkquality)
-
-                # Build sensor reading in portal format
-                zone_id = sensor_cfg["zone_id"]
-                location = sensor_cfg.get("location", device_name)
-                reading = {
-                    "zoneId": zone_id,
-                    "source": "zigbee",
-                    "zigbee_device": device_name,
-                    "zigbee_sensors": [{
-                        "device": device_name,
-                        "location": location,
-                        "temperature": temp,
-                        "humidity": humidity,
-                        "battery": battery,
-                    }]
-                }
-                payload_json = json.dumps(reading)
-                status, body = post_to_api(api_url, api_key, "/api/sensor-data", payload_json)
-
-                parts_str = []
-                if temp is not None:
-                    parts_str.append(f"T={temp}°C")
-                if humidity is not None:
-                    parts_str.append(f"RH={humidity}%")
-                if battery is not None:
-                    parts_str.append(f"bat={battery}%")
-
-                if 200 <= status < 300:
-                    print(f"[zigbee:{device_name}] {' '.join(parts_str)} -> {status}")
-                else:
-                    size = buffer.push("/api/sensor-data", payload_json)
-                    print(f"[zigbee:{device_name}] {' '.join(parts_str)} -> BUFFERED ({status})")
-
+            hit = router.match(msg.topic)
+            if hit is None:
+                return
+            route, captures = hit
+            out = route.transform(route, Message(msg.topic, msg.payload, captures))
+            if out is None:
+                return
+            body, label, summary = out
+            zone = peek_string_field(body, "zoneId") or label
+            sensor_ts = parse_sensor_ts(peek_string_field(body, "timestamp"))
+            metrics.received(zone, sensor_ts, received_at)
+            trace = (zone, sensor_ts, received_at)
+            if route.store:
+                if anomalies:
+                    flags = anomalies.flags(zone)
+                    if flags:
+                        body = patch_json_object(body, b'"anomalies": ' + json.dumps(flags).encode("utf-8")) or body
+                latest.update(body, received_at, zone)
+                # Side checks must never cost the reading its delivery
+                if alerts.watches(zone):
+                    try:
+                        alerts.evaluate(json.loads(body), received_at)
+                    except Exception as e:
+                        print(f"[Alert] Evaluation failed on {msg.topic}: {e}")
+                if anomalies:
+                    anomalies.push(body, received_at)
+                if tsdb:
+                    tsdb.submit(body, received_at)
+            if route.batch_max > 1:
+                ready = batcher.add(route, body, trace)
+                if ready:
+                    submit_batch(*ready)
+            else:
+                lanes.submit(Item(route, body, label, summary, (trace,)))
         except json.JSONDecodeError:
             print(f"[MQTT] Invalid JSON on {msg.topic}")
         except Exception as e:
             print(f"[MQTT] Error handling {msg.topic}: {e}")
 
-    # Create MQTT client
-    client = mqtt.Client(client_id=f"truegrow-bridge-{int(time.time())}")
+    # Create MQTT client. Shared subscriptions need MQTT v5.
+    client = mqtt.Client(
+        client_id=f"truegrow-bridge-{instance_id}",
+        protocol=mqtt.MQTTv5 if shared_group else mqtt.MQTTv311,
+    )
     if config["mqtt"].get("username"):
         client.username_pw_set(config["mqtt"]["username"], config["mqtt"].get("password", ""))
     client.on_connect = on_connect
@@ -302,21 +326,47 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
 
     # Connect and loop
+    lanes.start()
+    if tsdb:
+        tsdb.start()
+    try:
+        http_server.start()
+    except OSError as e:
+        print(f"[HTTP] Disabled: {e}")
     client.connect(broker, port, keepalive=60)
     client.loop_start()
     print("[MQTT] Bridge running...")
 
-    last_flush = 0
     while running:
-        # Periodically retry buffered calls
-        now = time.time()
-        if now - last_flush >= FLUSH_INTERVAL and buffer.size() > 0:
-            flush_buffer(api_url, api_key, buffer)
-            last_flush = now
-        time.sleep(1)
+        # Hand over batches whose linger time ran out
+        for batch in batcher.due():
+            submit_batch(*batch)
+        alerts.tick()
+        # Vectorized anomaly pass; flags ride on the next forwarded payloads
+        if anomalies and anomalies.due():
+            anomalies.run()
+        # Periodic latency summary → MQTT stats topic (+ /metrics)
+        if metrics.due():
+            summary = metrics.snapshot(reset=True)
+            summary["instance"] = instance_id
+            summary["lanes"] = dict(lanes.depths(), **lanes.counters)
+            if anomalies:
+                summary["anomalies"] = anomalies.current()
+            publish_summary(client, stats_topic, summary)
+            for zone, stages in summary["zones"].items():
+                e2e = stages.get("end_to_end") or stages.get("bridge_to_ack") or {}
+                if e2e.get("count"):
+                    print(f"[Metrics] {zone}: n={e2e['count']} p50={e2e['p50']}ms p99={e2e['p99']}ms")
+        time.sleep(0.1)
 
     client.loop_stop()
     client.disconnect()
+    for batch in batcher.drain():
+        submit_batch(*batch)
+    lanes.stop()
+    http_server.stop()
+    if tsdb:
+        tsdb.stop()
     remaining = buffer.size()
     if remaining > 0:
         print(f"[Buffer] {remaining} pending call(s) saved for next session")
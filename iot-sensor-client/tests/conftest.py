@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Bridge modules are flat scripts next to mqtt_bridge.py, not a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
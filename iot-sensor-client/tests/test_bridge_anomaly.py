@@ -0,0 +1,44 @@
+import json
+
+from bridge_anomaly import AnomalyDetector
+
+
+def _push(detector, t, temperature):
+    detector.push(json.dumps({"zoneId": "zone-1", "temperature": temperature}).encode("utf-8"), t)
+
+
+def _spikes(flags):
+    return [f for f in flags.get("zone-1", []) if f["kind"] == "spike"]
+
+
+def test_spike_in_the_middle_of_a_window_is_flagged():
+    detector = AnomalyDetector({"pairs": []})
+    t0 = 1_000_000.0
+    # 20 s cadence over one 60 s pass: 22 → 27 °C and straight back, then steady
+    for i, value in enumerate([22.0, 22.1, 27.1, 22.2, 22.2, 22.3]):
+        _push(detector, t0 + i * 20, value)
+
+    spikes = _spikes(detector.run(now=t0 + 120))
+    assert len(spikes) == 1
+    assert spikes[0]["metric"] == "temperature"
+    assert spikes[0]["value"] == 27.1
+    assert spikes[0]["rate"] == 15.0
+
+
+def test_spike_is_not_reported_again_by_the_next_pass():
+    detector = AnomalyDetector({"pairs": []})
+    t0 = 1_000_000.0
+    for i, value in enumerate([22.0, 27.0, 22.0]):
+        _push(detector, t0 + i * 20, value)
+    assert _spikes(detector.run(now=t0 + 60))
+
+    for i, value in enumerate([22.1, 22.2, 22.1]):
+        _push(detector, t0 + 60 + i * 20, value)
+    assert _spikes(detector.run(now=t0 + 120)) == []
+
+
+def test_malformed_body_is_skipped():
+    detector = AnomalyDetector({"pairs": []})
+    detector.push(b'{"zoneId": "zone-1", "temperatures": [5]}', 1_000_000.0)
+    assert detector.run(now=1_000_060.0) == {}
+    assert detector.counters["skipped"] == 1
@@ -0,0 +1,75 @@
+import json
+import sqlite3
+import time
+from datetime import datetime, timezone
+
+from bridge_tsdb import TimeSeriesStore
+
+
+def _body(ts, value):
+    iso = datetime.fromtimestamp(ts, timezone.utc).isoformat()
+    return json.dumps({"zoneId": "zone-1", "timestamp": iso, "temperature": value}).encode("utf-8")
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class _FailOnce:
+    """Connection proxy: the first executemany raises, like a transient SD-card error."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self.failed = False
+
+    def executemany(self, *args):
+        if not self.failed:
+            self.failed = True
+            raise sqlite3.OperationalError("disk I/O error")
+        return self._conn.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_batch_after_failed_write_is_stored(tmp_path):
+    store = TimeSeriesStore(tmp_path / "tsdb.db")
+    write = store._write
+    proxies = []
+
+    def flaky_write(conn, batch):
+        if not proxies:
+            proxies.append(_FailOnce(conn))
+        return write(proxies[0] if not proxies[0].failed else conn, batch)
+
+    store._write = flaky_write
+    store.start()
+    now = int(time.time())
+
+    store.submit(_body(now - 10, 21.0), now)
+    assert _wait_for(lambda: store.counters["errors"] == 1)
+
+    store.submit(_body(now, 22.5), now)
+    store.stop()
+
+    assert store.counters["written"] == 1
+    result = store.query("zone-1", "temperature", (now - 60) * 1000, (now + 60) * 1000, "raw")
+    assert result["series"][0]["points"] == [[now * 1000, 22.5]]
+    assert store.list_series() == [{"zone": "zone-1", "metric": "temperature", "sensor": "co2_sensor"}]
+
+
+def test_repeated_timestamp_is_rolled_up_once(tmp_path):
+    store = TimeSeriesStore(tmp_path / "tsdb.db")
+    store.start()
+    now = int(time.time())
+    store.submit(_body(now, 20.0), now)
+    store.submit(_body(now, 30.0), now)
+    store.stop()
+
+    rows = store.minute_rows("zone-1", "temperature", (now - 60) * 1000)
+    assert [(n, total) for _, _, n, total, _, _ in rows] == [(1, 20.0)]
@@ -9,18 +9,22 @@
   - Используем тот же SCALE_API_KEY что scale-client: одной секрет, меньше env.
     Отдельный deviceType='probe' даёт сервер-сайду слот io.probeSocket для
     целевой emit probe:run-now, не смешиваясь с каналом весов.
-  - Ни одна проверка не блокирующая, timeout 5 сек на каждую. Даже если что-то
-    зависло (например systemctl не отвечает) — probe всё равно отправит snapshot
-    с warning на этот конкретный чек.
+  - Проверки идут параллельно на небольшом пуле потоков, у каждой свой дедлайн
+    (CHECKS). Если что-то зависло (например systemctl не отвечает) — probe всё
+    равно отправит snapshot: у этого чека {'error': 'timeout …', 'timedOut': True},
+    остальные как есть. Длительность каждого чека — в checkDurationsMs.
   - По умолчанию интервал 300 сек, конфигурируется через $PROBE_INTERVAL_SEC.
 """
 import os
 import sys
 import json
+import math
 import time
+import http.client
 import socket as pysocket
 import subprocess
 import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -45,6 +49,8 @@ if not os.environ.get('SCALE_API_KEY'):
 SERVER_URL = os.environ.get('SERVER_URL', 'https://clodv4-production.up.railway.app')
 API_KEY = os.environ.get('SCALE_API_KEY')
 INTERVAL_SEC = int(os.environ.get('PROBE_INTERVAL_SEC', '300'))
+WORKERS = int(os.environ.get('PROBE_WORKERS', '4'))            # потоков на проверки
+BUDGET_SEC = float(os.environ.get('PROBE_BUDGET_SEC', '15'))   # весь snapshot не дольше
 HOSTNAME = pysocket.gethostname()
 
 if not API_KEY:
@@ -65,6 +71,14 @@ SERVICES = [
     'docker',
 ]
 
+# Unix-сокет живого состояния scale-client (pi-scale-client/status_socket.py)
+SCALE_STATUS_SOCKET = os.environ.get('SCALE_STATUS_SOCKET', '/run/scale-client/status.sock')
+
+# Unix-сокеты демонов: статус без fork'а CLI (docker inspect, tailscale status)
+DOCKER_SOCKET = os.environ.get('DOCKER_SOCKET', '/var/run/docker.sock')
+TAILSCALE_SOCKET = os.environ.get('TAILSCALE_SOCKET', '/var/run/tailscale/tailscaled.sock')
+HA_URL_HOST, HA_URL_PORT = 'localhost', 8123
+
 # Pi Zero MQTT topic для проверки freshness её сенсоров (должны публиковаться каждые 30с)
 PI_ZERO_ZONE_ID = os.environ.get('PI_ZERO_ZONE_ID', 'zone-1')
 
@@ -80,20 +94,83 @@ def run(cmd, timeout=5):
         return f'ERR: {e}', False
 
 
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP поверх Unix-сокета (Docker Engine API, tailscaled LocalAPI)."""
+
+    def __init__(self, path, host='localhost', timeout=3):
+        super().__init__(host, timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = pysocket.socket(pysocket.AF_UNIX, pysocket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def http_get(conn, path):
+    """GET без редиректов. Возвращает (status, body) или (None, текст ошибки)."""
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    except (OSError, http.client.HTTPException) as e:
+        return None, str(e)
+    finally:
+        conn.close()
+
+
 # ── Проверки ──
 def check_services():
-    """systemctl is-active <unit> для каждого интересного юнита."""
-    result = {}
-    for svc in SERVICES:
-        out, _ = run(['systemctl', 'is-active', svc])
-        # возможные значения: active, inactive, failed, activating, unknown
-        result[svc] = out or 'unknown'
-    return result
-
-
-def check_scanner():
-    """Ищем evdev-устройство 'Honeywell' и пытаемся EVIOCGRAB чтобы понять,
-    держит ли его scale-client эксклюзивно (ожидание)."""
+    """ActiveState всех юнитов одним `systemctl show` (вместо is-active на каждый)."""
+    out, ok = run(['systemctl', 'show', '--property=Id,ActiveState', '--'] +
+                  [f'{svc}.service' for svc in SERVICES])
+    states = {}
+    if ok:
+        # Блоки "Id=...\nActiveState=..." через пустую строку, порядок свойств — systemd'шный
+        for block in out.split('\n\n'):
+            props = dict(line.split('=', 1) for line in block.splitlines() if '=' in line)
+            unit = props.get('Id', '')
+            if unit.endswith('.service'):
+                states[unit[:-len('.service')]] = props.get('ActiveState')
+    # возможные значения: active, inactive, failed, activating, unknown
+    return {svc: states.get(svc) or 'unknown' for svc in SERVICES}
+
+
+def read_scale_status(timeout=2):
+    """Снимок состояния scale-client из его Unix-сокета (одна строка JSON).
+    None — сокета нет (старый scale-client, сервис остановлен) или не ответил."""
+    try:
+        with pysocket.socket(pysocket.AF_UNIX, pysocket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(SCALE_STATUS_SOCKET)
+            chunks = []
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        return None
+
+
+def _primary_station(status):
+    stations = (status or {}).get('stations') or []
+    return stations[0] if stations else None
+
+
+def check_scanner(status=None):
+    """Сканер и его эксклюзивный grab — из status-сокета scale-client.
+    Без сокета — только ищем evdev-устройство 'Honeywell': grab не трогаем,
+    чтобы не отнять сканер у живого процесса."""
+    st = _primary_station(status)
+    if st is not None:
+        if not st.get('barcodeConnected'):
+            return {'found': False, 'source': 'scale-client'}
+        return {'found': True, 'devicePath': st.get('barcodeDevice'),
+                'name': st.get('barcodeName') or st.get('barcodeMode'),
+                'grabbedByScaleClient': st.get('barcodeGrabbed'),
+                'lastScanAt': st.get('lastScanAt'), 'source': 'scale-client'}
     try:
         for path in list_devices():
             try:
@@ -101,29 +178,44 @@ def check_scanner():
             except (OSError, IOError):
                 continue
             name = d.name or ''
-            if 'Honeywell' not in name:
-                d.close()
-                continue
-            devpath = d.path
-            try:
-                d.grab()
-                # мы смогли grab'нуть — значит scale-client НЕ держит exclusive
-                d.ungrab()
-                d.close()
-                return {'found': True, 'devicePath': devpath, 'name': name, 'grabbedByScaleClient': False}
-            except (OSError, IOError) as e:
-                # EBUSY (16) — занят другим процессом, что нам и надо
-                d.close()
-                return {'found': True, 'devicePath': devpath, 'name': name,
-                        'grabbedByScaleClient': e.errno == 16, 'grabError': str(e)}
-        return {'found': False}
+            d.close()
+            if 'Honeywell' in name:
+                # состояние grab неизвестно — scale-client не ответил
+                return {'found': True, 'devicePath': path, 'name': name,
+                        'grabbedByScaleClient': None, 'source': 'evdev'}
+        return {'found': False, 'source': 'evdev'}
     except Exception as e:
         return {'found': False, 'error': str(e)}
 
 
-def check_scale_activity():
-    """Последнее упоминание '[Scale] Status sent' или '[Barcode] Scanned' в
-    journalctl scale-client — оценка живости цепочки."""
+def check_scale_activity(status=None):
+    """Живость цепочки весы/сканер: последнее показание или скан по
+    status-сокету scale-client; без сокета — последнее '[Scale]'/'[Barcode]'
+    в journalctl scale-client."""
+    if status is not None:
+        stations = status.get('stations') or []
+        times = [t for st in stations for t in (st.get('lastReadingAt'), st.get('lastScanAt')) if t]
+        primary = stations[0] if stations else {}
+        result = {
+            'lastActivityAt': None,
+            'secondsAgo': None,
+            'weight': primary.get('lastWeight'),
+            'stable': primary.get('stable'),
+            'scaleConnected': primary.get('scaleConnected'),
+            'serverConnected': status.get('serverConnected'),
+            'queueDepth': status.get('queueDepth'),
+            'loopLagMs': status.get('loopLagMs'),
+            'source': 'scale-client',
+        }
+        if times:
+            last = max(times)
+            result['lastActivityAt'] = datetime.fromtimestamp(last).isoformat()
+            result['secondsAgo'] = max(0, int(time.time() - last))
+        return result
+    return _scale_activity_from_journal()
+
+
+def _scale_activity_from_journal():
     out, ok = run(['journalctl', '-u', 'scale-client', '-n', '200', '--no-pager'], timeout=10)
     if not ok:
         return {'error': 'journalctl unavailable'}
@@ -143,24 +235,35 @@ def check_scale_activity():
             ts = ts.replace(year=now.year - 1)
         seconds_ago = int((now - ts).total_seconds())
         return {'lastActivityAt': ts.isoformat(), 'secondsAgo': seconds_ago,
-                'lastLineSample': last_line[-100:]}
+                'lastLineSample': last_line[-100:], 'source': 'journal'}
     except Exception as e:
         return {'error': f'parse: {e}', 'rawLast': last_line[-100:]}
 
 
 def check_ha():
-    """HA Docker-контейнер + HTTP ответ."""
-    out, ok = run(['docker', 'inspect', '-f', '{{.State.Status}}', 'homeassistant'], timeout=5)
-    state = out if ok else 'not-found'
-    http_code, _ = run(['curl', '-s', '-o', '/dev/null', '-w', '%{http_code}',
-                        '-m', '3', 'http://localhost:8123/'])
-    return {'dockerState': state, 'httpCode': http_code or '0'}
+    """HA Docker-контейнер (Docker Engine API) + HTTP ответ (без редиректов, как curl)."""
+    status, body = http_get(UnixHTTPConnection(DOCKER_SOCKET), '/containers/homeassistant/json')
+    state = 'not-found'
+    if status == 200:
+        try:
+            state = json.loads(body)['State']['Status']
+        except (ValueError, KeyError, TypeError):
+            pass
+    http_code, _ = http_get(http.client.HTTPConnection(HA_URL_HOST, HA_URL_PORT, timeout=3), '/')
+    return {'dockerState': state, 'httpCode': str(http_code or 0)}
 
 
 def check_tailscale():
-    out, ok = run(['tailscale', 'status', '--json'], timeout=5)
-    if not ok:
-        return {'error': 'tailscale status failed'}
+    """`tailscale status --json` — тот же JSON из LocalAPI tailscaled, без CLI."""
+    status, body = http_get(UnixHTTPConnection(TAILSCALE_SOCKET, host='local-tailscaled.sock', timeout=5),
+                            '/localapi/v0/status')
+    if status == 200:
+        out = body
+    else:
+        # Нет доступа к сокету — CLI
+        out, ok = run(['tailscale', 'status', '--json'], timeout=5)
+        if not ok:
+            return {'error': 'tailscale status failed'}
     try:
         data = json.loads(out)
         # Ищем peer с наиболее свежим коннектом
@@ -229,11 +332,13 @@ def check_usb():
 
 
 def check_system():
-    # Disk /
-    out, _ = run(['df', '--output=pcent', '/'])
+    # Disk / — как df --output=pcent: used / (used + available), вверх
     try:
-        disk_pct = int(out.split('\n')[-1].strip().rstrip('%'))
-    except Exception:
+        st = os.statvfs('/')
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        disk_pct = math.ceil(used * 100 / (used + avail)) if used + avail else None
+    except OSError:
         disk_pct = None
     # Load
     try:
@@ -247,16 +352,13 @@ def check_system():
             uptime_sec = int(float(f.read().split()[0]))
     except Exception:
         uptime_sec = None
-    # Mem
+    # Mem — MemAvailable (колонка available у free), иначе MemFree
     try:
-        out, _ = run(['free', '-m'])
-        mem_free_mb = None
-        for line in out.split('\n'):
-            if line.startswith('Mem:'):
-                parts = line.split()
-                mem_free_mb = int(parts[6]) if len(parts) > 6 else int(parts[3])
-                break
-    except Exception:
+        with open('/proc/meminfo') as f:
+            meminfo = {key: int(value.split()[0]) for key, value in (line.split(':', 1) for line in f)}
+        kb = meminfo.get('MemAvailable', meminfo.get('MemFree'))
+        mem_free_mb = kb // 1024 if kb is not None else None
+    except (OSError, ValueError, IndexError):
         mem_free_mb = None
     return {
         'diskPercent': disk_pct,
@@ -267,25 +369,77 @@ def check_system():
 
 
 # ── Сбор ──
+# (ключ в checks, функция(status), дедлайн сек от старта чека); status() —
+# снимок scale-client (read_scale_status, один на snapshot).
+# Дедлайн чуть больше собственного timeout внешней команды внутри чека.
+CHECKS = [
+    ('services',  lambda status: check_services(),                   5),
+    ('scanner',   lambda status: check_scanner(status()),            4),
+    ('scale',     lambda status: check_scale_activity(status()),     11),
+    ('ha',        lambda status: check_ha(),                         6),
+    ('tailscale', lambda status: check_tailscale(),                  6),
+    ('iptables',  lambda status: check_iptables_udp_block(),         6),
+    ('piZero',    lambda status: check_pi_zero(),                    12),
+    ('usb',       lambda status: check_usb(),                        2),
+    ('system',    lambda status: check_system(),                     5),
+]
+
+# Пул общий на все snapshot'ы: поток зависшего чека не убить, но внешние
+# команды идут через run() с timeout — он освободится сам.
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='check')
+
+
+def _timed(fn, arg, started, name):
+    started[name] = time.monotonic()
+    result = fn(arg)
+    return result, time.monotonic() - started[name]
+
+
 def run_all_checks():
-    t0 = time.time()
-    checks = {
-        'services': check_services(),
-        'scanner': check_scanner(),
-        'scale': check_scale_activity(),
-        'ha': check_ha(),
-        'tailscale': check_tailscale(),
-        'iptables': check_iptables_udp_block(),
-        'piZero': check_pi_zero(),
-        'usb': check_usb(),
-        'system': check_system(),
-    }
-    duration_ms = int((time.time() - t0) * 1000)
+    t0 = time.monotonic()
+    wall_t0 = time.time()
+    # Один запрос к scale-client на оба чека (сканер + активность весов) — первым в очереди
+    status_future = _pool.submit(read_scale_status)
+    started = {}
+    futures = {name: (_pool.submit(_timed, fn, status_future.result, started, name), deadline)
+               for name, fn, deadline in CHECKS}
+
+    checks, durations, timed_out = {}, {}, []
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for name in list(pending):
+            future, deadline = futures[name]
+            if future.done():
+                try:
+                    checks[name], elapsed = future.result()
+                except Exception as e:
+                    checks[name], elapsed = {'error': str(e)}, now - started.get(name, now)
+                durations[name] = int(elapsed * 1000)
+                pending.discard(name)
+                continue
+            begun = started.get(name)
+            # Свой дедлайн от старта чека; не дождавшийся потока — общий бюджет snapshot'а
+            over_deadline = begun is not None and now - begun > deadline
+            if over_deadline or now - t0 > BUDGET_SEC:
+                future.cancel()
+                limit = deadline if over_deadline else BUDGET_SEC
+                checks[name] = {'error': f'timeout after {limit:g}s', 'timedOut': True}
+                durations[name] = int((now - (begun or t0)) * 1000)
+                timed_out.append(name)
+                pending.discard(name)
+        if pending:
+            wait([futures[name][0] for name in pending], timeout=0.1, return_when=FIRST_COMPLETED)
+
+    if timed_out:
+        print(f'[probe] timed out: {", ".join(timed_out)}')
     return {
         'timestamp': datetime.now(timezone.utc).isoformat(),
         'host': HOSTNAME,
-        'durationMs': duration_ms,
-        'checks': checks,
+        'durationMs': int((time.time() - wall_t0) * 1000),
+        'checks': {name: checks[name] for name, _, _ in CHECKS},
+        'checkDurationsMs': {name: durations[name] for name, _, _ in CHECKS},
+        'timedOut': timed_out,
     }
 
 
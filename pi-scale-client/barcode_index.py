@@ -0,0 +1,142 @@
+"""
+Локальный индекс штрихкодов: номер куста → комната, сорт, собран ли уже.
+
+Скан проверяется на Pi сразу — поиском в dict, без запроса к серверу и
+без связи вообще: известен ли штрихкод и к какой комнате/сорту относится.
+Результат уходит вместе со сканом (known / plants в barcode:scan_batch),
+виден в логе и в status_socket.
+
+Индекс собирает сервер (server/utils/barcodeIndex.js) из активных сессий
+сбора, Pi синхронизирует его по версии:
+
+  barcode:index_sync {epoch, version}  → ack {ok, epoch, version, full,
+                                              entries: [[code, plants]], removed: [code]}
+  barcode:index_changed (от сервера)   → тот же запрос
+
+full — полный снимок (первая синхронизация, рестарт сервера — другой epoch):
+индекс заменяется целиком, иначе применяются только изменения.
+
+plants — список совпадений, номера кустов в разных комнатах повторяются:
+  [{'room': 3, 'roomName': 'Комната 3', 'strain': 'OG Kush', 'harvested': False}, ...]
+
+Хранится в SQLite (тот же файл, что BarcodeQueue): после перезапуска Pi без
+связи индекс уже на месте. Пишет только этот процесс.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from event_buffer import DEFAULT_DB_PATH
+
+
+def normalize(code):
+    """Ключ индекса: '0012' и '12' — один куст (как parseInt на странице сбора)."""
+    code = code.strip()
+    return str(int(code)) if code.isdigit() else code
+
+
+class BarcodeIndex:
+    def __init__(self, db_path=None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        self._lock = threading.Lock()   # запись в SQLite; чтение dict — без lock
+        self._entries = {}
+        self.epoch = None
+        self.version = 0
+        self.synced_at = None           # time.time() последней синхронизации
+        self._load()
+
+    def _load(self):
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS barcode_index (code TEXT PRIMARY KEY, plants TEXT NOT NULL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS barcode_index_meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.commit()
+            meta = dict(conn.execute('SELECT key, value FROM barcode_index_meta').fetchall())
+            rows = conn.execute('SELECT code, plants FROM barcode_index').fetchall()
+            conn.close()
+        self._entries = {code: json.loads(plants) for code, plants in rows}
+        if 'version' in meta:
+            self.epoch = meta.get('epoch')
+            self.version = int(meta['version'])
+            self.synced_at = float(meta['synced_at']) if meta.get('synced_at') else None
+            print(f'[Index] Loaded {len(self._entries)} barcode(s), version {self.version}')
+
+    def ready(self):
+        """Индекс хотя бы раз синхронизирован — отсутствие штрихкода что-то значит."""
+        return self.epoch is not None
+
+    def lookup(self, code):
+        """Совпадения для штрихкода ([] — неизвестен) или None, если индекса ещё нет."""
+        if not self.ready():
+            return None
+        return self._entries.get(normalize(code), [])
+
+    def validate(self, code):
+        """Поля для скана: {} (индекса нет), {'known': False} или {'known': True, 'plants': [...]}."""
+        plants = self.lookup(code)
+        if plants is None:
+            return {}
+        if not plants:
+            return {'known': False}
+        return {'known': True, 'plants': plants}
+
+    @staticmethod
+    def describe(check):
+        """Коротко для лога: результат validate()."""
+        if not check:
+            return ''
+        if not check['known']:
+            return ' [not in index]'
+        plants = ', '.join(f"room {p.get('room')}" + (f" {p['strain']}" if p.get('strain') else '')
+                           + (' (harvested)' if p.get('harvested') else '') for p in check['plants'])
+        return f' [{plants}]'
+
+    def request(self):
+        """Данные для barcode:index_sync."""
+        return {'epoch': self.epoch, 'version': self.version}
+
+    def apply(self, resp):
+        """Ответ на barcode:index_sync: применить и сохранить. True — индекс изменился."""
+        if not isinstance(resp, dict) or not resp.get('ok'):
+            print(f'[Index] Sync rejected: {resp}')
+            return False
+        full = bool(resp.get('full'))
+        entries = [(normalize(str(code)), plants) for code, plants in resp.get('entries') or []]
+        removed = [normalize(str(code)) for code in resp.get('removed') or []]
+        now = time.time()
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            if full:
+                conn.execute('DELETE FROM barcode_index')
+            conn.executemany('INSERT OR REPLACE INTO barcode_index (code, plants) VALUES (?, ?)',
+                             [(code, json.dumps(plants, ensure_ascii=False)) for code, plants in entries])
+            conn.executemany('DELETE FROM barcode_index WHERE code = ?', [(code,) for code in removed])
+            conn.executemany('INSERT OR REPLACE INTO barcode_index_meta (key, value) VALUES (?, ?)', [
+                ('epoch', resp.get('epoch')), ('version', str(resp.get('version', 0))), ('synced_at', str(now)),
+            ])
+            conn.commit()
+            conn.close()
+            # dict целиком подменяется — читатели (потоки сканеров) видят старый или новый
+            updated = {} if full else dict(self._entries)
+            updated.update(entries)
+            for code in removed:
+                updated.pop(code, None)
+            self._entries = updated
+            self.epoch = resp.get('epoch')
+            self.version = resp.get('version', 0)
+            self.synced_at = now
+        if full or entries or removed:
+            kind = 'full' if full else f'+{len(entries)} -{len(removed)}'
+            print(f'[Index] Synced barcode index v{self.version} ({kind}): {len(updated)} barcode(s)')
+            return True
+        return False
+
+    def size(self):
+        return len(self._entries)
+
+    def info(self):
+        """Для scale:debug и status_socket."""
+        return {'version': self.version, 'barcodes': len(self._entries), 'syncedAt': self.synced_at}
@@ -17,6 +17,8 @@ import os
 import time
 import select
 
+from hotplug import STABLE_PREFIXES, hint_matches
+
 try:
     from evdev import InputDevice, categorize, ecodes, list_devices
     EVDEV_AVAILABLE = True
@@ -48,6 +50,8 @@ ENTER_CODES = {KEY_ENTER, KEY_KPENTER}
 class BarcodeReader:
     """Чтение штрихкодов с USB HID-сканера через evdev."""
 
+    HOTPLUG_MATCH = ('input', ('input/event',))  # для hotplug.HotplugMonitor.attach
+
     def __init__(self, device_path=None, device_name_filter=None):
         """
         Args:
@@ -60,10 +64,15 @@ class BarcodeReader:
             raise ImportError('evdev не установлен. Выполните: pip install evdev')
 
         self.device_path = device_path
+        self.configured_path = device_path  # device_path меняют reconnect/автоопределение
         self.device_name_filter = device_name_filter or 'Honeywell'
         self.device = None
         self._buffer = ''
         self._grabbed = False
+        self._scan_started = None
+        self.last_scan_monotonic = None  # время (monotonic) последнего завершённого скана
+        self.hotplug = None  # hotplug.Watch — ждать подключения по событию, а не таймеру
+        self._hint = None    # узел из последнего события add
 
     def find_device(self):
         """
@@ -72,31 +81,46 @@ class BarcodeReader:
         правильный интерфейс (Honeywell создаёт несколько event-устройств).
         Возвращает путь к устройству или None.
         """
-        devices = [InputDevice(path) for path in list_devices()]
-        filter_lower = self.device_name_filter.lower()
         candidates = []
-
-        for dev in devices:
-            name_lower = dev.name.lower()
-            if filter_lower not in name_lower and not any(
-                kw in name_lower for kw in ['barcode', 'scanner', 'voyager']
-            ):
-                continue
-
-            # Проверить что устройство имеет нужные EV_KEY capabilities
-            caps = dev.capabilities(verbose=False)
-            ev_key_caps = caps.get(ecodes.EV_KEY, [])
-            # Нужны цифровые клавиши (KEY_1=2..KEY_0=11)
-            has_digit_keys = any(k in ev_key_caps for k in range(2, 12))
-
-            if has_digit_keys:
-                print(f'[Barcode] Found scanner: {dev.name} at {dev.path} (has KEY events)')
+        for path in list_devices():
+            dev = InputDevice(path)
+            if self._is_scanner(dev):
                 candidates.append(dev.path)
-            else:
-                print(f'[Barcode] Skipping {dev.name} at {dev.path} (no digit KEY events)')
-
+            dev.close()
         return candidates[0] if candidates else None
 
+    def _is_scanner(self, dev):
+        """Имя похоже на сканер и есть цифровые EV_KEY (а не служебный интерфейс)."""
+        name_lower = dev.name.lower()
+        if self.device_name_filter.lower() not in name_lower and not any(
+            kw in name_lower for kw in ['barcode', 'scanner', 'voyager']
+        ):
+            return False
+
+        # Проверить что устройство имеет нужные EV_KEY capabilities
+        caps = dev.capabilities(verbose=False)
+        ev_key_caps = caps.get(ecodes.EV_KEY, [])
+        # Нужны цифровые клавиши (KEY_1=2..KEY_0=11)
+        if any(k in ev_key_caps for k in range(2, 12)):
+            print(f'[Barcode] Found scanner: {dev.name} at {dev.path} (has KEY events)')
+            return True
+        print(f'[Barcode] Skipping {dev.name} at {dev.path} (no digit KEY events)')
+        return False
+
+    def _hinted_path(self):
+        """Узел из события hotplug, если это сканер (без перебора всех event*)."""
+        path, self._hint = self._hint, None
+        if not path:
+            return None
+        try:
+            dev = InputDevice(path)
+        except OSError:
+            return None
+        try:
+            return path if self._is_scanner(dev) else None
+        finally:
+            dev.close()
+
     def connect(self):
         """Подключиться к сканеру с эксклюзивным захватом (grab).
 
@@ -112,7 +136,12 @@ class BarcodeReader:
         или работаем действительно headless без wm) — продолжаем без grab,
         предупреждение в лог.
         """
-        path = self.device_path or self.find_device()
+        path = self.device_path
+        if not path or not os.path.exists(path):
+            path = self._hinted_path() or path
+        path = path or self.find_device()
+        if path and self.configured_path and os.path.realpath(self.configured_path) == path:
+            path = self.configured_path  # подсказка hotplug — тот же сканер, путь оставляем стабильным
         if not path:
             raise FileNotFoundError(
                 f'Barcode scanner not found (filter: "{self.device_name_filter}"). '
@@ -184,25 +213,9 @@ class BarcodeReader:
                     continue
 
                 for event in self.device.read():
-                    # Обрабатываем только нажатия клавиш (не отпускания и не удержания)
-                    if event.type != ecodes.EV_KEY or event.value != 1:
-                        continue
-
-                    if event.code in ENTER_CODES:
-                        # Enter = конец штрихкода
-                        barcode = self._buffer.strip()
-                        self._buffer = ''
-                        if barcode:
-                            print(f'[Barcode] Completed by Enter (code={event.code})')
-                            return barcode
-                    else:
-                        # Добавить символ в буфер
-                        char = KEY_MAP.get(event.code)
-                        if char:
-                            self._buffer += char
-                            print(f'[Barcode] KEY {event.code} → {char}')
-                        else:
-                            print(f'[Barcode] Unknown KEY code: {event.code}')
+                    barcode = self._handle_event(event)
+                    if barcode:
+                        return barcode
 
         except (OSError, IOError) as e:
             print(f'[Barcode] Read error (device lost): {e}')
@@ -210,6 +223,56 @@ class BarcodeReader:
             self._buffer = ''
             return None
 
+    async def read_barcodes_async(self):
+        """
+        Асинхронный генератор штрихкодов (RUNTIME asyncio): события из
+        evdev async_read_loop(), сборка та же, что в read_barcode.
+        Завершается при потере устройства (после close()).
+        """
+        if not self.is_connected():
+            return
+        try:
+            async for event in self.device.async_read_loop():
+                barcode = self._handle_event(event)
+                if barcode:
+                    yield barcode
+        except (OSError, IOError) as e:
+            print(f'[Barcode] Read error (device lost): {e}')
+            self.close()
+            self._buffer = ''
+
+    def _handle_event(self, event):
+        """Учесть одно событие evdev. Возвращает штрихкод по Enter, иначе None."""
+        # Обрабатываем только нажатия клавиш (не отпускания и не удержания)
+        if event.type != ecodes.EV_KEY or event.value != 1:
+            return None
+
+        if event.code in ENTER_CODES:
+            # Enter = конец штрихкода
+            barcode = self._buffer.strip()
+            self._buffer = ''
+            if barcode:
+                self.last_scan_monotonic = self._scan_started
+                print(f'[Barcode] Completed by Enter (code={event.code})')
+                return barcode
+            return None
+
+        # Добавить символ в буфер
+        char = KEY_MAP.get(event.code)
+        if char:
+            if not self._buffer:
+                # Момент скана = первая клавиша (время события ядра → monotonic)
+                self._scan_started = time.monotonic() - (time.time() - event.timestamp())
+            self._buffer += char
+            print(f'[Barcode] KEY {event.code} → {char}')
+        else:
+            print(f'[Barcode] Unknown KEY code: {event.code}')
+        return None
+
+    def is_grabbed(self):
+        """Устройство захвачено эксклюзивно (grab) этим процессом."""
+        return self._grabbed and self.is_connected()
+
     def close(self):
         """Закрыть соединение со сканером (с ungrab, если был захвачен)."""
         if self.device:
@@ -227,15 +290,19 @@ class BarcodeReader:
             self._buffer = ''
 
     def reconnect(self, max_retries=5, delay=3):
-        """Попытаться переподключиться к сканеру."""
+        """Попытаться переподключиться к сканеру.
+
+        BARCODE_DEVICE задан — только он: автоопределение нашло бы первый
+        Honeywell, а это может быть сканер соседней станции."""
         self.close()
-        # Сбросить путь для повторного автоопределения
         saved_path = self.device_path
         for attempt in range(1, max_retries + 1):
             try:
                 print(f'[Barcode] Reconnecting (attempt {attempt}/{max_retries})...')
-                # Сначала попробовать тот же путь, потом автоопределение
-                if attempt <= 2 and saved_path:
+                if self.configured_path:
+                    self.device_path = self.configured_path
+                # Без настройки: сначала тот же путь, потом автоопределение
+                elif attempt <= 2 and saved_path:
                     self.device_path = saved_path
                 else:
                     self.device_path = None
@@ -243,5 +310,18 @@ class BarcodeReader:
                 return True
             except (FileNotFoundError, OSError, IOError) as e:
                 print(f'[Barcode] Reconnect failed: {e}')
-                time.sleep(delay)
+                if attempt < max_retries:
+                    self.wait_for_device(delay)
         return False
+
+    def wait_for_device(self, timeout):
+        """Пауза перед следующей попыткой: до события hotplug add или timeout."""
+        if self.hotplug is None:
+            time.sleep(timeout)
+            return
+        configured = self.configured_path
+        # by-path/by-id udev создаёт чуть позже узла — дождаться симлинка
+        symlink = configured if configured and configured.startswith(STABLE_PREFIXES) else None
+        devnode = self.hotplug.wait(timeout, settle_path=symlink)
+        if devnode and hint_matches(configured, devnode):
+            self._hint = devnode
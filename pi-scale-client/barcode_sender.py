@@ -0,0 +1,265 @@
+"""
+Доставка штрихкодов на сервер с подтверждением (ack).
+
+Каждый скан — и живой, и накопленный офлайн — сначала пишется в
+BarcodeQueue (SQLite), а отправитель вычитывает очередь пачками и шлёт
+`barcode:scan_batch` с ack-колбэком Socket.io. Строки удаляются одной
+транзакцией только после ответа сервера, поэтому обрыв сокета посреди
+отправки ничего не теряет: неподтверждённые пачки уходят повторно после
+переподключения, сервер отбрасывает повторы по scanId.
+
+Окно: не больше `window` пачек без ответа одновременно. Ответа нет дольше
+`ack_timeout` — пачка считается потерянной и отправляется заново.
+
+BarcodeSender — поток для socketio.Client; AsyncBarcodeSender — задача
+event loop для socketio.AsyncClient (pi_client_async.py), логика общая.
+
+metrics (metrics.Metrics, необязательно): scan_to_emit, barcode_ack,
+queue_write — см. metrics.py.
+
+index (barcode_index.BarcodeIndex, необязательно): скан уходит с known /
+plants из локального индекса штрихкодов.
+"""
+
+import asyncio
+import threading
+import time
+
+# Скан, доставленный позже этого после нажатия курка, помечается buffered
+BUFFERED_AFTER = 3.0
+
+
+class BarcodeSender:
+    def __init__(self, sio, queue, batch_size=50, window=4, ack_timeout=5.0, metrics=None, index=None):
+        self.sio = sio
+        self.queue = queue
+        self.index = index
+        self.batch_size = batch_size
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self._cond = threading.Condition()
+        self._inflight = {}   # batch_id → (row_ids, sent_at)
+        self._cursor = 0      # максимальный id, уже отправленный в этом соединении
+        self._epoch = 0       # меняется при сбросе курсора: прочитанное до сброса не отправляем
+        self._next_batch = 0
+        self._syncing = 0     # сканов в текущей синхронизации (pi:sync_*), 0 — нет
+        self._thread = None
+        self.sent = 0
+        self.acked = 0
+        self.retries = 0
+        self._h_scan = metrics.histogram('scan_to_emit', 'scan complete to barcode:scan_batch emit') if metrics else None
+        self._h_ack = metrics.histogram('barcode_ack', 'barcode:scan_batch emit to server ack') if metrics else None
+        self._h_write = metrics.histogram('queue_write', 'SQLite barcode queue write') if metrics else None
+
+    # ── Внешние события ──
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='barcode-sender', daemon=True)
+        self._thread.start()
+
+    def kick(self):
+        """Новый скан в очереди — разбудить отправителя."""
+        self._notify()
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify()
+
+    def _emit(self, event, data):
+        self.sio.emit(event, data)
+
+    def on_connect(self):
+        """(Пере)подключение: всё неподтверждённое отправить заново."""
+        backlog = self.queue.size()
+        with self._cond:
+            self._inflight.clear()
+            self._cursor = 0
+            self._epoch += 1
+            if backlog > 0:
+                self._syncing = backlog
+        self._notify()
+        if backlog > 0:
+            print(f'[Sender] Syncing {backlog} buffered barcode scan(s)...')
+            self._emit('pi:sync_start', {'barcodeCount': backlog})
+
+    def on_disconnect(self):
+        with self._cond:
+            self._inflight.clear()
+            self._cursor = 0
+            self._epoch += 1
+
+    def in_flight(self):
+        with self._cond:
+            return sum(len(ids) for ids, _ in self._inflight.values())
+
+    # ── Поток отправки ──
+    def _run(self):
+        while True:
+            try:
+                batch = self.next_batch()
+                if batch is None:
+                    with self._cond:
+                        self._cond.wait(timeout=0.5)
+                    continue
+                batch_id, scans = batch
+                self.sio.emit('barcode:scan_batch', {'scans': scans},
+                              callback=lambda *resp, b=batch_id: self._on_ack(b, resp))
+                self._sent(batch_id, scans)
+            except Exception as e:
+                print(f'[Sender] Error: {e}')
+                time.sleep(1)
+
+    def next_batch(self):
+        """
+        Следующая пачка к отправке: (batch_id, scans), уже учтённая как in-flight.
+        None — отправлять нечего: нет соединения, окно заполнено или очередь пуста.
+        """
+        while True:
+            with self._cond:
+                self._expire(time.monotonic())
+                if not self.sio.connected or len(self._inflight) >= self.window:
+                    return None
+                after, epoch = self._cursor, self._epoch
+            rows = self.queue.peek_batch(self.batch_size, after_id=after)
+            if not rows:
+                self._check_synced()
+                return None
+            now = time.time()
+            scans = []
+            for row_id, code, scanned_at, weight, unit, stable, scan_id, station in rows:
+                scan = {
+                    'scanId': scan_id or f'row-{row_id}-{scanned_at}',
+                    'barcode': code,
+                    'scannedAt': scanned_at,
+                    'buffered': now - scanned_at > BUFFERED_AFTER,
+                }
+                if station:
+                    scan['station'] = station
+                if weight is not None:
+                    scan['weight'] = weight
+                    scan['unit'] = unit or 'g'
+                    scan['stable'] = bool(stable)
+                if self.index is not None:
+                    scan.update(self.index.validate(code))
+                scans.append(scan)
+            row_ids = [r[0] for r in rows]
+            with self._cond:
+                if epoch != self._epoch:
+                    continue  # пока читали очередь, курсор сбросили — перечитать
+                batch_id = self._next_batch
+                self._next_batch += 1
+                self._inflight[batch_id] = (row_ids, time.monotonic())
+                self._cursor = row_ids[-1]
+            return batch_id, scans
+
+    def _sent(self, batch_id, scans):
+        self.sent += len(scans)
+        if self._h_scan is not None:
+            # Только живые сканы: офлайн-буфер ждал соединения, а не отправителя
+            now = time.time()
+            for scan in scans:
+                if not scan['buffered']:
+                    self._h_scan.observe_since(scan['scannedAt'], now)
+        print(f'[Sender] Sent batch #{batch_id}: {len(scans)} scan(s)')
+
+    def _on_ack(self, batch_id, resp):
+        """Ответ сервера (поток Socket.io): удалить пачку одной транзакцией."""
+        ack = resp[0] if resp else None
+        with self._cond:
+            entry = self._inflight.pop(batch_id, None)
+        if entry is None:
+            return  # истёк по таймауту или соединение сменилось — уйдёт повторно
+        row_ids, sent_at = entry
+        if self._h_ack is not None:
+            self._h_ack.observe_since(sent_at, time.monotonic())
+        if not isinstance(ack, dict) or not ack.get('ok'):
+            print(f'[Sender] Batch #{batch_id} rejected: {ack}')
+            self._rewind(row_ids)
+            return
+        t0 = time.monotonic()
+        self.queue.remove_batch(row_ids)
+        if self._h_write is not None:
+            self._h_write.observe_since(t0, time.monotonic())
+        self.acked += len(row_ids)
+        self._notify()
+        self._check_synced()
+
+    def _check_synced(self):
+        """Очередь пуста и ничего не ждёт ack — синхронизация закончена."""
+        with self._cond:
+            if not self._syncing or self._inflight or self.queue.size() > 0:
+                return
+            synced = self._syncing
+            self._syncing = 0
+        if self.sio.connected:
+            self._emit('pi:sync_complete', {'barcodeCount': synced})
+            print(f'[Sender] Sync complete: {synced} barcode(s) delivered')
+
+    def _rewind(self, row_ids):
+        """Отправить строки заново: курсор назад, до первой неподтверждённой."""
+        with self._cond:
+            self._cursor = min(self._cursor, row_ids[0] - 1)
+            self._epoch += 1
+            self.retries += len(row_ids)
+        self._notify()
+
+    def _expire(self, now):
+        """Пачки без ответа дольше ack_timeout — заново (вызывается под _cond)."""
+        for batch_id, (row_ids, sent_at) in list(self._inflight.items()):
+            if now - sent_at > self.ack_timeout:
+                del self._inflight[batch_id]
+                self._cursor = min(self._cursor, row_ids[0] - 1)
+                self._epoch += 1
+                self.retries += len(row_ids)
+                print(f'[Sender] Batch #{batch_id} not acked in {self.ack_timeout}s, resending')
+
+
+class AsyncBarcodeSender(BarcodeSender):
+    """
+    Тот же протокол для socketio.AsyncClient: задача в event loop вместо
+    потока. SQLite (чтение пачки, удаление по ack) уходит в пул потоков
+    loop'а, чтобы запись на SD-карту не задерживала чтение весов.
+    """
+
+    def __init__(self, sio, queue, batch_size=50, window=4, ack_timeout=5.0, metrics=None, index=None):
+        super().__init__(sio, queue, batch_size=batch_size, window=window, ack_timeout=ack_timeout,
+                         metrics=metrics, index=index)
+        self._loop = None
+        self._wake = asyncio.Event()
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread = self._loop.create_task(self._run_async())
+
+    def _notify(self):
+        # Может вызываться и из пула потоков (ack), и из самого loop
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _emit(self, event, data):
+        asyncio.run_coroutine_threadsafe(self.sio.emit(event, data), self._loop)
+
+    def _ack_callback(self, batch_id):
+        def ack(*resp):
+            self._loop.run_in_executor(None, self._on_ack, batch_id, resp)
+        return ack
+
+    async def _run_async(self):
+        while True:
+            try:
+                self._wake.clear()
+                batch = await asyncio.to_thread(self.next_batch)
+                if batch is None:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), 0.5)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                batch_id, scans = batch
+                await self.sio.emit('barcode:scan_batch', {'scans': scans},
+                                    callback=self._ack_callback(batch_id))
+                self._sent(batch_id, scans)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'[Sender] Error: {e}')
+                await asyncio.sleep(1)
@@ -0,0 +1,71 @@
+"""
+Политика отправки scale:weight на сервер.
+
+Пока мешок качается, весы дают до ~20 показаний/сек, и сервер рассылает
+каждое во все браузеры. Политика:
+  - не чаще max_rate событий/сек; промежуточные показания схлопываются,
+    последнее отправляется по истечении интервала (UI приходит к финальному весу)
+  - изменения меньше deadband (в единицах весов) не отправляются
+  - переходы stable/unstable и settled — всегда и сразу, без лимита
+  - keepalive: если событий не было дольше keepalive сек — повторить
+    последнее (сервер считает весы отключёнными без scale:weight 20 сек)
+"""
+
+
+class EmitPolicy:
+    def __init__(self, max_rate=5.0, deadband=1.0, keepalive=5.0):
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.deadband = deadband
+        self.keepalive = keepalive
+        self._last_time = None
+        self._last_weight = None
+        self._last_stable = None
+        self._last_payload = None
+        self._pending = None  # (weight, stable, payload) ждёт конца интервала
+        self.emitted = 0
+        self.suppressed = 0
+
+    def _take(self, now, weight, stable, payload):
+        self._last_time = now
+        self._last_weight = weight
+        self._last_stable = stable
+        self._last_payload = payload
+        self._pending = None
+        self.emitted += 1
+        return payload
+
+    def offer(self, now, weight, stable, payload, force=False):
+        """
+        Новое показание. Возвращает payload, если отправить сейчас, иначе None
+        (значение схлопнуто в pending или в пределах deadband).
+        """
+        if force or self._last_time is None or stable != self._last_stable:
+            return self._take(now, weight, stable, payload)
+        if abs(weight - self._last_weight) < self.deadband:
+            # То же, что уже показано — отменяет и отложенное промежуточное значение
+            if self._pending is not None:
+                self.suppressed += 1
+            self._pending = None
+            self.suppressed += 1
+            return None
+        if now - self._last_time >= self.min_interval:
+            return self._take(now, weight, stable, payload)
+        if self._pending is not None:
+            self.suppressed += 1
+        self._pending = (weight, stable, payload)
+        return None
+
+    def flush(self, now):
+        """Вызывать из цикла: отложенное значение или keepalive, если пора."""
+        if self._pending is not None and now - self._last_time >= self.min_interval:
+            return self._take(now, *self._pending)
+        if self._last_payload is not None and now - self._last_time >= self.keepalive:
+            return self._take(now, self._last_weight, self._last_stable, self._last_payload)
+        return None
+
+    def next_deadline(self, now):
+        """Через сколько секунд нужен flush (для таймаута ожидания)."""
+        if self._last_time is None:
+            return None
+        due = self._last_time + (self.min_interval if self._pending is not None else self.keepalive)
+        return max(0.0, due - now)
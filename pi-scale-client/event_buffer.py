@@ -2,7 +2,8 @@
 Offline event buffer for Pi client.
 
 Barcode scans are queued to SQLite (persist across restarts).
-Weight readings keep only the latest value in memory.
+Weight readings keep only the latest value in memory, plus a short
+time-indexed history (WeightHistory) to pair scans with the weight at scan time.
 
 SQLite используется потому что:
 - Атомарные записи (нет коррупции при обрыве питания)
@@ -14,6 +15,8 @@ import sqlite3
 import os
 import time
 import threading
+import uuid
+from array import array
 
 # DB рядом со скриптом
 DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'buffer.db')
@@ -21,11 +24,18 @@ MAX_QUEUE_SIZE = 1000
 
 
 class BarcodeQueue:
-    """Персистентная FIFO-очередь для штрихкодов, бэкенд — SQLite."""
+    """
+    Персистентная FIFO-очередь для штрихкодов, бэкенд — SQLite.
+
+    Размер очереди — счётчик в памяти: COUNT(*) только при открытии,
+    дальше push/remove/clear меняют его по rowcount (size() без SQLite).
+    Очередь пишет только этот процесс.
+    """
 
     def __init__(self, db_path=None):
         self.db_path = db_path or DEFAULT_DB_PATH
         self._lock = threading.Lock()
+        self._count = 0
         self._init_db()
 
     def _init_db(self):
@@ -49,21 +59,33 @@ class BarcodeQueue:
                 conn.execute('ALTER TABLE barcode_queue ADD COLUMN weight_unit TEXT')
                 conn.execute('ALTER TABLE barcode_queue ADD COLUMN weight_stable INTEGER')
                 print('[Buffer] Migrated barcode_queue: added weight columns')
+            if 'scan_id' not in columns:
+                # Уникальный id скана: сервер по нему отбрасывает повторы (ack мог потеряться)
+                conn.execute('ALTER TABLE barcode_queue ADD COLUMN scan_id TEXT')
+                print('[Buffer] Migrated barcode_queue: added scan_id column')
+            if 'station' not in columns:
+                # Станция (весы + сканер), с которой пришёл скан — STATIONS в pi_client
+                conn.execute('ALTER TABLE barcode_queue ADD COLUMN station TEXT')
+                print('[Buffer] Migrated barcode_queue: added station column')
             conn.commit()
+            self._count = conn.execute('SELECT COUNT(*) FROM barcode_queue').fetchone()[0]
             conn.close()
 
-    def push(self, barcode, weight=None, unit=None, stable=None):
-        """Добавить штрихкод (+ вес) в очередь. Возвращает текущий размер очереди."""
+    def push(self, barcode, weight=None, unit=None, stable=None, station=None, scanned_at=None):
+        """Добавить штрихкод (+ вес, станция) в очередь. Возвращает текущий размер очереди.
+        scanned_at — time.time() окончания скана (по умолчанию — момент записи).
+        """
         now = time.time()
+        scanned_at = scanned_at or now
         with self._lock:
             try:
                 conn = sqlite3.connect(self.db_path)
                 conn.execute(
-                    'INSERT INTO barcode_queue (barcode, scanned_at, created_at, weight, weight_unit, weight_stable) VALUES (?, ?, ?, ?, ?, ?)',
-                    (barcode, now, now, weight, unit, 1 if stable else (0 if stable is not None else None))
+                    'INSERT INTO barcode_queue (barcode, scanned_at, created_at, weight, weight_unit, weight_stable, scan_id, station) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (barcode, scanned_at, now, weight, unit, 1 if stable else (0 if stable is not None else None), uuid.uuid4().hex, station)
                 )
                 # Ограничение размера — удалить старейшие
-                count = conn.execute('SELECT COUNT(*) FROM barcode_queue').fetchone()[0]
+                count = self._count + 1
                 if count > MAX_QUEUE_SIZE:
                     excess = count - MAX_QUEUE_SIZE
                     conn.execute('''
@@ -72,10 +94,11 @@ class BarcodeQueue:
                         )
                     ''', (excess,))
                     print(f'[Buffer] Dropped {excess} oldest barcode(s) — queue full ({MAX_QUEUE_SIZE})')
+                    count = MAX_QUEUE_SIZE
                 conn.commit()
-                size = conn.execute('SELECT COUNT(*) FROM barcode_queue').fetchone()[0]
                 conn.close()
-                return size
+                self._count = count
+                return count
             except sqlite3.OperationalError as e:
                 if 'disk' in str(e).lower() or 'full' in str(e).lower():
                     print(f'[Buffer] CRITICAL: SD card full, cannot buffer barcode: {barcode}')
@@ -94,31 +117,42 @@ class BarcodeQueue:
             conn.close()
             return rows
 
+    def peek_batch(self, limit, after_id=0):
+        """Следующие `limit` записей с id > after_id (в порядке FIFO).
+        Возвращает [(id, barcode, scanned_at, weight, weight_unit, weight_stable, scan_id, station), ...].
+        """
+        with self._lock:
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute(
+                'SELECT id, barcode, scanned_at, weight, weight_unit, weight_stable, scan_id, station FROM barcode_queue '
+                'WHERE id > ? ORDER BY id ASC LIMIT ?', (after_id, limit)
+            ).fetchall()
+            conn.close()
+            return rows
+
     def remove(self, row_id):
         """Удалить запись по id (после успешной отправки)."""
         with self._lock:
             conn = sqlite3.connect(self.db_path)
-            conn.execute('DELETE FROM barcode_queue WHERE id = ?', (row_id,))
+            deleted = conn.execute('DELETE FROM barcode_queue WHERE id = ?', (row_id,)).rowcount
             conn.commit()
             conn.close()
+            self._count -= deleted
 
     def remove_batch(self, row_ids):
-        """Удалить несколько записей по id."""
+        """Удалить несколько записей по id (одной транзакцией)."""
         if not row_ids:
             return
         with self._lock:
             conn = sqlite3.connect(self.db_path)
-            conn.executemany('DELETE FROM barcode_queue WHERE id = ?', [(rid,) for rid in row_ids])
+            deleted = conn.executemany('DELETE FROM barcode_queue WHERE id = ?', [(rid,) for rid in row_ids]).rowcount
             conn.commit()
             conn.close()
+            self._count -= deleted
 
     def size(self):
-        """Текущий размер очереди."""
-        with self._lock:
-            conn = sqlite3.connect(self.db_path)
-            count = conn.execute('SELECT COUNT(*) FROM barcode_queue').fetchone()[0]
-            conn.close()
-            return count
+        """Текущий размер очереди (счётчик в памяти, без обращения к SQLite)."""
+        return self._count
 
     def clear(self):
         """Очистить всю очередь."""
@@ -127,6 +161,7 @@ class BarcodeQueue:
             conn.execute('DELETE FROM barcode_queue')
             conn.commit()
             conn.close()
+            self._count = 0
 
 
 class LatestWeightBuffer:
@@ -157,3 +192,107 @@ class LatestWeightBuffer:
         """Есть ли буферизованное значение."""
         with self._lock:
             return self._weight is not None
+
+
+# Флаги показания в WeightHistory
+FLAG_STABLE = 1   # флаг стабильности от весов
+FLAG_SETTLED = 2  # settled по детектору на Pi (settle_detector.py)
+
+
+class WeightHistory:
+    """
+    Кольцевой буфер показаний весов фиксированного размера на массивах
+    (array: время monotonic, вес, флаги) — без аллокаций на каждую запись.
+
+    Пишет главный цикл весов, читает поток сканера: поиск показания на
+    момент скана — бинарный поиск по времени, O(log n).
+    """
+
+    def __init__(self, capacity=1200):  # ~60 сек при 20 показаниях/сек
+        self._lock = threading.Lock()
+        self.capacity = capacity
+        self._t = array('d', bytes(8 * capacity))
+        self._w = array('d', bytes(8 * capacity))
+        self._f = array('B', bytes(capacity))
+        self._start = 0   # физический индекс самого старого
+        self._count = 0
+        self.unit = 'g'
+
+    def append(self, t, weight, unit, stable=False, settled=False):
+        """Записать показание (t — time.monotonic(), по возрастанию)."""
+        with self._lock:
+            i = (self._start + self._count) % self.capacity
+            if self._count == self.capacity:
+                self._start = (self._start + 1) % self.capacity
+            else:
+                self._count += 1
+            self._t[i] = t
+            self._w[i] = weight
+            self._f[i] = (FLAG_STABLE if stable else 0) | (FLAG_SETTLED if settled else 0)
+            self.unit = unit
+
+    def _phys(self, k):
+        return (self._start + k) % self.capacity
+
+    def _bisect_right(self, t):
+        """Логический индекс первого показания с временем > t (под lock)."""
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._t[self._phys(mid)] <= t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _sample(self, k):
+        i = self._phys(k)
+        f = self._f[i]
+        return self._t[i], self._w[i], bool(f & FLAG_STABLE), bool(f & FLAG_SETTLED)
+
+    def at(self, t):
+        """Показание, действовавшее в момент t: (t, weight, stable, settled) или None."""
+        with self._lock:
+            k = self._bisect_right(t) - 1
+            if k < 0:
+                return None
+            return self._sample(k)
+
+    def lookup(self, t, before=1.5, after=0.5):
+        """
+        Вес для скана в момент t: ближайшее к t стабильное/settled показание
+        в окне [t - before, t + after], иначе показание на момент t.
+        Возвращает (weight, unit, stable) или None (истории нет).
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            k = self._bisect_right(t)
+            best = None
+            # Назад от момента скана — мешок обычно уже лежал и успокоился
+            j = k - 1
+            while j >= 0:
+                st, w, stable, settled = self._sample(j)
+                if st < t - before:
+                    break
+                if stable or settled:
+                    best = (t - st, w)
+                    break
+                j -= 1
+            # Вперёд — показания, пришедшие уже после скана (до обработки)
+            j = k
+            while j < self._count:
+                st, w, stable, settled = self._sample(j)
+                if st > t + after or (best is not None and st - t >= best[0]):
+                    break
+                if stable or settled:
+                    best = (st - t, w)
+                    break
+                j += 1
+            if best is not None:
+                return (best[1], self.unit, True)
+            if k - 1 >= 0:
+                _st, w, stable, _settled = self._sample(k - 1)
+                return (w, self.unit, stable)
+            _st, w, stable, _settled = self._sample(0)
+            return (w, self.unit, stable)
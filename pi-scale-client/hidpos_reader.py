@@ -0,0 +1,235 @@
+"""
+Чтение сканера штрихкодов в режиме HID POS через /dev/hidrawN.
+
+В режиме клавиатуры (barcode_reader.py) каждый символ — отдельное событие
+нажатия, строка собирается через KEY_MAP до Enter: набор символов ограничен
+картой, порядок зависит от таймингов USB/GIL. В режиме HID POS (USB HID
+Point of Sale, usage page 0x8C) сканер отдаёт весь штрихкод в одном
+input-отчёте: никакой раскладки, любые байты, один read() на скан.
+
+Honeywell Voyager 1470g: включается штрихкодом "USB HID POS" из
+User's Guide (интерфейс PAP131 / "HID POS"). Формат input-отчёта
+(64 байта, report ID 0x02):
+
+    [0]      0x02 — report ID
+    [1]      длина данных в этом отчёте (0..56)
+    [2:5]    AIM-идентификатор символики (напр. "]E0" — EAN-13, "]C1" — GS1-128)
+    [5:61]   данные штрихкода
+    [61]     код символики Honeywell (HHP Code ID)
+    [62]     резерв
+    [63]     бит 0 = продолжение: штрихкод длиннее 56 байт, следующий
+             отчёт дописывает данные
+
+Требования: доступ к /dev/hidrawN (udev-правило для группы input или
+plugdev); evdev не нужен.
+"""
+
+import asyncio
+import glob
+import os
+import select
+import time
+
+REPORT_ID_SCAN = 0x02
+REPORT_SIZE = 64
+DATA_OFFSET = 5
+DATA_MAX = 56
+FLAG_CONTINUED = 0x01
+
+HID_POS_USAGE_PAGE = (b'\x06\x8c\x00', b'\x05\x8c')  # Usage Page (Bar Code Scanner)
+
+
+def _sysfs_name(hidraw):
+    """HID_NAME устройства из /sys/class/hidraw/<hidrawN>/device/uevent."""
+    try:
+        with open(f'/sys/class/hidraw/{hidraw}/device/uevent') as f:
+            for line in f:
+                if line.startswith('HID_NAME='):
+                    return line.split('=', 1)[1].strip()
+    except OSError:
+        pass
+    return ''
+
+
+def _is_hid_pos(hidraw):
+    """В report descriptor есть usage page 0x8C (HID POS barcode scanner)."""
+    try:
+        with open(f'/sys/class/hidraw/{hidraw}/device/report_descriptor', 'rb') as f:
+            desc = f.read()
+    except OSError:
+        return False
+    return any(p in desc for p in HID_POS_USAGE_PAGE)
+
+
+class HidPosReader:
+    """Чтение штрихкодов через hidraw (HID POS). Интерфейс как у BarcodeReader."""
+
+    HOTPLUG_MATCH = ('hidraw', ('hidraw',))  # для hotplug.HotplugMonitor.attach
+
+    def __init__(self, device_path=None, device_name_filter=None):
+        """
+        Args:
+            device_path: Явный путь (напр. /dev/hidraw1). None — автоопределение
+                         по usage page 0x8C в report descriptor.
+            device_name_filter: Подстрока имени (по умолчанию 'Honeywell') —
+                                для выбора, если HID POS устройств несколько.
+        """
+        self.device_path = device_path
+        self.configured_path = device_path  # задан — автоопределения при reconnect нет
+        self.device_name_filter = device_name_filter or 'Honeywell'
+        self.fd = None
+        self._data = bytearray()
+        self._scan_started = None
+        self.last_scan_monotonic = None  # время (monotonic) начала последнего скана
+        self.last_symbology = None       # AIM-идентификатор последнего скана
+        self.hotplug = None              # hotplug.Watch
+
+    def find_device(self):
+        """Найти hidraw-интерфейс HID POS. Возвращает путь или None."""
+        candidates = []
+        for path in sorted(glob.glob('/sys/class/hidraw/hidraw*')):
+            hidraw = os.path.basename(path)
+            if not _is_hid_pos(hidraw):
+                continue
+            name = _sysfs_name(hidraw)
+            print(f'[Barcode] Found HID POS interface: {name} at /dev/{hidraw}')
+            if self.device_name_filter.lower() in name.lower():
+                candidates.insert(0, f'/dev/{hidraw}')
+            else:
+                candidates.append(f'/dev/{hidraw}')
+        return candidates[0] if candidates else None
+
+    def connect(self):
+        path = self.device_path or self.find_device()
+        if not path:
+            raise FileNotFoundError(
+                'HID POS scanner not found (no hidraw device with usage page 0x8C). '
+                'Switch the scanner to USB HID POS mode and check /dev/hidraw* permissions.'
+            )
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.device_path = path
+        self._data.clear()
+        print(f'[Barcode] Connected (HID POS): {_sysfs_name(os.path.basename(path)) or path} ({path})')
+
+    def is_connected(self):
+        if self.fd is None:
+            return False
+        try:
+            os.stat(self.device_path)
+            return True
+        except OSError:
+            return False
+
+    def is_grabbed(self):
+        """hidraw не захватывается: сканер в режиме HID POS не печатает в фокусное окно."""
+        return None
+
+    def _handle_report(self, report):
+        """Учесть один input-отчёт. Возвращает штрихкод, когда он полный, иначе None."""
+        if len(report) < REPORT_SIZE or report[0] != REPORT_ID_SCAN:
+            return None
+        length = min(report[1], DATA_MAX)
+        if not self._data:
+            self._scan_started = time.monotonic()
+            self.last_symbology = bytes(report[2:5]).decode('ascii', errors='replace')
+        self._data += report[DATA_OFFSET:DATA_OFFSET + length]
+        if report[REPORT_SIZE - 1] & FLAG_CONTINUED:
+            return None
+        barcode = bytes(self._data).decode('utf-8', errors='replace').strip('\r\n\x00')
+        self._data.clear()
+        if not barcode:
+            return None
+        self.last_scan_monotonic = self._scan_started
+        print(f'[Barcode] HID POS report: {len(barcode)} byte(s), symbology {self.last_symbology}')
+        return barcode
+
+    def read_barcode(self, timeout=None):
+        """
+        Прочитать один штрихкод (блокирующий вызов, как BarcodeReader.read_barcode).
+        None — таймаут или устройство пропало (is_connected() станет False).
+        """
+        if not self.is_connected():
+            return None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                wait = 5.0 if deadline is None else deadline - time.monotonic()
+                if wait <= 0:
+                    return None
+                r, _, _ = select.select([self.fd], [], [], min(wait, 5.0))
+                if not r:
+                    continue
+                report = os.read(self.fd, REPORT_SIZE)
+                if not report:
+                    raise OSError('hidraw returned EOF')
+                barcode = self._handle_report(report)
+                if barcode:
+                    return barcode
+        except OSError as e:
+            print(f'[Barcode] Read error (device lost): {e}')
+            self.close()
+            return None
+
+    async def read_barcodes_async(self):
+        """Асинхронный генератор штрихкодов (fd в event loop). Завершается при потере устройства."""
+        if not self.is_connected():
+            return
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+        fd = self.fd
+        loop.add_reader(fd, ready.set)
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                while True:
+                    try:
+                        report = os.read(fd, REPORT_SIZE)
+                    except BlockingIOError:
+                        break
+                    if not report:
+                        raise OSError('hidraw returned EOF')
+                    barcode = self._handle_report(report)
+                    if barcode:
+                        yield barcode
+        except OSError as e:
+            print(f'[Barcode] Read error (device lost): {e}')
+        finally:
+            loop.remove_reader(fd)
+            self.close()
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+        self._data.clear()
+
+    def reconnect(self, max_retries=5, delay=3):
+        """Попытаться переподключиться: настроенный путь, иначе тот же путь,
+        потом автоопределение (оно может найти сканер соседней станции)."""
+        self.close()
+        saved_path = self.device_path
+        for attempt in range(1, max_retries + 1):
+            try:
+                print(f'[Barcode] Reconnecting HID POS (attempt {attempt}/{max_retries})...')
+                if self.configured_path:
+                    self.device_path = self.configured_path
+                else:
+                    self.device_path = saved_path if attempt <= 2 and saved_path else None
+                self.connect()
+                return True
+            except OSError as e:
+                print(f'[Barcode] Reconnect failed: {e}')
+                if attempt < max_retries:
+                    self.wait_for_device(delay)
+        return False
+
+    def wait_for_device(self, timeout):
+        """Пауза перед следующей попыткой: до события hotplug add или timeout."""
+        if self.hotplug is None:
+            time.sleep(timeout)
+        else:
+            self.hotplug.wait(timeout)
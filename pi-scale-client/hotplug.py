@@ -0,0 +1,188 @@
+"""
+Мониторинг подключения USB-устройств (hotplug) через netlink uevent.
+
+Без монитора переподключение весов и сканера — цикл попыток с
+time.sleep(delay), а BarcodeReader.find_device на каждой попытке открывает
+все /dev/input/event*. С монитором reconnect ждёт не таймер, а событие
+ядра "add" для нужного устройства и подключается сразу к его узлу
+(/dev/ttyUSB0, /dev/input/event5) — через миллисекунды после втыкания.
+
+Источник — сокет NETLINK_KOBJECT_UEVENT, группа ядра (1): сообщения
+"add@/devices/...\\0SUBSYSTEM=tty\\0DEVNAME=ttyUSB0\\0...". Без pyudev и без
+опроса. Событие ядра приходит раньше, чем udev выставит права и создаст
+симлинки /dev/serial/by-id/*, поэтому после события узел коротко
+дожидаемся (до SETTLE_TIMEOUT), прежде чем открыть.
+
+Фильтр устройства: подсистема + префикс DEVNAME (+ опционально USB
+vendor:product, ищется вверх по дереву sysfs от устройства).
+"""
+
+import os
+import socket
+import threading
+import time
+
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_GROUP = 1
+SETTLE_TIMEOUT = 2.0   # ждать права/симлинки после события, сек
+SETTLE_STEP = 0.01
+STALE_AFTER = 10.0     # add старше — не подсказка для reconnect (чужое/давнее событие)
+# Стабильные пути: указывают на конкретное устройство, а не на порядок подключения
+STABLE_PREFIXES = ('/dev/serial/', '/dev/input/by-', '/dev/usb/')
+
+
+def parse_uevent(data):
+    """Сообщение ядра → dict (ACTION, DEVPATH, SUBSYSTEM, DEVNAME, ...) или None."""
+    if data.startswith(b'libudev'):
+        return None  # сообщения udev (группа 2) — бинарный заголовок, не слушаем
+    parts = data.split(b'\0')
+    head = parts[0].decode('ascii', errors='ignore')
+    if '@' not in head:
+        return None
+    event = {}
+    for part in parts[1:]:
+        key, sep, value = part.partition(b'=')
+        if sep:
+            event[key.decode('ascii', errors='ignore')] = value.decode('utf-8', errors='ignore')
+    event.setdefault('ACTION', head.split('@', 1)[0])
+    event.setdefault('DEVPATH', head.split('@', 1)[1])
+    return event
+
+
+def usb_id(devpath):
+    """'vvvv:pppp' ближайшего USB-устройства вверх по sysfs от devpath, или None."""
+    path = '/sys' + devpath
+    while path.startswith('/sys/devices'):
+        try:
+            with open(os.path.join(path, 'idVendor')) as f:
+                vendor = f.read().strip()
+            with open(os.path.join(path, 'idProduct')) as f:
+                product = f.read().strip()
+            return f'{vendor}:{product}'.lower()
+        except OSError:
+            path = os.path.dirname(path)
+    return None
+
+
+def hint_matches(configured, devnode):
+    """
+    Подходит ли узел из события add к настроенному пути устройства.
+
+    С несколькими станциями add чужих весов/сканера приходит всем подпискам
+    (фильтр — только подсистема и префикс имени). Стабильный путь
+    (by-id/by-path) принимает узел, только если указывает на него.
+    Автоопределение или /dev/ttyUSB0 — любой: адаптер мог вернуться под
+    другим именем.
+    """
+    if not configured:
+        return True
+    if os.path.realpath(configured) == devnode:
+        return True
+    return not configured.startswith(STABLE_PREFIXES)
+
+
+class Watch:
+    """Подписка на появление одного устройства (см. HotplugMonitor.watch)."""
+
+    def __init__(self, name, subsystem, devname_prefixes, usb_ids=None):
+        self.name = name
+        self.subsystem = subsystem
+        self.devname_prefixes = tuple(devname_prefixes)
+        self.usb_ids = {i.lower() for i in usb_ids} if usb_ids else None
+        self._cond = threading.Condition()
+        self._added = None   # /dev/... последнего подходящего add
+        self._added_at = 0.0 # time.monotonic() этого add
+
+    def matches(self, event):
+        if event.get('SUBSYSTEM') != self.subsystem:
+            return False
+        devname = event.get('DEVNAME', '')
+        if not devname.startswith(self.devname_prefixes):
+            return False
+        if self.usb_ids is not None and usb_id(event.get('DEVPATH', '')) not in self.usb_ids:
+            return False
+        return True
+
+    def _notify(self, devnode):
+        with self._cond:
+            self._added = devnode
+            self._added_at = time.monotonic()
+            self._cond.notify_all()
+
+    def wait(self, timeout, settle_path=None):
+        """
+        Ждать появления устройства до timeout сек.
+        Возвращает /dev-узел (права выставлены, settle_path существует) или None.
+        """
+        with self._cond:
+            # Свежий add (пришёл во время неудачной попытки) не теряем; давний —
+            # чужой replug, который никто не ждал, — сбрасываем
+            if self._added is not None and time.monotonic() - self._added_at > STALE_AFTER:
+                self._added = None
+            self._cond.wait_for(lambda: self._added is not None, timeout)
+            devnode = self._added
+            self._added = None
+        if devnode is None:
+            return None
+        # udev ещё ставит права/симлинки — коротко дождаться
+        deadline = time.monotonic() + SETTLE_TIMEOUT
+        while time.monotonic() < deadline:
+            if os.access(devnode, os.R_OK | os.W_OK) and (settle_path is None or os.path.exists(settle_path)):
+                break
+            time.sleep(SETTLE_STEP)
+        return devnode
+
+
+class HotplugMonitor:
+    """Поток чтения netlink uevent; раздаёт события add подпискам (Watch)."""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_KOBJECT_UEVENT)
+        self.sock.bind((0, KERNEL_GROUP))
+        self._watches = []
+        self._thread = None
+        self.events = 0
+
+    @classmethod
+    def create(cls):
+        """Монитор или None, если netlink недоступен (не Linux / нет прав)."""
+        try:
+            monitor = cls()
+        except (AttributeError, OSError) as e:
+            print(f'[Hotplug] netlink uevent unavailable ({e}), falling back to timed retries')
+            return None
+        monitor.start()
+        return monitor
+
+    def watch(self, name, subsystem, devname_prefixes, usb_ids=None):
+        w = Watch(name, subsystem, devname_prefixes, usb_ids)
+        self._watches.append(w)
+        return w
+
+    def attach(self, name, reader, usb_ids=None):
+        """Подписать reader (ScaleReader/BarcodeReader/HidPosReader) по его HOTPLUG_MATCH."""
+        subsystem, prefixes = reader.HOTPLUG_MATCH
+        reader.hotplug = self.watch(name, subsystem, prefixes, usb_ids)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='hotplug', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError as e:
+                print(f'[Hotplug] netlink read error: {e}')
+                time.sleep(1)
+                continue
+            event = parse_uevent(data)
+            if event is None or event.get('ACTION') not in ('add', 'remove'):
+                continue
+            self.events += 1
+            for w in self._watches:
+                if w.matches(event):
+                    devnode = '/dev/' + event['DEVNAME']
+                    print(f'[Hotplug] {w.name}: {event["ACTION"]} {devnode}')
+                    if event['ACTION'] == 'add':
+                        w._notify(devnode)
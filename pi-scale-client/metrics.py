@@ -0,0 +1,201 @@
+"""
+Метрики задержек pi_client: гистограммы с фиксированными корзинами.
+
+Что меряется (миллисекунды):
+  frame_to_emit   — строка с весов пришла (ScaleStream) → scale:weight отправлен
+  scan_to_emit    — скан закончен (Enter / последний HID POS отчёт) → скан
+                    ушёл в barcode:scan_batch (только живые сканы, не офлайн-буфер)
+  barcode_ack     — barcode:scan_batch отправлен → ack сервера
+  loop_lag        — опоздание пробуждения главного цикла (поток/event loop занят)
+  flush           — досылка буферизованного веса после переподключения
+  queue_write     — запись в SQLite-очередь (push / удаление по ack)
+
+observe() — O(число корзин) под коротким lock, без аллокаций; квантили
+оцениваются по верхней границе корзины (как histogram_quantile в Prometheus).
+
+Локальный endpoint (METRICS_PORT, только 127.0.0.1 по умолчанию):
+  GET /metrics       — текстовый формат Prometheus
+  GET /metrics.json  — то же, что summary() в scale:debug, плюс корзины
+"""
+
+import asyncio
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Верхние границы корзин, мс (последняя — +Inf)
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    def __init__(self, name, help_text='', bounds=BUCKETS_MS):
+        self.name = name
+        self.help = help_text
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        i = bisect.bisect_left(self.bounds, value_ms)
+        with self._lock:
+            self._counts[i] += 1
+            self.count += 1
+            self.sum += value_ms
+            if value_ms > self.max:
+                self.max = value_ms
+
+    def observe_since(self, start, now):
+        """Наблюдение now - start (секунды) в мс."""
+        self.observe((now - start) * 1000.0)
+
+    def _quantile(self, counts, total, q):
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            seen += c
+            if seen >= rank:
+                # Верхняя граница корзины, но не больше наблюдённого максимума
+                return min(self.bounds[i], round(self.max, 2)) if i < len(self.bounds) else round(self.max, 2)
+        return round(self.max, 2)
+
+    def summary(self):
+        """{count, avg, p50, p95, p99, max} в мс ({count: 0}, если наблюдений не было)."""
+        with self._lock:
+            counts = list(self._counts)
+            total, total_sum, top = self.count, self.sum, self.max
+        if not total:
+            return {'count': 0}
+        return {
+            'count': total,
+            'avg': round(total_sum / total, 2),
+            'p50': self._quantile(counts, total, 0.50),
+            'p95': self._quantile(counts, total, 0.95),
+            'p99': self._quantile(counts, total, 0.99),
+            'max': round(top, 2),
+        }
+
+    def buckets(self):
+        """Накопленные счётчики по корзинам: [(le, count), ...], последняя le = '+Inf'."""
+        with self._lock:
+            counts = list(self._counts)
+        out, seen = [], 0
+        for i, c in enumerate(counts):
+            seen += c
+            out.append((self.bounds[i] if i < len(self.bounds) else '+Inf', seen))
+        return out
+
+
+class Metrics:
+    """Набор гистограмм + счётчики-gauge (размер очереди и т.п.) одного процесса."""
+
+    def __init__(self, prefix='pi_client'):
+        self.prefix = prefix
+        self._histograms = {}
+        self._gauges = {}   # name → callable без аргументов
+
+    def histogram(self, name, help_text=''):
+        h = self._histograms.get(name)
+        if h is None:
+            h = self._histograms[name] = Histogram(name, help_text)
+        return h
+
+    def gauge(self, name, fn):
+        """Значение, читаемое при выдаче (должно быть дешёвым — без SQLite)."""
+        self._gauges[name] = fn
+
+    def summary(self):
+        """Компактно для scale:debug: {имя: {count, avg, p50, p95, p99, max}}."""
+        return {name: h.summary() for name, h in self._histograms.items()}
+
+    def to_json(self):
+        data = {'latencyMs': {}, 'gauges': {}}
+        for name, h in self._histograms.items():
+            data['latencyMs'][name] = dict(h.summary(), buckets=h.buckets())
+        for name, fn in self._gauges.items():
+            data['gauges'][name] = fn()
+        return json.dumps(data)
+
+    def to_prometheus(self):
+        lines = []
+        for name, h in self._histograms.items():
+            metric = f'{self.prefix}_{name}_ms'
+            if h.help:
+                lines.append(f'# HELP {metric} {h.help}')
+            lines.append(f'# TYPE {metric} histogram')
+            for le, count in h.buckets():
+                lines.append(f'{metric}_bucket{{le="{le}"}} {count}')
+            lines.append(f'{metric}_sum {h.sum:.3f}')
+            lines.append(f'{metric}_count {h.count}')
+        for name, fn in self._gauges.items():
+            metric = f'{self.prefix}_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {float(fn())}')
+        return '\n'.join(lines) + '\n'
+
+    def render(self, path):
+        """(status, content_type, body) для GET path."""
+        if path in ('/metrics', '/'):
+            return 200, 'text/plain; version=0.0.4', self.to_prometheus()
+        if path == '/metrics.json':
+            return 200, 'application/json', self.to_json()
+        return 404, 'text/plain', 'not found\n'
+
+    # ── Локальный HTTP endpoint ──
+    def serve(self, port, host='127.0.0.1'):
+        """Поток с HTTP-сервером (pi_client.py). Возвращает сервер или None."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, ctype, body = metrics.render(self.path.split('?', 1)[0])
+                data = body.encode()
+                self.send_response(status)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, fmt, *args):
+                pass  # без строки в журнале на каждый scrape
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f'[Metrics] Cannot listen on {host}:{port}: {e}')
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        print(f'[Metrics] http://{host}:{port}/metrics')
+        return server
+
+    async def serve_async(self, port, host='127.0.0.1'):
+        """То же в event loop (pi_client_async.py): минимальный HTTP/1.0 GET."""
+        async def handle(reader, writer):
+            try:
+                request = await asyncio.wait_for(reader.readline(), 5)
+                parts = request.decode('latin-1').split()
+                path = parts[1].split('?', 1)[0] if len(parts) >= 2 else '/'
+                while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                    pass  # заголовки не нужны
+                status, ctype, body = self.render(path)
+                data = body.encode()
+                reason = 'OK' if status == 200 else 'Not Found'
+                writer.write(f'HTTP/1.0 {status} {reason}\r\nContent-Type: {ctype}\r\n'
+                             f'Content-Length: {len(data)}\r\n\r\n'.encode() + data)
+                await writer.drain()
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        try:
+            server = await asyncio.start_server(handle, host, port)
+        except OSError as e:
+            print(f'[Metrics] Cannot listen on {host}:{port}: {e}')
+            return None
+        print(f'[Metrics] http://{host}:{port}/metrics')
+        return server
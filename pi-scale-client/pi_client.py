@@ -6,8 +6,13 @@ Farm Pi Client — клиент для Raspberry Pi.
   1. Весы (Ohaus R31P3) — serial port, непрерывные показания веса
   2. Сканер штрихкодов (Honeywell Voyager XP 1470) — HID input, скан при нажатии
 
+Пар весы + сканер (станций) может быть несколько — STATIONS в .env
+(stations.py). Каждая станция читается своими потоками и со своими
+буферами; события идут с полем station через одно Socket.io-соединение.
+
 Использование:
   python pi_client.py
+  python pi_client_async.py   # то же на asyncio (один event loop, см. там)
 
 Конфигурация через .env файл (см. .env.example).
 """
@@ -15,46 +20,53 @@ Farm Pi Client — клиент для Raspberry Pi.
 import os
 import sys
 import time
-import socket as stdlib_socket
 import threading
 from datetime import datetime
 import socketio
 from dotenv import load_dotenv
-from scale_reader import ScaleReader
-from event_buffer import BarcodeQueue, LatestWeightBuffer
-
-
-# ── Systemd watchdog (без внешних зависимостей) ──
-def sd_notify(state):
-    """Отправить уведомление в systemd (sd_notify protocol)."""
-    addr = os.environ.get('NOTIFY_SOCKET')
-    if not addr:
-        return  # Не запущены под systemd или WatchdogSec не настроен
-    if addr[0] == '@':
-        addr = '\0' + addr[1:]  # abstract socket
-    sock = stdlib_socket.socket(stdlib_socket.AF_UNIX, stdlib_socket.SOCK_DGRAM)
-    try:
-        sock.connect(addr)
-        sock.sendall(state.encode())
-    finally:
-        sock.close()
+from scale_reader import ScaleStream
+from event_buffer import BarcodeQueue
+from barcode_index import BarcodeIndex
+from barcode_sender import BarcodeSender
+from stations import Station, load_stations
+from sd_notify import sd_notify
+from hotplug import HotplugMonitor
+from metrics import Metrics
+from status_socket import StatusSocket, DEFAULT_PATH as STATUS_SOCKET_PATH
+
 
 # Загрузить .env из текущей директории
 load_dotenv()
 
 # ── Конфигурация ──
+# Порт/сканер/протокол — на станцию (stations.py: SERIAL_PORT, BARCODE_DEVICE, ... или STATIONS)
 SERVER_URL = os.getenv('SERVER_URL', 'http://localhost:5000')
 SCALE_API_KEY = os.getenv('SCALE_API_KEY', '')
-SERIAL_PORT = os.getenv('SERIAL_PORT', '/dev/ttyUSB0')
-BAUD_RATE = int(os.getenv('BAUD_RATE', '9600'))
-READ_INTERVAL = float(os.getenv('READ_INTERVAL', '0.05'))  # секунды между чтениями
+IP_POLL_INTERVAL = float(os.getenv('IP_POLL_INTERVAL', '0.3'))  # IP-запрос, если CP молчит (нестабильный вес)
 SCALE_MODE = os.getenv('SCALE_MODE', 'continuous')
-BARCODE_DEVICE = os.getenv('BARCODE_DEVICE', '')  # путь к /dev/input/eventX или пусто для автоопределения
+SETTLE_WINDOW = float(os.getenv('SETTLE_WINDOW', '0.6'))        # окно детектора успокоения, сек
+SETTLE_TOLERANCE = float(os.getenv('SETTLE_TOLERANCE', '0.5'))  # допуск разброса в окне, г
+EMIT_MAX_RATE = float(os.getenv('EMIT_MAX_RATE', '5'))          # макс. scale:weight в секунду
+EMIT_DEADBAND = float(os.getenv('EMIT_DEADBAND', '1.0'))        # изменения меньше — не отправлять, г
+EMIT_KEEPALIVE = float(os.getenv('EMIT_KEEPALIVE', '5'))        # повтор последнего веса при тишине, сек
+BARCODE_BATCH_SIZE = int(os.getenv('BARCODE_BATCH_SIZE', '50'))     # сканов в одном barcode:scan_batch
+BARCODE_WINDOW = int(os.getenv('BARCODE_WINDOW', '4'))               # пачек без ack одновременно
+BARCODE_ACK_TIMEOUT = float(os.getenv('BARCODE_ACK_TIMEOUT', '5'))   # ожидание ack до повтора, сек
+BARCODE_INDEX_SYNC = float(os.getenv('BARCODE_INDEX_SYNC', '300'))  # досинхронизация индекса штрихкодов, сек
+HOTPLUG = os.getenv('HOTPLUG', '1') == '1'                # переподключение по netlink uevent, а не по таймеру
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))     # локальный /metrics (127.0.0.1), 0 — выключить
+STATUS_SOCKET = os.getenv('STATUS_SOCKET', STATUS_SOCKET_PATH)  # Unix-сокет состояния для probe, пусто — выключить
 
 if not SCALE_API_KEY:
     print('ERROR: SCALE_API_KEY not set in .env')
     sys.exit(1)
 
+try:
+    STATION_CONFIGS = load_stations()
+except ValueError as e:
+    print(f'ERROR: {e}')
+    sys.exit(1)
+
 # ── Socket.io клиент ──
 sio = socketio.Client(
     reconnection=True,
@@ -63,37 +75,57 @@ sio = socketio.Client(
     logger=False
 )
 
-# ── Scale reader ──
-scale = ScaleReader(port=SERIAL_PORT, baudrate=BAUD_RATE)
-
-# ── Offline buffers ──
-barcode_queue = BarcodeQueue()
-weight_buffer = LatestWeightBuffer()
-
-# ── Shared current weight (для доступа из barcode_loop) ──
-# LatestWeightBuffer уже thread-safe, используем отдельный экземпляр
-current_weight = LatestWeightBuffer()  # последнее показание весов, обновляется из main loop
+# ── Гистограммы задержек (metrics.py): в scale:debug и на локальном /metrics ──
+metrics = Metrics()
+h_frame = metrics.histogram('frame_to_emit', 'scale frame received to scale:weight emit')
+h_lag = metrics.histogram('loop_lag', 'main loop wake-up lag')
+h_flush = metrics.histogram('flush', 'buffered weight flush after reconnect')
+h_write = metrics.histogram('queue_write', 'SQLite barcode queue write')
+
+# ── Offline-очередь штрихкодов (общая для всех станций, скан помечен станцией) ──
+barcode_queue = BarcodeQueue(os.getenv('BUFFER_DB') or None)  # по умолчанию buffer.db рядом со скриптом
+# Индекс известных штрихкодов (кусты активных сессий сбора) — проверка скана без сервера
+barcode_index = BarcodeIndex(os.getenv('BUFFER_DB') or None)
+
+# Все сканы идут через очередь: строка удаляется только после ack сервера
+barcode_sender = BarcodeSender(sio, barcode_queue, batch_size=BARCODE_BATCH_SIZE,
+                               window=BARCODE_WINDOW, ack_timeout=BARCODE_ACK_TIMEOUT,
+                               metrics=metrics, index=barcode_index)
+metrics.gauge('barcode_queue', barcode_queue.size)
+metrics.gauge('barcodes_in_flight', barcode_sender.in_flight)
 
 pending = barcode_queue.size()
 if pending > 0:
     print(f'[Buffer] {pending} barcode scan(s) pending from previous session')
 
-# ── Barcode reader (опционально — evdev может быть не установлен) ──
-barcode = None
-try:
-    from barcode_reader import BarcodeReader
-    barcode = BarcodeReader(
-        device_path=BARCODE_DEVICE if BARCODE_DEVICE else None
+# ── Hotplug: переподключение по событию ядра add, без опроса ──
+hotplug = HotplugMonitor.create() if HOTPLUG else None
+
+# ── Станции: весы + сканер, у каждой свои ридеры, буферы, детектор, политика ──
+stations = [
+    Station(
+        config, ScaleStream,
+        ip_poll_interval=IP_POLL_INTERVAL,  # в любом режиме: в auto это единственный источник нестабильного веса
+        settle_kw={'window_s': SETTLE_WINDOW, 'abs_tol': SETTLE_TOLERANCE},
+        emit_kw={'max_rate': EMIT_MAX_RATE, 'deadband': EMIT_DEADBAND, 'keepalive': EMIT_KEEPALIVE},
+        hotplug=hotplug,
     )
-except ImportError:
-    print('[Barcode] evdev not installed — barcode scanner disabled')
-    print('[Barcode] To enable: pip install evdev')
+    for config in STATION_CONFIGS
+]
+primary = stations[0]  # её вес сервер показывает старым клиентам
+if len(stations) > 1:
+    print(f'[Stations] {len(stations)} stations: ' + ', '.join(repr(st.config) for st in stations))
 
 
 @sio.event
 def connect():
     print(f'[OK] Connected to server: {SERVER_URL}')
-    # Flush буферизованных данных при (пере)подключении
+    # Список станций — первым, чтобы сервер знал основную
+    sio.emit('pi:stations', {'stations': [st.id for st in stations]})
+    # Неподтверждённые сканы — заново (pi:sync_start, если есть накопленные)
+    barcode_sender.on_connect()
+    sync_barcode_index()
+    # Flush буферизованного веса при (пере)подключении
     flush_thread = threading.Thread(target=flush_buffers, daemon=True)
     flush_thread.start()
 
@@ -101,6 +133,7 @@ def connect():
 @sio.event
 def disconnect():
     print('[!] Disconnected from server, will reconnect...')
+    barcode_sender.on_disconnect()
 
 
 @sio.event
@@ -108,55 +141,37 @@ def connect_error(data):
     print(f'[!] Connection error: {data}')
 
 
+@sio.on('barcode:index_changed')
+def on_barcode_index_changed(_data=None):
+    sync_barcode_index()
+
+
+def sync_barcode_index():
+    """Запросить изменения индекса штрихкодов с нашей версии (ответ — в ack).
+    Только при соединении (в обработчике connect sio.connected ещё False)."""
+    sio.emit('barcode:index_sync', barcode_index.request(),
+             callback=lambda resp=None: barcode_index.apply(resp))
+
+
 def flush_buffers():
-    """Отправить все буферизованные данные на сервер после (пере)подключения."""
+    """Отправить буферизованный вес станций на сервер после (пере)подключения.
+    Штрихкоды досылает barcode_sender (с подтверждением).
+    """
     time.sleep(0.5)  # Дать сокету стабилизироваться
 
-    # 1. Flush штрихкодов (критичные данные)
-    queued = barcode_queue.peek_all()
-    if queued:
-        print(f'[Buffer] Flushing {len(queued)} buffered barcode scan(s)...')
-        if sio.connected:
-            sio.emit('pi:sync_start', {'barcodeCount': len(queued)})
-
-        sent = 0
-        for row in queued:
-            row_id, barcode_code, scanned_at = row[0], row[1], row[2]
-            weight_val, weight_unit, weight_stable = row[3], row[4], row[5] if len(row) > 5 else (None, None, None)
-            if not sio.connected:
-                print(f'[Buffer] Lost connection during flush, {len(queued) - sent} remaining')
-                return
-            payload = {
-                'barcode': barcode_code,
-                'buffered': True,
-                'scannedAt': scanned_at
-            }
-            # Включить вес если он был записан при скане
-            if weight_val is not None:
-                payload['weight'] = weight_val
-                payload['unit'] = weight_unit or 'g'
-                payload['stable'] = bool(weight_stable)
-            sio.emit('barcode:scan', payload)
-            barcode_queue.remove(row_id)
-            sent += 1
-            weight_info = f' (weight: {weight_val} {weight_unit})' if weight_val is not None else ''
-            print(f'[Buffer] Sent buffered barcode: {barcode_code}{weight_info}')
-            time.sleep(0.05)  # Небольшая задержка чтобы не флудить сервер
-
-        if sio.connected:
-            sio.emit('pi:sync_complete', {'barcodeCount': sent})
-        print(f'[Buffer] Flush complete: {sent} barcode(s) sent')
-
-    # 2. Отправить последний буферизованный вес
-    weight_data = weight_buffer.get_and_clear()
-    if weight_data and sio.connected:
-        w, u, s = weight_data
-        sio.emit('scale:weight', {
-            'weight': w,
-            'unit': u,
-            'stable': s
-        })
-        print(f'[Buffer] Sent buffered weight: {w} {u}')
+    t0 = time.monotonic()
+    for st in stations:
+        weight_data = st.weight_buffer.get_and_clear()
+        if weight_data and sio.connected:
+            w, u, s = weight_data
+            sio.emit('scale:weight', {
+                'station': st.id,
+                'weight': w,
+                'unit': u,
+                'stable': s
+            })
+            print(f'[Buffer] [{st.id}] Sent buffered weight: {w} {u}')
+    h_flush.observe_since(t0, time.monotonic())
 
 
 def connect_to_server():
@@ -173,44 +188,45 @@ def connect_to_server():
     )
 
 
-def connect_to_scale():
-    """Подключиться к USB-весам через serial."""
+def connect_to_scale(st):
+    """Подключиться к USB-весам станции через serial."""
     try:
-        scale.connect()
-        print(f'[OK] Scale connected on {SERIAL_PORT} at {BAUD_RATE} baud')
+        st.scale.connect()
+        print(f'[OK] [{st.id}] Scale connected on {st.config.serial_port} at {st.config.baud_rate} baud')
         if SCALE_MODE == 'continuous':
             time.sleep(0.5)
-            scale.enable_continuous_print()
-            print('[OK] Continuous print (CP) enabled + IP polling for unstable readings')
+            st.scale.enable_continuous_print()
+            print(f'[OK] [{st.id}] Continuous print (CP) enabled + IP polling for unstable readings')
         else:
-            print(f'[OK] Mode: {SCALE_MODE}')
+            print(f'[OK] [{st.id}] Mode: {SCALE_MODE}')
         return True
     except Exception as e:
-        print(f'[!] Failed to open serial port {SERIAL_PORT}: {e}')
+        print(f'[!] [{st.id}] Failed to open serial port {st.config.serial_port}: {e}')
         return False
 
 
-def connect_to_barcode():
-    """Подключиться к USB-сканеру штрихкодов."""
-    if barcode is None:
+def connect_to_barcode(st):
+    """Подключиться к USB-сканеру штрихкодов станции."""
+    if st.barcode is None:
         return False
     try:
-        barcode.connect()
+        st.barcode.connect()
         return True
     except (FileNotFoundError, OSError) as e:
-        print(f'[!] Barcode scanner not found: {e}')
+        print(f'[!] [{st.id}] Barcode scanner not found: {e}')
         return False
 
 
-# ── Поток чтения штрихкодов ──
-def barcode_loop():
-    """Фоновый поток: читать штрихкоды и отправлять на сервер."""
+# ── Поток чтения штрихкодов (по одному на станцию) ──
+def barcode_loop(st):
+    """Фоновый поток: читать штрихкоды станции и отправлять на сервер."""
+    barcode = st.barcode
     if barcode is None:
         return
 
     # Начальное подключение
-    if not connect_to_barcode():
-        print('[Barcode] Will retry in background...')
+    if not connect_to_barcode(st):
+        print(f'[Barcode] [{st.id}] Will retry in background...')
 
     wait_cycles = 0
 
@@ -218,10 +234,10 @@ def barcode_loop():
         try:
             # Переподключение если отвалился
             if not barcode.is_connected():
-                print('[Barcode] Scanner disconnected, reconnecting...')
+                print(f'[Barcode] [{st.id}] Scanner disconnected, reconnecting...')
                 if not barcode.reconnect(max_retries=5, delay=5):
-                    print('[Barcode] Could not reconnect, retrying in 10s...')
-                    time.sleep(10)
+                    print(f'[Barcode] [{st.id}] Could not reconnect, retrying in 10s...')
+                    barcode.wait_for_device(10)
                     continue
                 wait_cycles = 0
 
@@ -230,194 +246,267 @@ def barcode_loop():
             wait_cycles += 1
 
             if code is not None:
-                print(f'[Barcode] Scanned: {code}')
+                scan_done = time.time()  # скан закончен — отсюда считается scan_to_emit
+                st.last_scan, st.last_scan_at = code, scan_done
+                # Проверка по локальному индексу — сразу, без сервера
+                st.last_scan_check = barcode_index.validate(code)
+                print(f'[Barcode] [{st.id}] Scanned: {code}{barcode_index.describe(st.last_scan_check)}')
                 wait_cycles = 0
-                # Захватить текущий вес на момент скана
-                cw = current_weight.get()  # (weight, unit, stable) или None
-                if sio.connected:
-                    payload = {'barcode': code}
-                    if cw is not None:
-                        payload['weight'] = cw[0]
-                        payload['unit'] = cw[1]
-                        payload['stable'] = cw[2]
-                    sio.emit('barcode:scan', payload)
-                    weight_info = f' (weight: {cw[0]} {cw[1]})' if cw else ''
-                    print(f'[Barcode] Sent to server: {code}{weight_info}')
-                else:
-                    # Буферизуем вместе с текущим весом
-                    w, u, s = cw if cw else (None, None, None)
-                    queue_size = barcode_queue.push(code, weight=w, unit=u, stable=s)
-                    weight_info = f' (weight: {w} {u})' if w is not None else ' (no weight)'
-                    print(f'[Barcode] Buffered scan: {code}{weight_info} (queue: {queue_size})')
+                # Вес на момент скана: settled/стабильный рядом с моментом курка,
+                # иначе показание, действовавшее в этот момент
+                scan_t = barcode.last_scan_monotonic or time.monotonic()
+                cw = st.weight_history.lookup(scan_t)  # (weight, unit, stable) или None
+                # Сначала в очередь (переживёт обрыв/перезапуск), отправит barcode_sender
+                w, u, s = cw if cw else (None, None, None)
+                t0 = time.monotonic()
+                queue_size = barcode_queue.push(code, weight=w, unit=u, stable=s, station=st.id,
+                                                scanned_at=scan_done)
+                h_write.observe_since(t0, time.monotonic())
+                barcode_sender.kick()
+                weight_info = f' (weight: {w} {u})' if w is not None else ' (no weight)'
+                state = 'queued' if sio.connected else 'buffered offline'
+                print(f'[Barcode] [{st.id}] Scan {state}: {code}{weight_info} (queue: {queue_size})')
             elif wait_cycles % 12 == 0:
                 # Каждые ~60 секунд — показать что поток жив
-                print(f'[Barcode] Waiting for scan... (connected: {barcode.is_connected()})')
+                print(f'[Barcode] [{st.id}] Waiting for scan... (connected: {barcode.is_connected()})')
 
         except Exception as e:
-            print(f'[Barcode] Error: {e}')
+            print(f'[Barcode] [{st.id}] Error: {e}')
             time.sleep(2)
 
 
-def emit_scale_status(connected):
-    """Отправить статус весов на сервер."""
+def emit_scale_status(st, connected):
+    """Отправить статус весов станции на сервер."""
     if sio.connected:
-        sio.emit('scale:status', {'connected': connected})
-        print(f'[Scale] Status sent: connected={connected}')
+        sio.emit('scale:status', {'station': st.id, 'connected': connected})
+        print(f'[Scale] [{st.id}] Status sent: connected={connected}')
 
 
-def emit_debug_info(last_weight, consecutive_errors, start_time):
-    """Отправить диагностику на сервер (для дебаг-панели в UI)."""
+def emit_debug_info(start_time):
+    """Отправить диагностику на сервер (для дебаг-панели в UI).
+    Верхний уровень — основная станция (как раньше), stations — все.
+    """
     if not sio.connected:
         return
     debug_data = {
-        'scaleConnected': scale.is_connected(),
-        'serialPort': SERIAL_PORT,
-        'barcodeConnected': barcode.is_connected() if barcode else False,
+        'scaleConnected': primary.scale.is_connected(),
+        'serialPort': primary.config.serial_port,
+        'barcodeConnected': primary.barcode.is_connected() if primary.barcode else False,
         'uptime': round(time.time() - start_time),
-        'lastWeight': last_weight,
-        'errorCount': consecutive_errors,
+        'lastWeight': primary.last_weight,
+        'errorCount': primary.errors,
         'piTime': datetime.now().isoformat(),
         # Статистика буфера
         'bufferedBarcodes': barcode_queue.size(),
-        'hasBufferedWeight': weight_buffer.has_value(),
+        'barcodesInFlight': barcode_sender.in_flight(),
+        'hasBufferedWeight': any(st.weight_buffer.has_value() for st in stations),
+        # Политика отправки веса
+        'weightEmitted': sum(st.emitter.emitted for st in stations),
+        'weightSuppressed': sum(st.emitter.suppressed for st in stations),
+        'stations': [st.debug_info() for st in stations],
+        'barcodeIndex': barcode_index.info(),
+        # Задержки, мс: {frame_to_emit: {count, avg, p50, p95, p99, max}, ...}
+        'latency': metrics.summary(),
     }
     sio.emit('scale:debug', debug_data)
 
 
-def main():
-    """Главный цикл: весы + сканер → отправить на сервер."""
-    start_time = time.time()
+def status_snapshot(start_time):
+    """Состояние для status_socket (pi-health-probe): только память процесса."""
+    return {
+        'pid': os.getpid(),
+        'runtime': 'threading',
+        'time': time.time(),
+        'uptime': round(time.time() - start_time),
+        'serverConnected': sio.connected,
+        'queueDepth': barcode_queue.size(),
+        'inFlight': barcode_sender.in_flight(),
+        'loopLagMs': h_lag.summary(),
+        'barcodeIndex': barcode_index.info(),
+        'stations': [st.status() for st in stations],
+    }
+
+
+# ── Поток чтения весов (по одному на станцию) ──
+def scale_loop(st):
+    """Весы станции: показания → settle/история → EmitPolicy → scale:weight."""
+    scale = st.scale
+    scale_stream = st.scale_stream
+    settle = st.settle
+    emitter = st.emitter
 
     # Подключаемся к весам
     scale_was_connected = False
-    if connect_to_scale():
+    if connect_to_scale(st):
         scale_was_connected = True
     else:
-        print('Retrying scale connection...')
+        print(f'[{st.id}] Retrying scale connection...')
         if scale.reconnect(max_retries=10, delay=3):
             scale_was_connected = True
         else:
-            print('Could not connect to scale. Will keep trying in main loop...')
-
-    # Подключаемся к серверу
-    try:
-        connect_to_server()
-    except Exception as e:
-        print(f'Could not connect to server: {e}')
-        print('Will keep retrying...')
+            print(f'[{st.id}] Could not connect to scale. Will keep trying...')
 
     # Отправить начальный статус весов
-    if sio.connected:
-        emit_scale_status(scale_was_connected)
+    emit_scale_status(st, scale_was_connected)
 
-    # Запускаем поток чтения штрихкодов
-    if barcode is not None:
-        barcode_thread = threading.Thread(target=barcode_loop, daemon=True)
-        barcode_thread.start()
-        print('[OK] Barcode scanner thread started')
-    else:
-        print('[!] Barcode scanner disabled (evdev not available)')
-
-    # ── Главный цикл: чтение весов ──
     last_weight = None
     last_stable = None
-    consecutive_errors = 0
     max_consecutive_errors = 10
-    last_debug_time = 0
-    last_ip_time = 0
-    DEBUG_INTERVAL = 5  # секунд между отправками debug
-    IP_POLL_INTERVAL = 0.3  # интервал IP-запросов (получить вес даже нестабильный)
-
-    print(f'\nReading scale every {READ_INTERVAL}s (IP polling every {IP_POLL_INTERVAL}s)...\n')
+    last_seq = 0
+    WAIT_TIMEOUT = 0.5  # макс. ожидание показания
 
-    # Сообщить systemd что сервис запустился
-    sd_notify('READY=1')
-    print('[Watchdog] Service ready, watchdog active')
+    scale_stream.start()
+    print(f'[{st.id}] Scale reader thread started (IP polling every {IP_POLL_INTERVAL}s when the scale is silent)...')
 
     while True:
         try:
-            now = time.time()
-
-            # Периодическая отправка диагностики (каждые 5 сек) + watchdog heartbeat
-            if now - last_debug_time >= DEBUG_INTERVAL:
-                emit_debug_info(last_weight, consecutive_errors, start_time)
-                sd_notify('WATCHDOG=1')  # Говорим systemd что живы
-                last_debug_time = now
-
             if not scale.is_connected():
-                print('Scale disconnected, reconnecting...')
+                print(f'[{st.id}] Scale disconnected, reconnecting...')
                 # Сообщить что весы отключились
                 if scale_was_connected:
-                    emit_scale_status(False)
+                    emit_scale_status(st, False)
                     scale_was_connected = False
 
                 if scale.reconnect(max_retries=5, delay=2):
-                    consecutive_errors = 0
+                    st.errors = 0
                     # Весы вернулись — сообщить и включить CP
                     if SCALE_MODE == 'continuous':
                         time.sleep(0.5)
                         scale.enable_continuous_print()
-                    emit_scale_status(True)
+                    emit_scale_status(st, True)
                     scale_was_connected = True
                 else:
                     if sio.connected:
-                        sio.emit('scale:error', {'message': 'Serial port lost'})
-                    time.sleep(5)
+                        sio.emit('scale:error', {'station': st.id, 'message': 'Serial port lost'})
+                    scale.wait_for_device(5)
                     continue
 
-            # Стратегия: сначала пробуем прочитать данные из CP-потока.
-            # Если CP не даёт данных (нестабильный вес), используем IP-запрос.
-            reading = scale.read_weight()
-
-            if reading is None and (now - last_ip_time) >= IP_POLL_INTERVAL:
-                # CP не дал данных — запрашиваем текущий вес через IP
-                reading = scale.read_weight_immediate()
-                last_ip_time = now
+            # Ждём следующее показание от потока чтения (CP-поток + IP-ответы).
+            # Возвращается самое свежее; если пришло несколько — промежуточные
+            # остаются в scale_stream.ring.
+            # Таймаут короче, если пора дослать схлопнутый вес / keepalive.
+            timeout = WAIT_TIMEOUT
+            deadline = emitter.next_deadline(time.monotonic())
+            if deadline is not None and deadline < timeout:
+                timeout = deadline
+            reading = scale_stream.wait(last_seq, timeout=timeout)
+
+            # Дослать схлопнутое промежуточное значение или keepalive — на каждой
+            # итерации: если весы шлют тот же вес 10–20 раз/сек, wait не истекает
+            payload = emitter.flush(time.monotonic())
+            if payload is not None and sio.connected:
+                sio.emit('scale:weight', payload)
 
             if reading is not None:
-                weight, unit, stable = reading
-                consecutive_errors = 0
-
-                # Обновить shared weight для barcode_loop
-                current_weight.set(weight, unit, stable)
+                last_seq, ts, weight, unit, stable = reading
+                st.errors = 0
+                st.last_reading_at = time.time()
+                st.last_stable = stable
 
                 # Если до этого весы считались отключёнными — сообщить что вернулись
                 if not scale_was_connected:
-                    emit_scale_status(True)
+                    emit_scale_status(st, True)
                     scale_was_connected = True
 
-                if weight != last_weight or stable != last_stable:
+                # Успокоение считаем по каждому показанию; смена settled — повод отправить сразу
+                settle_changed = settle.update(ts, weight, stable)
+                # История для barcode_loop (время — приход строки с весов)
+                st.weight_history.append(ts, weight, unit, stable, settle.settled)
+
+                if weight != last_weight or stable != last_stable or settle_changed:
+                    # stable/settled переходы уходят сразу; качание — не чаще EMIT_MAX_RATE
+                    payload = emitter.offer(ts, weight, stable, st.weight_payload(weight, unit, stable),
+                                            force=settle_changed)
                     if sio.connected:
-                        sio.emit('scale:weight', {
-                            'weight': weight,
-                            'unit': unit,
-                            'stable': stable
-                        })
+                        if payload is not None:
+                            sio.emit('scale:weight', payload)
+                            h_frame.observe_since(ts, time.monotonic())
                     else:
                         # Буферизуем только последний вес (перезаписывает предыдущий)
-                        weight_buffer.set(weight, unit, stable)
+                        st.weight_buffer.set(weight, unit, stable)
                     last_weight = weight
                     last_stable = stable
+                    st.last_weight = weight
             else:
-                consecutive_errors += 1
-                if consecutive_errors >= max_consecutive_errors:
-                    print(f'No valid readings for {consecutive_errors} attempts (buffer flush, not a disconnect)')
-                    consecutive_errors = 0  # сброс счётчика — это НЕ потеря связи, reconnect не нужен
+                if timeout < WAIT_TIMEOUT:
+                    continue  # проснулись ради flush, а не из-за молчания весов
+                st.errors += 1
+                if st.errors >= max_consecutive_errors:
+                    print(f'[{st.id}] No valid readings for {st.errors * WAIT_TIMEOUT:.0f}s (scale idle, not a disconnect)')
+                    st.errors = 0  # сброс счётчика — это НЕ потеря связи, reconnect не нужен
 
-            time.sleep(READ_INTERVAL)
-
-        except KeyboardInterrupt:
-            print('\nStopping...')
-            break
         except Exception as e:
-            print(f'Error in main loop: {e}')
-            consecutive_errors += 1
+            print(f'[{st.id}] Error in scale loop: {e}')
+            st.errors += 1
             time.sleep(1)
 
+
+def main():
+    """Станции (весы + сканер) → сервер; главный поток — диагностика и watchdog."""
+    start_time = time.time()
+
+    # Подключаемся к серверу
+    try:
+        connect_to_server()
+    except Exception as e:
+        print(f'Could not connect to server: {e}')
+        print('Will keep retrying...')
+
+    barcode_sender.start()
+
+    # По потоку весов и потоку сканера на станцию
+    for st in stations:
+        threading.Thread(target=scale_loop, args=(st,), name=f'scale-{st.id}', daemon=True).start()
+        if st.barcode is not None:
+            threading.Thread(target=barcode_loop, args=(st,), name=f'barcode-{st.id}', daemon=True).start()
+            print(f'[OK] [{st.id}] Barcode scanner thread started')
+        else:
+            print(f'[!] [{st.id}] Barcode scanner disabled (evdev not available)')
+
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    if STATUS_SOCKET:
+        StatusSocket(STATUS_SOCKET, lambda: status_snapshot(start_time)).serve()
+
+    # Сообщить systemd что сервис запустился
+    sd_notify('READY=1')
+    print('[Watchdog] Service ready, watchdog active')
+
+    DEBUG_INTERVAL = 5  # секунд между отправками debug
+    LAG_TICK = 0.25     # шаг главного цикла: опоздание пробуждения → loop_lag
+    next_debug = time.monotonic()
+    next_index_sync = next_debug + BARCODE_INDEX_SYNC
+    try:
+        while True:
+            now = time.monotonic()
+            if BARCODE_INDEX_SYNC and now >= next_index_sync:
+                # Страховка к barcode:index_changed: уведомление могло потеряться
+                if sio.connected:
+                    try:
+                        sync_barcode_index()
+                    except Exception as e:
+                        print(f'[Index] Sync request failed: {e}')
+                next_index_sync = now + BARCODE_INDEX_SYNC
+            if now >= next_debug:
+                # Периодическая отправка диагностики (каждые 5 сек) + watchdog heartbeat
+                try:
+                    emit_debug_info(start_time)
+                except Exception as e:
+                    print(f'Error sending debug info: {e}')
+                sd_notify('WATCHDOG=1')  # Говорим systemd что живы
+                next_debug = now + DEBUG_INTERVAL
+            t_sleep = time.monotonic()
+            time.sleep(LAG_TICK)
+            h_lag.observe(max(0.0, (time.monotonic() - t_sleep - LAG_TICK) * 1000.0))
+    except KeyboardInterrupt:
+        print('\nStopping...')
+
     # Cleanup
-    scale.close()
-    if barcode is not None:
-        barcode.close()
+    for st in stations:
+        st.scale_stream.stop()
+        st.scale.close()
+        if st.barcode is not None:
+            st.barcode.close()
     if sio.connected:
         sio.disconnect()
     print('Done.')
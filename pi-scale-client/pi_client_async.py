@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Farm Pi Client — asyncio-вариант pi_client.py.
+
+Те же устройства, события Socket.io, буферы и политика отправки, но всё
+в одном event loop вместо главного цикла + потоков:
+  - socketio.AsyncClient (без потоков python-socketio)
+  - весы: AsyncScaleStream — порт в loop.add_reader, показание будит
+    ожидающую корутину сразу по приходу строки (без serial timeout)
+  - сканер: evdev async_read_loop (без select с 5-секундным таймаутом)
+  - отправка штрихкодов (ack-окно), flush веса, debug/watchdog — задачи loop
+
+Блокирующее (открытие/переподключение порта и сканера, SQLite) — через
+asyncio.to_thread, чтобы не задерживать чтение весов.
+
+Станций (весы + сканер) может быть несколько — STATIONS в .env
+(stations.py); у каждой свои задачи scale_task/barcode_task.
+
+Использование:
+  python pi_client_async.py
+  (в scale-client.service — заменить pi_client.py в ExecStart)
+
+Конфигурация — тот же .env (см. .env.example).
+"""
+
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+import socketio
+from dotenv import load_dotenv
+from scale_reader import AsyncScaleStream
+from event_buffer import BarcodeQueue
+from barcode_index import BarcodeIndex
+from barcode_sender import AsyncBarcodeSender
+from stations import Station, load_stations
+from sd_notify import sd_notify
+from hotplug import HotplugMonitor
+from metrics import Metrics
+from status_socket import StatusSocket, DEFAULT_PATH as STATUS_SOCKET_PATH
+
+
+# Загрузить .env из текущей директории
+load_dotenv()
+
+# ── Конфигурация (те же переменные, что у pi_client.py) ──
+SERVER_URL = os.getenv('SERVER_URL', 'http://localhost:5000')
+SCALE_API_KEY = os.getenv('SCALE_API_KEY', '')
+IP_POLL_INTERVAL = float(os.getenv('IP_POLL_INTERVAL', '0.3'))
+SCALE_MODE = os.getenv('SCALE_MODE', 'continuous')
+SETTLE_WINDOW = float(os.getenv('SETTLE_WINDOW', '0.6'))
+SETTLE_TOLERANCE = float(os.getenv('SETTLE_TOLERANCE', '0.5'))
+EMIT_MAX_RATE = float(os.getenv('EMIT_MAX_RATE', '5'))
+EMIT_DEADBAND = float(os.getenv('EMIT_DEADBAND', '1.0'))
+EMIT_KEEPALIVE = float(os.getenv('EMIT_KEEPALIVE', '5'))
+BARCODE_BATCH_SIZE = int(os.getenv('BARCODE_BATCH_SIZE', '50'))
+BARCODE_WINDOW = int(os.getenv('BARCODE_WINDOW', '4'))
+BARCODE_ACK_TIMEOUT = float(os.getenv('BARCODE_ACK_TIMEOUT', '5'))
+BARCODE_INDEX_SYNC = float(os.getenv('BARCODE_INDEX_SYNC', '300'))
+HOTPLUG = os.getenv('HOTPLUG', '1') == '1'
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9101'))
+STATUS_SOCKET = os.getenv('STATUS_SOCKET', STATUS_SOCKET_PATH)
+
+if not SCALE_API_KEY:
+    print('ERROR: SCALE_API_KEY not set in .env')
+    sys.exit(1)
+
+try:
+    STATION_CONFIGS = load_stations()
+except ValueError as e:
+    print(f'ERROR: {e}')
+    sys.exit(1)
+
+DEBUG_INTERVAL = 5  # секунд между отправками debug (и watchdog)
+WAIT_TIMEOUT = 0.5  # макс. ожидание показания
+LAG_TICK = 0.25     # шаг lag_task: опоздание пробуждения → loop_lag
+
+sio = socketio.AsyncClient(
+    reconnection=True,
+    reconnection_delay=1,
+    reconnection_delay_max=10,
+    logger=False
+)
+
+metrics = Metrics()
+h_frame = metrics.histogram('frame_to_emit', 'scale frame received to scale:weight emit')
+h_lag = metrics.histogram('loop_lag', 'event loop wake-up lag')
+h_flush = metrics.histogram('flush', 'buffered weight flush after reconnect')
+h_write = metrics.histogram('queue_write', 'SQLite barcode queue write')
+
+barcode_queue = BarcodeQueue(os.getenv('BUFFER_DB') or None)  # по умолчанию buffer.db рядом со скриптом
+barcode_index = BarcodeIndex(os.getenv('BUFFER_DB') or None)
+barcode_sender = AsyncBarcodeSender(sio, barcode_queue, batch_size=BARCODE_BATCH_SIZE,
+                                    window=BARCODE_WINDOW, ack_timeout=BARCODE_ACK_TIMEOUT,
+                                    metrics=metrics, index=barcode_index)
+metrics.gauge('barcode_queue', barcode_queue.size)
+metrics.gauge('barcodes_in_flight', barcode_sender.in_flight)
+
+# Hotplug (netlink): ожидание переподключения — в to_thread, без опроса
+hotplug = HotplugMonitor.create() if HOTPLUG else None
+
+stations = [
+    Station(
+        config, AsyncScaleStream,
+        ip_poll_interval=IP_POLL_INTERVAL,  # в любом режиме: в auto это единственный источник нестабильного веса
+        settle_kw={'window_s': SETTLE_WINDOW, 'abs_tol': SETTLE_TOLERANCE},
+        emit_kw={'max_rate': EMIT_MAX_RATE, 'deadband': EMIT_DEADBAND, 'keepalive': EMIT_KEEPALIVE},
+        hotplug=hotplug,
+    )
+    for config in STATION_CONFIGS
+]
+primary = stations[0]
+
+START_TIME = time.time()
+
+
+@sio.event
+async def connect():
+    print(f'[OK] Connected to server: {SERVER_URL}')
+    await sio.emit('pi:stations', {'stations': [st.id for st in stations]})
+    barcode_sender.on_connect()
+    await sync_barcode_index()
+    asyncio.create_task(flush_weight())
+
+
+@sio.event
+async def disconnect():
+    print('[!] Disconnected from server, will reconnect...')
+    barcode_sender.on_disconnect()
+
+
+@sio.event
+async def connect_error(data):
+    print(f'[!] Connection error: {data}')
+
+
+@sio.on('barcode:index_changed')
+async def on_barcode_index_changed(_data=None):
+    await sync_barcode_index()
+
+
+async def apply_barcode_index(resp=None):
+    # SQLite — в пул потоков, не в event loop
+    await asyncio.to_thread(barcode_index.apply, resp)
+
+
+async def sync_barcode_index():
+    """Запросить изменения индекса штрихкодов с нашей версии (ответ — в ack).
+    Только при соединении (в обработчике connect sio.connected ещё False)."""
+    await sio.emit('barcode:index_sync', barcode_index.request(), callback=apply_barcode_index)
+
+
+async def index_sync_task():
+    """Страховка к barcode:index_changed: уведомление могло потеряться."""
+    while True:
+        await asyncio.sleep(BARCODE_INDEX_SYNC)
+        if not sio.connected:
+            continue
+        try:
+            await sync_barcode_index()
+        except Exception as e:
+            print(f'[Index] Sync request failed: {e}')
+
+
+async def flush_weight():
+    """Отправить буферизованный вес станций после (пере)подключения."""
+    await asyncio.sleep(0.5)  # Дать сокету стабилизироваться
+    t0 = time.monotonic()
+    for st in stations:
+        weight_data = st.weight_buffer.get_and_clear()
+        if weight_data and sio.connected:
+            w, u, s = weight_data
+            await sio.emit('scale:weight', {'station': st.id, 'weight': w, 'unit': u, 'stable': s})
+            print(f'[Buffer] [{st.id}] Sent buffered weight: {w} {u}')
+    h_flush.observe_since(t0, time.monotonic())
+
+
+async def emit_scale_status(st, connected):
+    if sio.connected:
+        await sio.emit('scale:status', {'station': st.id, 'connected': connected})
+        print(f'[Scale] [{st.id}] Status sent: connected={connected}')
+
+
+# ── Задачи ──
+async def server_task():
+    """Первое подключение (дальше переподключает сам AsyncClient)."""
+    while not sio.connected:
+        print(f'Connecting to {SERVER_URL}...')
+        try:
+            await sio.connect(
+                SERVER_URL,
+                auth={'apiKey': SCALE_API_KEY, 'deviceType': 'pi'},
+                transports=['websocket', 'polling'],
+                wait_timeout=10
+            )
+            return
+        except Exception as e:
+            print(f'Could not connect to server: {e}, retrying in 5s...')
+            await asyncio.sleep(5)
+
+
+async def debug_task():
+    """Диагностика для UI + heartbeat systemd watchdog каждые DEBUG_INTERVAL сек."""
+    while True:
+        if sio.connected:
+            try:
+                await sio.emit('scale:debug', {
+                    'scaleConnected': primary.scale.is_connected(),
+                    'serialPort': primary.config.serial_port,
+                    'barcodeConnected': primary.barcode.is_connected() if primary.barcode else False,
+                    'uptime': round(time.time() - START_TIME),
+                    'lastWeight': primary.last_weight,
+                    'errorCount': primary.errors,
+                    'piTime': datetime.now().isoformat(),
+                    'bufferedBarcodes': barcode_queue.size(),
+                    'barcodesInFlight': barcode_sender.in_flight(),
+                    'hasBufferedWeight': any(st.weight_buffer.has_value() for st in stations),
+                    'weightEmitted': sum(st.emitter.emitted for st in stations),
+                    'weightSuppressed': sum(st.emitter.suppressed for st in stations),
+                    'stations': [st.debug_info() for st in stations],
+                    'barcodeIndex': barcode_index.info(),
+                    'latency': metrics.summary(),
+                    'runtime': 'asyncio',
+                })
+            except Exception as e:
+                print(f'[Debug] Emit failed: {e}')
+        sd_notify('WATCHDOG=1')
+        await asyncio.sleep(DEBUG_INTERVAL)
+
+
+def status_snapshot():
+    """Состояние для status_socket (pi-health-probe): только память процесса."""
+    return {
+        'pid': os.getpid(),
+        'runtime': 'asyncio',
+        'time': time.time(),
+        'uptime': round(time.time() - START_TIME),
+        'serverConnected': sio.connected,
+        'queueDepth': barcode_queue.size(),
+        'inFlight': barcode_sender.in_flight(),
+        'loopLagMs': h_lag.summary(),
+        'barcodeIndex': barcode_index.info(),
+        'stations': [st.status() for st in stations],
+    }
+
+
+async def lag_task():
+    """Опоздание пробуждения event loop: долгий колбэк/корутина задерживает всех."""
+    while True:
+        t0 = time.monotonic()
+        await asyncio.sleep(LAG_TICK)
+        h_lag.observe(max(0.0, (time.monotonic() - t0 - LAG_TICK) * 1000.0))
+
+
+async def barcode_task(st):
+    """Скан станции → вес на момент курка → очередь → barcode_sender (ack)."""
+    barcode = st.barcode
+    while True:
+        try:
+            if not barcode.is_connected():
+                try:
+                    await asyncio.to_thread(barcode.connect)
+                except (FileNotFoundError, OSError) as e:
+                    print(f'[Barcode] [{st.id}] Scanner not found: {e}, retrying in 10s...')
+                    await asyncio.to_thread(barcode.wait_for_device, 10)
+                    continue
+            async for code in barcode.read_barcodes_async():
+                scan_done = time.time()
+                st.last_scan, st.last_scan_at = code, scan_done
+                st.last_scan_check = barcode_index.validate(code)
+                print(f'[Barcode] [{st.id}] Scanned: {code}{barcode_index.describe(st.last_scan_check)}')
+                scan_t = barcode.last_scan_monotonic or time.monotonic()
+                cw = st.weight_history.lookup(scan_t)
+                w, u, s = cw if cw else (None, None, None)
+                t0 = time.monotonic()
+                queue_size = await asyncio.to_thread(barcode_queue.push, code, w, u, s, st.id, scan_done)
+                h_write.observe_since(t0, time.monotonic())
+                barcode_sender.kick()
+                weight_info = f' (weight: {w} {u})' if w is not None else ' (no weight)'
+                print(f'[Barcode] [{st.id}] Scan {"queued" if sio.connected else "buffered offline"}: '
+                      f'{code}{weight_info} (queue: {queue_size})')
+            print(f'[Barcode] [{st.id}] Scanner disconnected, reconnecting...')
+            await asyncio.sleep(1)
+        except Exception as e:
+            # Как barcode_loop: ошибка одного скана не должна ронять весь runtime (gather)
+            print(f'[Barcode] [{st.id}] Error: {e}')
+            await asyncio.sleep(2)
+
+
+async def enable_continuous(st):
+    if SCALE_MODE == 'continuous':
+        await asyncio.sleep(0.5)
+        st.scale.enable_continuous_print()
+
+
+async def connect_scale(st):
+    """Первое открытие порта станции."""
+    try:
+        await asyncio.to_thread(st.scale.connect)
+        print(f'[OK] [{st.id}] Scale connected on {st.config.serial_port} at {st.config.baud_rate} baud')
+        await enable_continuous(st)
+    except Exception as e:
+        print(f'[!] [{st.id}] Failed to open serial port {st.config.serial_port}: {e}')
+
+
+async def scale_task(st):
+    """Показания весов станции → settle/история → EmitPolicy → scale:weight."""
+    scale = st.scale
+    scale_stream = st.scale_stream
+    settle = st.settle
+    emitter = st.emitter
+    scale_was_connected = scale.is_connected()
+    last_weight = None
+    last_stable = None
+    last_seq = 0
+    idle = 0
+
+    while True:
+        try:
+            if not scale.is_connected():
+                print(f'[{st.id}] Scale disconnected, reconnecting...')
+                if scale_was_connected:
+                    await emit_scale_status(st, False)
+                    scale_was_connected = False
+                scale_stream.detach()
+                if await asyncio.to_thread(scale.reconnect, 5, 2):
+                    await enable_continuous(st)
+                    scale_stream.attach()
+                    await emit_scale_status(st, True)
+                    scale_was_connected = True
+                else:
+                    if sio.connected:
+                        await sio.emit('scale:error', {'station': st.id, 'message': 'Serial port lost'})
+                    await asyncio.to_thread(scale.wait_for_device, 5)
+                continue
+
+            timeout = WAIT_TIMEOUT
+            deadline = emitter.next_deadline(time.monotonic())
+            if deadline is not None and deadline < timeout:
+                timeout = deadline
+            reading = await scale_stream.wait(last_seq, timeout=timeout)
+
+            # На каждой итерации: тот же вес 10–20 раз/сек — wait не истекает
+            payload = emitter.flush(time.monotonic())
+            if payload is not None and sio.connected:
+                await sio.emit('scale:weight', payload)
+
+            if reading is None:
+                if timeout >= WAIT_TIMEOUT:
+                    idle += 1
+                    if idle * WAIT_TIMEOUT >= 5:
+                        print(f'[{st.id}] No valid readings for {idle * WAIT_TIMEOUT:.0f}s (scale idle, not a disconnect)')
+                        idle = 0
+                continue
+
+            last_seq, ts, weight, unit, stable = reading
+            idle = 0
+            st.last_reading_at = time.time()
+            st.last_stable = stable
+            if not scale_was_connected:
+                await emit_scale_status(st, True)
+                scale_was_connected = True
+
+            settle_changed = settle.update(ts, weight, stable)
+            st.weight_history.append(ts, weight, unit, stable, settle.settled)
+
+            if weight != last_weight or stable != last_stable or settle_changed:
+                payload = emitter.offer(ts, weight, stable, st.weight_payload(weight, unit, stable),
+                                        force=settle_changed)
+                if sio.connected:
+                    if payload is not None:
+                        await sio.emit('scale:weight', payload)
+                        h_frame.observe_since(ts, time.monotonic())
+                else:
+                    st.weight_buffer.set(weight, unit, stable)
+                last_weight = weight
+                last_stable = stable
+                st.last_weight = weight
+        except Exception as e:
+            # Как scale_loop: напр. BadNamespaceError от emit в момент разрыва
+            print(f'[{st.id}] Error in scale task: {e}')
+            st.errors += 1
+            await asyncio.sleep(1)
+
+
+async def main():
+    pending = barcode_queue.size()
+    if pending > 0:
+        print(f'[Buffer] {pending} barcode scan(s) pending from previous session')
+
+    await asyncio.gather(*(connect_scale(st) for st in stations))
+
+    barcode_sender.start()
+    tasks = [
+        asyncio.create_task(server_task()),
+        asyncio.create_task(debug_task()),
+        asyncio.create_task(lag_task()),
+    ]
+    if BARCODE_INDEX_SYNC:
+        tasks.append(asyncio.create_task(index_sync_task()))
+    if METRICS_PORT:
+        await metrics.serve_async(METRICS_PORT)
+    if STATUS_SOCKET:
+        await StatusSocket(STATUS_SOCKET, status_snapshot).serve_async()
+    for st in stations:
+        st.scale_stream.start()
+        tasks.append(asyncio.create_task(scale_task(st)))
+        if st.barcode is not None:
+            tasks.append(asyncio.create_task(barcode_task(st)))
+        else:
+            print(f'[!] [{st.id}] Barcode scanner disabled (evdev not available)')
+
+    sd_notify('READY=1')
+    print('[Watchdog] Service ready, watchdog active (asyncio runtime)')
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for st in stations:
+            st.scale_stream.stop()
+            st.scale.close()
+            if st.barcode is not None:
+                st.barcode.close()
+        if sio.connected:
+            await sio.disconnect()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print('\nStopping...')
+    print('Done.')
@@ -0,0 +1,590 @@
+#!/usr/bin/env python3
+"""
+Прогон pi_client без железа: весы, сканер и сервер — подставные.
+
+  весы    — псевдотерминал (pty): кадры Ohaus CP с заданной частотой,
+            ответ на IP сразу; синтетические взвешивания (пусто →
+            качается → стабильно → сняли) или запись из bench_frames/
+  сканер  — виртуальная клавиатура uinput, "набирает" штрихкод и Enter,
+            как Honeywell в режиме клавиатуры
+  сервер  — локальный Socket.io (python-socketio, threading, WebSocket),
+            отвечает на barcode:scan_batch как server/socket/index.js
+  сеть    — TCP-прокси между клиентом и сервером; --outage рвёт все
+            соединения и не пускает новые заданное время
+
+pi_client запускается подпроцессом со своим .env-окружением (SERIAL_PORT —
+pty, BARCODE_DEVICE — uinput, BUFFER_DB — временный файл), лог — в файл.
+Отчёт: частота scale:weight и задержка кадр → сервер, задержка скан →
+сервер, потери/повторы сканов, поведение на каждом обрыве, гистограммы
+самого клиента (/metrics.json, metrics.py).
+
+Использование:
+  python replay_harness.py                              # 60 сек, 20 сканов, обрыв на 25-й сек
+  python replay_harness.py --frames bench_frames/ohaus.txt --rate 20
+  python replay_harness.py --client pi_client_async.py --outage 15:5 --outage 40:12
+  python replay_harness.py --scans 0 --duration 30      # только весы
+
+Требования: python-socketio (сервер входит в пакет); для сканера — evdev
+и запись в /dev/uinput (root или группа input + modprobe uinput), без
+этого прогон идёт без сканов.
+"""
+
+import argparse
+import json
+import os
+import random
+import select
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tty
+import urllib.request
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import socketio
+
+from scale_protocols import DECODERS, GenericDecoder, make_decoder
+
+HERE = Path(__file__).parent
+API_KEY = 'replay-harness'
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def fmt_ms(values):
+    if not values:
+        return 'нет данных'
+    return (f'p50 {percentile(values, 0.5) * 1000:.1f} мс, p95 {percentile(values, 0.95) * 1000:.1f} мс, '
+            f'max {max(values) * 1000:.1f} мс (n={len(values)})')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ── Весы: pty ──
+def ohaus_frame(weight, stable):
+    return f'{weight:9.1f} g  {"*" if stable else "?"}     G\r\n'
+
+
+def synthetic_frames(rng):
+    """Бесконечные взвешивания: (строка, вес)."""
+    while True:
+        for _ in range(rng.randint(10, 20)):
+            yield ohaus_frame(0.0, True), 0.0
+        target = round(rng.uniform(150, 1500), 1)
+        w = 0.0
+        for _ in range(rng.randint(6, 14)):
+            w += (target - w) * 0.45
+            shaky = round(w + rng.uniform(-3, 3), 1)
+            yield ohaus_frame(shaky, False), shaky
+        for _ in range(rng.randint(15, 30)):
+            yield ohaus_frame(target, True), target
+        for part in (0.5, 0.1):
+            w = round(target * part, 1)
+            yield ohaus_frame(w, False), w
+
+
+def recorded_frames(path):
+    """Строки из файла по кругу: (строка, вес или None)."""
+    lines = [l for l in Path(path).read_text().splitlines() if l and not l.startswith('#')]
+    stem = Path(path).stem
+    decoder = make_decoder(stem) if stem in DECODERS else GenericDecoder()
+    parsed = [(line + '\r\n', (decoder.parse(line) or (None,))[0]) for line in lines]
+    while True:
+        yield from parsed
+
+
+class FakeScale:
+    """Псевдотерминал с кадрами весов; помнит, когда каждое значение веса появилось."""
+
+    def __init__(self, frames, rate):
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # без эха и построчной обработки — как настоящий serial
+        self.path = os.ttyname(self.slave)
+        self.frames = frames
+        self.interval = 1.0 / rate
+        self.current = None         # (строка, вес)
+        self.first_seen = {}        # вес → monotonic первого кадра с ним (с последней смены)
+        self.written = 0
+        self.commands = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name='fake-scale', daemon=True).start()
+
+    def _write(self, line, weight):
+        now = time.monotonic()
+        with self._lock:
+            if self.current is None or self.current[1] != weight:
+                if weight is not None:
+                    self.first_seen[weight] = now
+            self.current = (line, weight)
+            self.written += 1
+        os.write(self.master, line.encode('ascii'))
+
+    def _run(self):
+        streaming = False
+        next_frame = time.monotonic()
+        cmd = b''
+        while True:
+            timeout = max(0.0, next_frame - time.monotonic()) if streaming else 0.5
+            r, _, _ = select.select([self.master], [], [], timeout)
+            if r:
+                try:
+                    cmd += os.read(self.master, 256)
+                except OSError:
+                    return
+                while b'\n' in cmd:
+                    line, cmd = cmd.split(b'\n', 1)
+                    command = line.strip().decode('ascii', errors='ignore')
+                    self.commands.append(command)
+                    if command == 'CP':
+                        streaming = True
+                    elif command == 'IP':
+                        # Ответ на IP — текущее показание сразу
+                        frame = self.current or next(self.frames)
+                        self._write(*frame)
+                continue
+            if streaming and time.monotonic() >= next_frame:
+                self._write(*next(self.frames))
+                next_frame += self.interval
+                if next_frame < time.monotonic():
+                    next_frame = time.monotonic() + self.interval
+
+    def seen_at(self, weight):
+        with self._lock:
+            return self.first_seen.get(weight)
+
+
+# ── Сканер: uinput ──
+class FakeScanner:
+    """Виртуальная клавиатура с именем сканера (находится по 'Honeywell' / 'scanner')."""
+
+    def __init__(self):
+        from evdev import UInput, ecodes
+        from barcode_reader import KEY_MAP, KEY_ENTER
+        self.ecodes = ecodes
+        self.keys = {ch: code for code, ch in KEY_MAP.items()}
+        self.enter = KEY_ENTER
+        self.ui = UInput({ecodes.EV_KEY: sorted(set(self.keys.values()) | {KEY_ENTER})},
+                         name='Honeywell Replay Harness Scanner')
+        self.path = self.ui.device.path
+
+    def type(self, code, key_delay=0.001):
+        """Набрать штрихкод + Enter; возвращает monotonic отпускания Enter."""
+        e = self.ecodes
+        for ch in code:
+            key = self.keys[ch]
+            self.ui.write(e.EV_KEY, key, 1)
+            self.ui.write(e.EV_KEY, key, 0)
+            self.ui.syn()
+            time.sleep(key_delay)
+        self.ui.write(e.EV_KEY, self.enter, 1)
+        self.ui.write(e.EV_KEY, self.enter, 0)
+        self.ui.syn()
+        return time.monotonic()
+
+    def close(self):
+        self.ui.close()
+
+
+# ── Сеть: TCP-прокси с обрывами ──
+class DropProxy:
+    def __init__(self, upstream_port):
+        self.upstream_port = upstream_port
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.down = False
+        self._conns = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._accept, name='proxy', daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.sock.accept()
+            if self.down:
+                client.close()
+                continue
+            try:
+                upstream = socket.create_connection(('127.0.0.1', self.upstream_port))
+            except OSError:
+                client.close()
+                continue
+            with self._lock:
+                self._conns.update((client, upstream))
+            threading.Thread(target=self._pump, args=(client, upstream), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client), daemon=True).start()
+
+    def _pump(self, src, dst):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for s in (src, dst):
+                with self._lock:
+                    self._conns.discard(s)
+                try:
+                    s.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                s.close()
+
+    def drop(self):
+        """Оборвать все соединения и не пускать новые."""
+        self.down = True
+        with self._lock:
+            conns = list(self._conns)
+        for s in conns:
+            try:
+                s.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def restore(self):
+        self.down = False
+
+
+# ── Сервер: Socket.io stand-in ──
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # обрывы (--outage) и закрытые WebSocket — штатная ситуация прогона
+
+
+class StandInHandler(WSGIRequestHandler):
+    """wsgiref + сырой сокет в environ (как у werkzeug) — для WebSocket через simple-websocket."""
+
+    def get_environ(self):
+        environ = super().get_environ()
+        environ['werkzeug.socket'] = self.connection
+        return environ
+
+    def get_stderr(self):
+        # simple-websocket завершает запрос исключением после закрытия WebSocket —
+        # wsgiref печатал бы его трассировку
+        return open(os.devnull, 'w')
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class StandInServer:
+    """Обработчики Pi из server/socket/index.js: приём, дедупликация по scanId, ack."""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self.sio = socketio.Server(async_mode='threading')
+        self.app = socketio.WSGIApp(self.sio)
+        self.lock = threading.Lock()
+        self.connects = []          # monotonic подключений
+        self.disconnects = []
+        self.weights = []           # (monotonic, weight, stable)
+        self.frame_latency = []
+        self.scans = {}             # barcode → monotonic первого приёма
+        self.scan_ids = set()
+        self.duplicates = 0
+        self.batches = 0
+        self.index_syncs = 0        # запросов barcode:index_sync
+        self.sync_events = []       # (monotonic, event, count)
+        self.stations = None
+        self.debug = None
+        self._register()
+
+    def _register(self):
+        sio = self.sio
+
+        @sio.event
+        def connect(sid, environ, auth=None):
+            if not auth or auth.get('apiKey') != API_KEY:
+                return False
+            with self.lock:
+                self.connects.append(time.monotonic())
+
+        @sio.event
+        def disconnect(sid, *args):
+            with self.lock:
+                self.disconnects.append(time.monotonic())
+
+        @sio.on('pi:stations')
+        def stations(sid, data):
+            self.stations = data.get('stations')
+
+        @sio.on('scale:weight')
+        def weight(sid, data):
+            now = time.monotonic()
+            w = data.get('weight')
+            seen = self.scale.seen_at(w)
+            with self.lock:
+                self.weights.append((now, w, data.get('stable')))
+                if seen is not None:
+                    self.frame_latency.append(now - seen)
+
+        @sio.on('scale:debug')
+        def debug(sid, data):
+            self.debug = data
+
+        @sio.on('barcode:scan_batch')
+        def scan_batch(sid, data):
+            now = time.monotonic()
+            accepted = duplicates = 0
+            with self.lock:
+                self.batches += 1
+                for scan in data.get('scans', []):
+                    scan_id = scan.get('scanId')
+                    if scan_id in self.scan_ids:
+                        duplicates += 1
+                        continue
+                    self.scan_ids.add(scan_id)
+                    self.scans.setdefault(scan['barcode'], now)
+                    accepted += 1
+                self.duplicates += duplicates
+            return {'ok': True, 'accepted': accepted, 'duplicates': duplicates}
+
+        @sio.on('barcode:index_sync')
+        def index_sync(sid, data):
+            # Пустой индекс: сканы харнесса уходят с known: false
+            with self.lock:
+                self.index_syncs += 1
+            return {'ok': True, 'epoch': 'replay-harness', 'version': 1,
+                    'full': (data or {}).get('epoch') != 'replay-harness', 'entries': [], 'removed': []}
+
+        @sio.on('barcode:scan')
+        def scan(sid, data):
+            with self.lock:
+                self.scans.setdefault(data.get('barcode'), time.monotonic())
+
+        @sio.on('pi:sync_start')
+        def sync_start(sid, data):
+            with self.lock:
+                self.sync_events.append((time.monotonic(), 'start', data.get('barcodeCount')))
+
+        @sio.on('pi:sync_complete')
+        def sync_complete(sid, data):
+            with self.lock:
+                self.sync_events.append((time.monotonic(), 'complete', data.get('barcodeCount')))
+
+    def start(self):
+        self.httpd = make_server('127.0.0.1', 0, self.app, server_class=ThreadingWSGIServer,
+                                 handler_class=StandInHandler)
+        self.port = self.httpd.server_port
+        threading.Thread(target=self.httpd.serve_forever, name='stand-in', daemon=True).start()
+
+    def connected_after(self, t):
+        with self.lock:
+            return next((c for c in self.connects if c >= t), None)
+
+
+# ── Прогон ──
+def parse_outage(value):
+    at, _, length = value.partition(':')
+    return float(at), float(length or 5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='pi_client replay harness (pty + uinput + stand-in server)')
+    parser.add_argument('--client', default='pi_client.py', help='pi_client.py или pi_client_async.py')
+    parser.add_argument('--duration', type=float, default=60, help='длительность прогона, сек')
+    parser.add_argument('--rate', type=float, default=10, help='кадров весов в секунду (CP)')
+    parser.add_argument('--frames', help='файл кадров (bench_frames/ohaus.txt); по умолчанию — синтетика')
+    parser.add_argument('--scans', type=int, default=20, help='сколько штрихкодов набрать')
+    parser.add_argument('--outage', type=parse_outage, action='append',
+                        help='обрыв сети СЕК:ДЛИТЕЛЬНОСТЬ (можно несколько), по умолчанию 25:8')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log', help='лог pi_client (по умолчанию — во временной папке)')
+    parser.add_argument('--json', action='store_true', help='отчёт в JSON')
+    args = parser.parse_args()
+    outages = args.outage if args.outage is not None else [(25.0, 8.0)]
+    rng = random.Random(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix='pi-harness-')
+    frames = recorded_frames(args.frames) if args.frames else synthetic_frames(rng)
+    scale = FakeScale(frames, args.rate)
+    scale.start()
+    server = StandInServer(scale)
+    server.start()
+    proxy = DropProxy(server.port)
+    proxy.start()
+
+    scanner = None
+    if args.scans:
+        try:
+            scanner = FakeScanner()
+        except Exception as e:  # нет evdev / нет доступа к /dev/uinput
+            print(f'[Harness] Virtual scanner unavailable ({e}) — running without scans')
+
+    metrics_port = free_port()
+    env = dict(os.environ)
+    for key in list(env):
+        if key.startswith('STATION'):
+            del env[key]
+    env.update({
+        'SERVER_URL': f'http://127.0.0.1:{proxy.port}',
+        'SCALE_API_KEY': API_KEY,
+        'SERIAL_PORT': scale.path,
+        'SCALE_PROTOCOL': 'auto',
+        'SCALE_MODE': 'continuous',
+        'BARCODE_MODE': 'keyboard',
+        'BARCODE_DEVICE': scanner.path if scanner else os.path.join(workdir, 'no-scanner'),
+        'HOTPLUG': '0',
+        'METRICS_PORT': str(metrics_port),
+        'BUFFER_DB': os.path.join(workdir, 'buffer.db'),
+        'STATUS_SOCKET': os.path.join(workdir, 'status.sock'),
+        'STATIONS': '',
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.pop('NOTIFY_SOCKET', None)
+    log_path = args.log or os.path.join(workdir, 'pi_client.log')
+    log = open(log_path, 'w')
+    client = subprocess.Popen([sys.executable, str(HERE / args.client)], cwd=workdir, env=env,
+                              stdout=log, stderr=subprocess.STDOUT)
+    print(f'[Harness] {args.client} on {scale.path}, server :{server.port} via proxy :{proxy.port}, log {log_path}')
+
+    try:
+        deadline = time.monotonic() + 20
+        while not server.connects and time.monotonic() < deadline and client.poll() is None:
+            time.sleep(0.1)
+        if not server.connects:
+            print('[Harness] pi_client did not connect — see log:')
+            print(Path(log_path).read_text()[-2000:])
+            return 1
+        t0 = server.connects[0]
+        time.sleep(1.0)  # сканер/весы подключаются после сервера
+
+        # Расписание: сканы равномерно, обрывы — по --outage (от первого подключения)
+        events = []
+        if scanner:
+            span = max(1.0, args.duration - 6)
+            for i in range(args.scans):
+                events.append((1 + span * (i + 0.5) / args.scans, 'scan', f'HV{i:06d}'))
+        for at, length in outages:
+            events.append((at, 'drop', length))
+            events.append((at + length, 'restore', length))
+        events.sort(key=lambda e: e[0])
+
+        typed = {}           # barcode → monotonic окончания набора
+        outage_log = []      # [начало, конец, штрихкоды во время обрыва]
+        for at, kind, arg in events:
+            delay = t0 + at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if kind == 'scan':
+                typed[arg] = scanner.type(arg)
+                if proxy.down:
+                    outage_log[-1][2].append(arg)
+            elif kind == 'drop':
+                proxy.drop()
+                outage_log.append([time.monotonic(), None, []])
+            else:
+                proxy.restore()
+                outage_log[-1][1] = time.monotonic()
+        rest = t0 + args.duration - time.monotonic()
+        if rest > 0:
+            time.sleep(rest)
+
+        # Досылка: ждём, пока все набранные сканы дойдут
+        drain_deadline = time.monotonic() + 20
+        while time.monotonic() < drain_deadline and any(b not in server.scans for b in typed):
+            time.sleep(0.2)
+
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{metrics_port}/metrics.json', timeout=2) as r:
+                client_metrics = json.loads(r.read())
+        except OSError:
+            client_metrics = None
+    finally:
+        client.terminate()
+        try:
+            client.wait(5)
+        except subprocess.TimeoutExpired:
+            client.kill()
+        log.close()
+        if scanner:
+            scanner.close()
+
+    run_s = time.monotonic() - t0
+    scan_latency = [server.scans[b] - t for b, t in typed.items() if b in server.scans]
+    lost = [b for b in typed if b not in server.scans]
+    live_weights = [t for t, _w, _s in server.weights]
+    report = {
+        'client': args.client,
+        'durationS': round(run_s, 1),
+        'scale': {
+            'framesWritten': scale.written,
+            'framesPerS': round(scale.written / run_s, 1),
+            'weightEvents': len(live_weights),
+            'weightEventsPerS': round(len(live_weights) / run_s, 2),
+            'frameToServerMs': {q: round(percentile(server.frame_latency, v) * 1000, 1)
+                                for q, v in (('p50', 0.5), ('p95', 0.95), ('max', 1.0))}
+            if server.frame_latency else None,
+            'commands': sorted(set(scale.commands)),
+        },
+        'scans': {
+            'typed': len(typed),
+            'delivered': len(typed) - len(lost),
+            'lost': lost,
+            'duplicatesDropped': server.duplicates,
+            'batches': server.batches,
+            'indexSyncs': server.index_syncs,
+        },
+        'outages': [],
+        'clientMetrics': client_metrics,
+    }
+    for start, end, during in outage_log:
+        reconnect = server.connected_after(end) if end else None
+        delivered = [server.scans[b] for b in during if b in server.scans]
+        report['outages'].append({
+            'atS': round(start - t0, 1),
+            'lengthS': round(end - start, 1) if end else None,
+            'reconnectAfterRestoreS': round(reconnect - end, 2) if reconnect else None,
+            'scansDuring': len(during),
+            'deliveredAfterRestoreS': round(max(delivered) - end, 2) if delivered and end else None,
+            'sync': [(round(t - t0, 1), kind, n) for t, kind, n in server.sync_events if t >= start],
+        })
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        sc = report['scale']
+        print(f'── Весы: {sc["framesWritten"]} кадров ({sc["framesPerS"]}/сек), '
+              f'scale:weight {sc["weightEvents"]} ({sc["weightEventsPerS"]}/сек), команды {sc["commands"]}')
+        print(f'   кадр → сервер: {fmt_ms(server.frame_latency)}')
+        s = report['scans']
+        print(f'── Сканы: набрано {s["typed"]}, доставлено {s["delivered"]}, потеряно {len(s["lost"])}, '
+              f'повторов отброшено {s["duplicatesDropped"]}, пачек {s["batches"]}, '
+              f'синхронизаций индекса {s["indexSyncs"]}')
+        print(f'   скан → сервер: {fmt_ms(scan_latency)}')
+        for i, o in enumerate(report['outages'], 1):
+            print(f'── Обрыв #{i}: {o["atS"]} с, {o["lengthS"]} с; переподключение через '
+                  f'{o["reconnectAfterRestoreS"]} с после восстановления; сканов во время обрыва '
+                  f'{o["scansDuring"]}, доставлены через {o["deliveredAfterRestoreS"]} с; sync {o["sync"]}')
+        if client_metrics:
+            print('── pi_client /metrics.json (мс):')
+            for name, h in client_metrics['latencyMs'].items():
+                if h.get('count'):
+                    print(f'   {name:14s} n={h["count"]:<6} p50 {h["p50"]:<7} p95 {h["p95"]:<7} max {h["max"]}')
+    return 1 if lost else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
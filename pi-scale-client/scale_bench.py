@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Замер скорости разбора строк весов: мкс/строку для каждого декодера
+на корпусе bench_frames/<protocol>.txt, плюс автоопределение.
+
+Использование:
+  python scale_bench.py              # все корпуса
+  python scale_bench.py ohaus -n 50  # один корпус, 50 проходов
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from scale_protocols import DECODERS, GenericDecoder, ProtocolDetector, make_decoder
+
+FRAMES_DIR = Path(__file__).parent / 'bench_frames'
+
+
+def load_corpus(name):
+    lines = (FRAMES_DIR / f'{name}.txt').read_text().splitlines()
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def time_parse(parse, lines, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for line in lines:
+            parse(line)
+    return (time.perf_counter() - start) / (rounds * len(lines)) * 1e6
+
+
+def detect(lines):
+    detector = ProtocolDetector()
+    for i, line in enumerate(lines, 1):
+        chosen = detector.feed(line)
+        if chosen is not None:
+            return chosen.name, i
+    return None, len(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scale protocol parse benchmark')
+    parser.add_argument('corpus', nargs='*', help='bench_frames/<name>.txt (default: all)')
+    parser.add_argument('-n', '--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    names = args.corpus or sorted(p.stem for p in FRAMES_DIR.glob('*.txt'))
+    generic = GenericDecoder()
+    for name in names:
+        lines = load_corpus(name)
+        decoder = make_decoder(name) if name in DECODERS else generic
+        fast = [decoder.parse(line) for line in lines]
+        slow = [generic.parse(line) for line in lines]
+        parsed = sum(1 for r in fast if r is not None)
+        agree = sum(1 for a, b in zip(fast, slow) if a == b)
+        detected, after = detect(lines)
+
+        print(f'── {name}: {len(lines)} строк, разобрано {parsed}, совпадает с generic {agree}/{len(lines)}')
+        print(f'   auto-detect: {detected} после {after} строк')
+        print(f'   {decoder.name:8s} {time_parse(decoder.parse, lines, args.rounds):6.2f} мкс/строку')
+        if decoder is not generic:
+            print(f'   {"generic":8s} {time_parse(generic.parse, lines, args.rounds):6.2f} мкс/строку')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Декодеры протоколов весов (serial, ASCII-строки).
+
+Каждый декодер разбирает одну строку (без \r\n) в (weight, unit, stable)
+или None, и знает свои команды continuous/immediate print.
+
+  ohaus    — Ohaus Ranger 3000 / Defender / Valor:  "   123.4 g  *     G"
+             (* = стабильно, ? = нестабильно; NET/T вместо G)
+  sics     — Mettler Toledo MT-SICS:  "S S     100.00 g" (S = stable),
+             "S D     100.01 g" (D = dynamic); "S I"/"S +"/"S -" — нет веса
+  and      — A&D (FX-i, GF, EK-i, HR):  "ST,+00123.45  g"
+             (ST/US/QT/OL, фиксированные колонки: 2 + ',' + 9 + 3)
+  generic  — старый разбор на регулярках (любой "число единица" формат)
+
+Быстрые декодеры не используют regex: str.split / срезы по колонкам и один
+float(). Автоопределение (ProtocolDetector) смотрит первые несколько строк
+и выбирает декодер, который их уверенно распознал; до этого работает generic.
+
+Замер скорости: python scale_bench.py (корпус в bench_frames/).
+"""
+
+import re
+
+UNITS = ('g', 'kg', 'lb', 'oz', 'ct', 'mg', 'dwt', 'ozt', 'gn')
+
+
+class Decoder:
+    name = 'base'
+    continuous_cmd = None   # команда включения непрерывной отправки
+    immediate_cmd = None    # команда одноразового чтения (любой вес)
+
+    def parse(self, line):
+        """Строка → (weight, unit, stable) или None."""
+        raise NotImplementedError
+
+    def matches(self, line):
+        """Строка точно в формате этого протокола (для автоопределения)."""
+        raise NotImplementedError
+
+
+def _to_float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+class OhausDecoder(Decoder):
+    """Ohaus: [знак]вес, единица, [*|?], [G|NET|T|N]. Без regex."""
+    name = 'ohaus'
+    continuous_cmd = 'CP'
+    immediate_cmd = 'IP'
+
+    def parse(self, line):
+        parts = line.split()
+        if not parts:
+            return None
+        i = 0
+        sign = ''
+        if parts[0] in ('-', '+'):
+            # Некоторые модели печатают знак отдельной колонкой: "-     12.3 g"
+            sign = parts[0]
+            i = 1
+        if i >= len(parts):
+            return None
+        weight = _to_float(sign + parts[i])
+        if weight is None:
+            return None  # OL / UL / текст
+        unit = parts[i + 1].lower() if i + 1 < len(parts) else 'g'
+        if unit not in UNITS:
+            if unit in ('*', '?'):
+                unit = 'g'
+                i -= 1  # единицы нет, маркер сразу за числом
+            else:
+                return None
+        marker = parts[i + 2] if i + 2 < len(parts) else ''
+        # ? = нестабильно; * или пусто (Auto Print шлёт только стабильные) = стабильно
+        return (weight, unit, marker != '?')
+
+    def matches(self, line):
+        parts = line.split()
+        return (
+            2 <= len(parts) <= 5
+            and self.parse(line) is not None
+            and any(p in ('*', '?', 'G', 'NET', 'N', 'T') for p in parts[2:])
+        )
+
+
+class SicsDecoder(Decoder):
+    """Mettler Toledo MT-SICS: "S S      100.00 g" / "S D ..." / "SI"-ответы."""
+    name = 'sics'
+    continuous_cmd = 'SIR'
+    immediate_cmd = 'SI'
+
+    def parse(self, line):
+        parts = line.split()
+        if len(parts) < 3 or parts[0] not in ('S', 'SI', 'SIR'):
+            return None
+        status = parts[1]
+        if status not in ('S', 'D'):
+            return None  # I = занят, + / - = перегрузка / недогрузка
+        if len(parts) >= 4 and parts[2] in ('-', '+'):
+            weight = _to_float(parts[2] + parts[3])
+            unit = parts[4] if len(parts) > 4 else 'g'
+        else:
+            weight = _to_float(parts[2])
+            unit = parts[3] if len(parts) > 3 else 'g'
+        if weight is None:
+            return None
+        return (weight, unit.lower(), status == 'S')
+
+    def matches(self, line):
+        return line[:2] in ('S ', 'SI') and self.parse(line) is not None
+
+
+class AndDecoder(Decoder):
+    """A&D: "ST,+00123.45  g" — 2 символа заголовка, запятая, 9 данных, 3 единицы."""
+    name = 'and'
+    continuous_cmd = None  # stream mode включается функцией весов (prt 1)
+    immediate_cmd = 'Q'
+
+    def parse(self, line):
+        if len(line) < 12 or line[2] != ',':
+            return None
+        header = line[:2]
+        if header not in ('ST', 'US', 'QT'):
+            return None  # OL = перегрузка, прочее — не вес
+        weight = _to_float(line[3:12])
+        if weight is None:
+            return None
+        unit = line[12:].strip().lower() or 'g'
+        return (weight, unit, header != 'US')
+
+    def matches(self, line):
+        return len(line) >= 12 and line[2] == ',' and line[:2] in ('ST', 'US', 'QT', 'OL')
+
+
+class GenericDecoder(Decoder):
+    """Старый разбор: regex "число [единица]" + маркеры * ? ST US."""
+    name = 'generic'
+    continuous_cmd = 'CP'
+    immediate_cmd = 'IP'
+
+    _NUM_UNIT = re.compile(r'([+-]?\s*[\d.]+)\s*(g|kg|lb|oz)', re.IGNORECASE)
+    _NUM = re.compile(r'([+-]?\s*[\d.]+)')
+    _DIGIT = re.compile(r'\d')
+
+    def parse(self, line):
+        # Перегрузка
+        if 'OL' in line.upper() and not self._DIGIT.search(line):
+            return None
+
+        if '*' in line:
+            stable = True
+        elif '?' in line:
+            stable = False
+        else:
+            upper = line.upper()
+            if 'US' in upper:
+                stable = False
+            elif 'ST' in upper:
+                stable = True
+            else:
+                # Нет маркера — считаем стабильным (Auto Print шлёт только стабильные)
+                stable = True
+
+        match = self._NUM_UNIT.search(line)
+        if match:
+            weight = _to_float(match.group(1).replace(' ', ''))
+            if weight is None:
+                return None
+            return (weight, match.group(2).lower(), stable)
+
+        match = self._NUM.search(line)
+        if match:
+            weight = _to_float(match.group(1).replace(' ', ''))
+            if weight is None:
+                return None
+            return (weight, 'g', stable)
+        return None
+
+    def matches(self, line):
+        return self.parse(line) is not None
+
+
+DECODERS = {
+    'ohaus': OhausDecoder,
+    'sics': SicsDecoder,
+    'and': AndDecoder,
+    'generic': GenericDecoder,
+}
+
+
+def make_decoder(name):
+    try:
+        return DECODERS[name]()
+    except KeyError:
+        raise ValueError(f'Unknown scale protocol: {name} (known: {", ".join(DECODERS)}, auto)')
+
+
+class ProtocolDetector:
+    """
+    Автоопределение по первым строкам: каждую строку показываем всем
+    специфичным декодерам; как только один набрал `needed` совпадений
+    (и больше остальных) — он выбран. Если за `max_frames` строк никто
+    не набрал — остаёмся на generic.
+    """
+
+    def __init__(self, needed=3, max_frames=20):
+        self.needed = needed
+        self.max_frames = max_frames
+        self.candidates = [OhausDecoder(), SicsDecoder(), AndDecoder()]
+        self.scores = {d.name: 0 for d in self.candidates}
+        self.frames = 0
+        self.result = None
+
+    def feed(self, line):
+        """Учесть строку. Возвращает выбранный декодер (один раз) или None."""
+        if self.result is not None:
+            return None
+        self.frames += 1
+        for d in self.candidates:
+            if d.matches(line):
+                self.scores[d.name] += 1
+        best = max(self.candidates, key=lambda d: self.scores[d.name])
+        top = self.scores[best.name]
+        if top >= self.needed and list(self.scores.values()).count(top) == 1:
+            self.result = best
+        elif self.frames >= self.max_frames:
+            self.result = GenericDecoder()
+        return self.result
+
+    def probe_cmds(self):
+        """Команды одноразового чтения всех кандидатов: молчащие весы
+        ответят на свою (чужую команду весы отвергают ошибкой — это не кадр)."""
+        return list(dict.fromkeys(d.immediate_cmd for d in self.candidates if d.immediate_cmd))
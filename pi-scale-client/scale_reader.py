@@ -13,24 +13,61 @@
   Команда "CP" включает continuous print (постоянная отправка).
 
   Настройки serial: 9600 baud, 8N1 (8 data bits, no parity, 1 stop bit).
+
+Другие протоколы (Mettler SICS, A&D) и автоопределение — scale_protocols.py;
+protocol='auto' выбирает декодер по первым строкам.
+
+ScaleStream — фоновый поток чтения: блокируется на порту, собирает строки
+по мере прихода байтов и складывает разобранные показания в кольцевой
+буфер. Потребитель ждёт новое показание на Condition, без sleep-опроса.
+AsyncScaleStream — то же без потока: порт в event loop (loop.add_reader).
 """
 
+import asyncio
+import collections
+import os
 import serial
-import re
+import threading
 import time
 
+from hotplug import hint_matches
+from scale_protocols import GenericDecoder, ProtocolDetector, make_decoder
+
 
 class ScaleReader:
-    def __init__(self, port='/dev/ttyUSB0', baudrate=9600, timeout=0.1):
+    HOTPLUG_MATCH = ('tty', ('ttyUSB', 'ttyACM'))  # для hotplug.HotplugMonitor.attach
+
+    def __init__(self, port='/dev/ttyUSB0', baudrate=9600, timeout=0.1, protocol='auto'):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.serial_conn = None
+        self.protocol = protocol
+        self._detector = None
+        self.hotplug = None      # hotplug.Watch — ждать подключения по событию, а не таймеру
+        self._hint = None        # узел из последнего события add
+        self._continuous = False # просили continuous print — повторить командой определённого протокола
+        self._reset_decoder()
+
+    def _reset_decoder(self):
+        """auto: generic до определения протокола по первым строкам."""
+        if self.protocol == 'auto':
+            self.decoder = GenericDecoder()
+            self._detector = ProtocolDetector()
+        else:
+            self.decoder = make_decoder(self.protocol)
+            self._detector = None
 
     def connect(self):
         """Открыть serial-соединение с весами."""
+        port = self.port
+        if self._hint and not os.path.exists(port):
+            # Адаптер вернулся под другим именем (ttyUSB0 → ttyUSB1)
+            print(f'[Scale] {port} not present, using hotplugged {self._hint}')
+            port = self._hint
+        self._hint = None
         self.serial_conn = serial.Serial(
-            port=self.port,
+            port=port,
             baudrate=self.baudrate,
             timeout=self.timeout,
             bytesize=serial.EIGHTBITS,
@@ -39,6 +76,8 @@ class ScaleReader:
         )
         # Очистить буфер
         self.serial_conn.reset_input_buffer()
+        # Весы могли поменять — в режиме auto определяем протокол заново
+        self._reset_decoder()
 
     def is_connected(self):
         """Проверить, открыт ли serial порт."""
@@ -58,13 +97,29 @@ class ScaleReader:
             self.serial_conn.write(f'{command}\r\n'.encode('ascii'))
 
     def enable_continuous_print(self):
-        """Включить непрерывную отправку веса (команда CP)."""
-        self.send_command('CP')
+        """Включить непрерывную отправку веса (Ohaus: CP, SICS: SIR).
+
+        В режиме auto до определения протокола CP поймут только Ohaus —
+        остальных опрашиваем их командами чтения, а их continuous-команду
+        шлём, как только parse_line выберет декодер."""
+        self._continuous = True
+        if self.decoder.continuous_cmd:
+            self.send_command(self.decoder.continuous_cmd)
+        if self._detector is not None:
+            self._probe()
 
     def request_immediate_print(self):
-        """Запросить одноразовое чтение веса (команда IP).
-        IP возвращает текущий вес немедленно, включая нестабильные показания."""
-        self.send_command('IP')
+        """Запросить одноразовое чтение веса (Ohaus: IP, SICS: SI, A&D: Q).
+        Возвращает текущий вес немедленно, включая нестабильные показания.
+        До определения протокола — команды всех кандидатов."""
+        if self._detector is not None:
+            self._probe()
+        elif self.decoder.immediate_cmd:
+            self.send_command(self.decoder.immediate_cmd)
+
+    def _probe(self):
+        for command in self._detector.probe_cmds():
+            self.send_command(command)
 
     def read_weight(self):
         """
@@ -115,58 +170,27 @@ class ScaleReader:
 
     def parse_line(self, line):
         """
-        Разобрать строку от весов Ohaus Ranger 3000.
+        Разобрать строку от весов текущим декодером (см. scale_protocols.py).
 
-        Формат:  "   123.4 g  *     G"
-        Или:     "   123.4 g  ?     G"  (нестабильно)
-        Или:     "   123.4 g  *   NET"  (нетто после тары)
-        Или:     "      OL"             (перегрузка)
+        Ohaus:  "   123.4 g  *     G"  /  "   123.4 g  ?     G" (нестабильно)
+        SICS:   "S S     100.00 g"     /  "S D     100.01 g"
+        A&D:    "ST,+00123.45  g"      /  "US,+00123.45  g"
 
-        Также поддерживает другие распространённые форматы на случай
-        если весы настроены по-другому.
+        В режиме auto первые строки также идут в детектор; после выбора
+        протокола дальше работает только его быстрый декодер.
+        Возвращает (weight, unit, stable) или None.
         """
-        # Перегрузка
-        if 'OL' in line.upper() and not re.search(r'\d', line):
-            return None
-
-        # Ohaus Ranger 3000: стабильность обозначается * или ?
-        if '*' in line:
-            stable = True
-        elif '?' in line:
-            stable = False
-        else:
-            # Fallback для других форматов (ST/US маркеры)
-            upper = line.upper()
-            if 'US' in upper:
-                stable = False
-            elif 'ST' in upper:
-                stable = True
-            else:
-                # Нет маркера — считаем стабильным (Auto Print шлёт только стабильные)
-                stable = True
-
-        # Найти число и единицу измерения
-        match = re.search(r'([+-]?\s*[\d.]+)\s*(g|kg|lb|oz)', line, re.IGNORECASE)
-        if match:
-            weight_str = match.group(1).replace(' ', '')
-            try:
-                weight = float(weight_str)
-            except ValueError:
-                return None
-            unit = match.group(2).lower()
-            return (weight, unit, stable)
-
-        # Попробовать найти просто число (без единицы — предполагаем граммы)
-        match_num = re.search(r'([+-]?\s*[\d.]+)', line)
-        if match_num:
-            weight_str = match_num.group(1).replace(' ', '')
-            try:
-                weight = float(weight_str)
-            except ValueError:
-                return None
-            return (weight, 'g', stable)
-
-        return None
+        if self._detector is not None:
+            chosen = self._detector.feed(line)
+            if chosen is not None:
+                print(f'[Scale] Protocol detected: {chosen.name}')
+                self.decoder = chosen
+                self._detector = None
+                if (self._continuous and chosen.continuous_cmd
+                        and chosen.continuous_cmd != GenericDecoder.continuous_cmd):
+                    # CP во время определения этих весов не касался (SICS: SIR)
+                    self.send_command(chosen.continuous_cmd)
+        return self.decoder.parse(line)
 
     def close(self):
         """Закрыть serial-соединение."""
@@ -188,5 +212,241 @@ class ScaleReader:
                 return True
             except (serial.SerialException, OSError) as e:
                 print(f'Reconnect failed: {e}')
-                time.sleep(delay)
+                if attempt < max_retries:
+                    self.wait_for_device(delay)
         return False
+
+    def wait_for_device(self, timeout):
+        """Пауза перед следующей попыткой: до события hotplug add или timeout."""
+        if self.hotplug is None:
+            time.sleep(timeout)
+            return
+        # /dev/serial/by-id/* udev создаёт чуть позже узла — дождаться симлинка
+        symlink = self.port if self.port.startswith(('/dev/serial/', '/dev/usb/')) else None
+        devnode = self.hotplug.wait(timeout, settle_path=symlink)
+        if devnode and hint_matches(self.port, devnode):
+            self._hint = devnode
+
+
+class ScaleStream:
+    """
+    Поток-читатель serial-порта весов.
+
+    Читает байты по мере поступления (read блокируется до первого байта,
+    максимум serial timeout), режет поток на строки по \n, парсит каждую
+    через reader.parse_line и кладёт (seq, ts, weight, unit, stable) в
+    кольцевой буфер (ts — time.monotonic() прихода строки). Показание доступно потребителю через несколько мс
+    после прихода последнего байта строки.
+
+    IP-опрос (для нестабильного веса, который CP не шлёт) тоже здесь:
+    если кадров нет дольше ip_poll_interval — пишем IP, ответ придёт
+    обычным путём. Никаких reset_input_buffer/sleep в цикле.
+
+    Ошибки порта: закрываем соединение (reader.is_connected() → False),
+    переподключение остаётся за главным циклом.
+    """
+
+    MAX_LINE = 512  # байт без \n — мусор, сбрасываем
+
+    def __init__(self, reader, ring_size=256, ip_poll_interval=None):
+        self.reader = reader
+        self.ip_poll_interval = ip_poll_interval
+        self.ring = collections.deque(maxlen=ring_size)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._running = False
+        self._thread = None
+        self.frames = 0       # всего строк
+        self.bad_frames = 0   # строк, которые не разобрались
+        self.last_error = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='scale-stream', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _feed(self, buf, chunk):
+        """Дописать байты в buf, разобрать готовые строки. True — был хоть один кадр."""
+        got = False
+        buf += chunk
+        while True:
+            idx = buf.find(b'\n')
+            if idx < 0:
+                break
+            line = bytes(buf[:idx]).decode('ascii', errors='ignore').strip()
+            del buf[:idx + 1]
+            if line:
+                self._push(line)
+                got = True
+        if len(buf) > self.MAX_LINE:
+            buf.clear()
+        return got
+
+    def _run(self):
+        buf = bytearray()
+        last_frame = last_ip = time.monotonic()
+        while self._running:
+            conn = self.reader.serial_conn
+            if conn is None or not self.reader.is_connected():
+                buf.clear()
+                time.sleep(0.2)
+                continue
+            try:
+                chunk = conn.read(conn.in_waiting or 1)
+            except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+                # TypeError/AttributeError: порт закрыли из другого потока во время read
+                if self._running:
+                    self.last_error = str(e)
+                    print(f'Serial read error: {e}')
+                    self.reader.close()
+                buf.clear()
+                continue
+
+            now = time.monotonic()
+            if chunk and self._feed(buf, chunk):
+                last_frame = now
+
+            if (self.ip_poll_interval and now - last_frame >= self.ip_poll_interval
+                    and now - last_ip >= self.ip_poll_interval):
+                try:
+                    self.reader.request_immediate_print()
+                except (serial.SerialException, OSError):
+                    pass  # ошибку поймает следующий read
+                last_ip = now
+
+    def _push(self, line):
+        self.frames += 1
+        reading = self.reader.parse_line(line)
+        if reading is None:
+            self.bad_frames += 1
+            return
+        weight, unit, stable = reading
+        with self._cond:
+            self._seq += 1
+            self.ring.append((self._seq, time.monotonic(), weight, unit, stable))
+            self._cond.notify_all()
+
+    def wait(self, after_seq=0, timeout=None):
+        """
+        Дождаться показания новее after_seq.
+        Возвращает последнее (seq, ts, weight, unit, stable) или None по таймауту.
+        Промежуточные показания остаются в ring (для истории).
+        """
+        with self._cond:
+            if not (self.ring and self.ring[-1][0] > after_seq):
+                self._cond.wait(timeout)
+            if self.ring and self.ring[-1][0] > after_seq:
+                return self.ring[-1]
+            return None
+
+    def latest(self):
+        with self._cond:
+            return self.ring[-1] if self.ring else None
+
+
+class AsyncScaleStream(ScaleStream):
+    """
+    asyncio-вариант ScaleStream (RUNTIME asyncio, pi_client_async.py).
+
+    Поток не нужен: дескриптор порта регистрируется в event loop через
+    loop.add_reader, байты читаются в колбэке сразу по готовности (без
+    serial timeout) и идут в тот же разбор/кольцо. Ожидающие показание
+    корутины будит asyncio.Event. IP-опрос — отдельная задача в том же loop.
+
+    Порт открывает/переоткрывает главный цикл; перед reader.close() /
+    reconnect() нужно вызвать detach(), чтобы loop не следил за закрытым fd.
+    """
+
+    def __init__(self, reader, ring_size=256, ip_poll_interval=None):
+        super().__init__(reader, ring_size=ring_size, ip_poll_interval=ip_poll_interval)
+        self._loop = None
+        self._fd = None
+        self._buf = bytearray()
+        self._event = asyncio.Event()
+        self._task = None
+        self._last_frame = self._last_ip = time.monotonic()
+
+    def start(self):
+        self._running = True
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._supervise())
+
+    def stop(self, timeout=None):
+        self._running = False
+        self.detach()
+        if self._task:
+            self._task.cancel()
+        self._event.set()
+
+    def attach(self):
+        """Начать следить за открытым портом."""
+        conn = self.reader.serial_conn
+        if self._fd is not None or conn is None or not self.reader.is_connected():
+            return
+        self._buf.clear()
+        self._fd = conn.fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+
+    def detach(self):
+        if self._fd is not None and self._loop is not None:
+            self._loop.remove_reader(self._fd)
+        self._fd = None
+        self._buf.clear()
+
+    def _on_readable(self):
+        conn = self.reader.serial_conn
+        try:
+            # Дескриптор готов: in_waiting > 0 → read не блокирует;
+            # 0 при готовности = устройство пропало (pyserial бросит SerialException)
+            chunk = conn.read(conn.in_waiting or 1)
+        except (serial.SerialException, OSError, TypeError, AttributeError) as e:
+            self.last_error = str(e)
+            print(f'Serial read error: {e}')
+            self.detach()
+            self.reader.close()
+            self._event.set()  # разбудить главный цикл — он увидит отключение
+            return
+        if chunk and self._feed(self._buf, chunk):
+            self._last_frame = time.monotonic()
+
+    def _push(self, line):
+        super()._push(line)
+        self._event.set()
+
+    async def _supervise(self):
+        """Подхватить переоткрытый порт и слать IP, если CP молчит."""
+        while self._running:
+            if self._fd is None:
+                self.attach()
+            delay = 0.2
+            if self.ip_poll_interval and self._fd is not None:
+                now = time.monotonic()
+                due = max(self._last_frame, self._last_ip) + self.ip_poll_interval
+                if now >= due:
+                    try:
+                        self.reader.request_immediate_print()
+                    except (serial.SerialException, OSError):
+                        pass  # ошибку поймает следующий read
+                    self._last_ip = now
+                    due = now + self.ip_poll_interval
+                delay = min(delay, due - now)
+            await asyncio.sleep(max(delay, 0.01))
+
+    async def wait(self, after_seq=0, timeout=None):
+        """Корутина: как ScaleStream.wait, но без блокировки loop."""
+        if not (self.ring and self.ring[-1][0] > after_seq):
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.ring and self.ring[-1][0] > after_seq:
+            return self.ring[-1]
+        return None
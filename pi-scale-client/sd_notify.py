@@ -0,0 +1,22 @@
+"""
+Уведомления systemd (sd_notify protocol) без внешних зависимостей.
+Используется pi_client.py и pi_client_async.py (Type=notify + WatchdogSec).
+"""
+
+import os
+import socket
+
+
+def sd_notify(state):
+    """Отправить уведомление в systemd (sd_notify protocol)."""
+    addr = os.environ.get('NOTIFY_SOCKET')
+    if not addr:
+        return  # Не запущены под systemd или WatchdogSec не настроен
+    if addr[0] == '@':
+        addr = '\0' + addr[1:]  # abstract socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.connect(addr)
+        sock.sendall(state.encode())
+    finally:
+        sock.close()
@@ -0,0 +1,94 @@
+"""
+Детектор успокоения веса (settling) на стороне Pi.
+
+Весы ставят флаг стабильности (*) консервативно и с задержкой. Детектор
+держит короткое окно последних показаний (по времени) и считает разброс
+(стандартное отклонение) и наклон (МНК, г/с). Как только в окне набралось
+достаточно точек, разброс в пределах допуска и наклон почти нулевой —
+вес считается «успокоившимся»: отдаём медиану окна (в родном разрешении
+весов) и уверенность 0..1. Обычно это на сотни мс раньше флага весов.
+
+Флаг стабильности от самих весов тоже считается успокоением (confidence 1).
+Состояние сбрасывается, когда вес уходит от зафиксированного значения
+больше чем на DEPART_FACTOR допусков (сняли/добавили мешок).
+"""
+
+import collections
+import statistics
+
+DEPART_FACTOR = 3
+
+
+class SettleDetector:
+    def __init__(self, window_s=0.6, min_samples=3, abs_tol=0.5, rel_tol=0.0005,
+                 max_slope=1.0, min_weight=1.0):
+        """
+        window_s:   длина окна, сек
+        min_samples: минимум точек в окне
+        abs_tol / rel_tol: допуск разброса — max(abs_tol, rel_tol × вес), в единицах весов
+        max_slope:  допустимый дрейф, единиц/сек
+        min_weight: ниже этого (пустые весы) settled не объявляем
+        """
+        self.window_s = window_s
+        self.min_samples = min_samples
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        self.max_slope = max_slope
+        self.min_weight = min_weight
+        self._samples = collections.deque()  # (t, weight)
+        self.settled = False
+        self.value = None
+        self.confidence = 0.0
+
+    def _tolerance(self, weight):
+        return max(self.abs_tol, self.rel_tol * abs(weight))
+
+    def update(self, t, weight, scale_stable=False):
+        """
+        Учесть показание (t — секунды, weight — в единицах весов).
+        Возвращает True, если состояние settled изменилось (повод отправить).
+        """
+        samples = self._samples
+        samples.append((t, weight))
+        while samples and t - samples[0][0] > self.window_s:
+            samples.popleft()
+
+        if self.settled:
+            if abs(weight - self.value) > DEPART_FACTOR * self._tolerance(self.value):
+                self.settled = False
+                self.value = None
+                self.confidence = 0.0
+                return True
+            return False
+
+        if abs(weight) < self.min_weight:
+            return False
+
+        if scale_stable:
+            return self._settle(weight, 1.0)
+
+        n = len(samples)
+        if n < self.min_samples or t - samples[0][0] < self.window_s * 0.8:
+            return False
+
+        weights = [w for _, w in samples]
+        mean = sum(weights) / n
+        std = statistics.pstdev(weights, mean)
+        t0 = samples[0][0]
+        xs = [ts - t0 for ts, _ in samples]
+        x_mean = sum(xs) / n
+        sxx = sum((x - x_mean) ** 2 for x in xs)
+        slope = (sum((x - x_mean) * (w - mean) for x, w in zip(xs, weights)) / sxx) if sxx else 0.0
+
+        tol = self._tolerance(mean)
+        if std > tol or abs(slope) > self.max_slope:
+            return False
+        # 1.0 — идеально ровно, 0.0 — на границе допуска
+        worst = max(std / tol, abs(slope) / self.max_slope)
+        return self._settle(statistics.median_high(weights), round(max(0.0, 1.0 - worst), 2))
+
+    def _settle(self, value, confidence):
+        self.settled = True
+        self.value = value
+        self.confidence = confidence
+        return True
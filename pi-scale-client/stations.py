@@ -0,0 +1,181 @@
+"""
+Станции взвешивания: пара весы + сканер.
+
+Один Pi может обслуживать несколько станций (3–4 на сборе урожая).
+Конфигурация в .env:
+
+  STATIONS=a,b,c                  — id станций (пусто — одна станция из
+                                    SERIAL_PORT / BARCODE_DEVICE, id = STATION_ID)
+  STATION_A_SERIAL_PORT=/dev/serial/by-id/...
+  STATION_A_BARCODE_DEVICE=/dev/input/by-path/...-event-kbd
+  STATION_A_BAUD_RATE / _SCALE_PROTOCOL / _BARCODE_MODE /
+  STATION_A_SCALE_USB_ID / _BARCODE_USB_ID — необязательные, по умолчанию
+                                    общие BAUD_RATE, SCALE_PROTOCOL, ...
+
+С несколькими одинаковыми сканерами автоопределение по имени их не
+различит — BARCODE_DEVICE станции нужно задать стабильным путём
+(/dev/input/by-path/ или by-id/, hidpos: /dev/hidrawN).
+
+Первая станция в списке — основная: её вес сервер отдаёт старым клиентам
+и в GET /api/harvest/scale.
+
+Station — устройства и состояние одной станции (ридеры, детектор
+успокоения, политика отправки, история и буфер веса); циклы чтения —
+в pi_client.py / pi_client_async.py, по потоку/задаче на станцию.
+"""
+
+import os
+
+from scale_reader import ScaleReader
+from settle_detector import SettleDetector
+from emit_policy import EmitPolicy
+from event_buffer import LatestWeightBuffer, WeightHistory
+
+
+class StationConfig:
+    def __init__(self, station_id, serial_port, baud_rate, scale_protocol,
+                 barcode_device, barcode_mode, scale_usb_id, barcode_usb_id):
+        self.id = station_id
+        self.serial_port = serial_port
+        self.baud_rate = baud_rate
+        self.scale_protocol = scale_protocol
+        self.barcode_device = barcode_device or None
+        self.barcode_mode = barcode_mode
+        self.scale_usb_ids = scale_usb_id.split(',') if scale_usb_id else None
+        self.barcode_usb_ids = barcode_usb_id.split(',') if barcode_usb_id else None
+
+    def __repr__(self):
+        return f'<Station {self.id}: {self.serial_port} + {self.barcode_device or "auto"}>'
+
+
+def load_stations(env=None):
+    """Станции из окружения (.env уже загружен). Всегда хотя бы одна."""
+    env = os.environ if env is None else env
+    defaults = {
+        'SERIAL_PORT': env.get('SERIAL_PORT', '/dev/ttyUSB0'),
+        'BAUD_RATE': env.get('BAUD_RATE', '9600'),
+        'SCALE_PROTOCOL': env.get('SCALE_PROTOCOL', 'auto'),
+        'BARCODE_DEVICE': env.get('BARCODE_DEVICE', ''),
+        'BARCODE_MODE': env.get('BARCODE_MODE', 'keyboard'),
+        'SCALE_USB_ID': env.get('SCALE_USB_ID', ''),
+        'BARCODE_USB_ID': env.get('BARCODE_USB_ID', ''),
+    }
+    ids = [s.strip() for s in env.get('STATIONS', '').split(',') if s.strip()]
+    if not ids:
+        ids = [env.get('STATION_ID', 'main')]
+    stations = []
+    for station_id in ids:
+        prefix = f'STATION_{station_id.upper()}_'
+
+        def get(key):
+            # Своё значение станции, иначе общее
+            return env.get(prefix + key) or defaults[key]
+
+        if len(ids) > 1:
+            # Одинаковые весы/сканеры различает только свой путь у каждой станции
+            for key in ('SERIAL_PORT', 'BARCODE_DEVICE'):
+                if not env.get(prefix + key):
+                    raise ValueError(f'{prefix}{key} is required when STATIONS lists several stations')
+        stations.append(StationConfig(
+            station_id,
+            serial_port=get('SERIAL_PORT'),
+            baud_rate=int(get('BAUD_RATE')),
+            scale_protocol=get('SCALE_PROTOCOL'),
+            barcode_device=get('BARCODE_DEVICE'),
+            barcode_mode=get('BARCODE_MODE'),
+            scale_usb_id=get('SCALE_USB_ID'),
+            barcode_usb_id=get('BARCODE_USB_ID'),
+        ))
+    return stations
+
+
+def make_barcode_reader(config):
+    """Ридер сканера станции или None (evdev не установлен)."""
+    if config.barcode_mode == 'hidpos':
+        # HID POS: штрихкод целиком в одном hidraw-отчёте, evdev не нужен
+        from hidpos_reader import HidPosReader
+        return HidPosReader(device_path=config.barcode_device)
+    try:
+        from barcode_reader import BarcodeReader
+        return BarcodeReader(device_path=config.barcode_device)
+    except ImportError:
+        print('[Barcode] evdev not installed — barcode scanner disabled')
+        print('[Barcode] To enable: pip install evdev')
+        return None
+
+
+class Station:
+    """Весы + сканер одной станции и всё их состояние (независимо от других станций)."""
+
+    def __init__(self, config, stream_cls, ip_poll_interval=None, settle_kw=None, emit_kw=None, hotplug=None):
+        self.id = config.id
+        self.config = config
+        self.scale = ScaleReader(port=config.serial_port, baudrate=config.baud_rate,
+                                 protocol=config.scale_protocol)
+        # Поток (или задача loop) чтения serial → кольцевой буфер показаний
+        self.scale_stream = stream_cls(self.scale, ip_poll_interval=ip_poll_interval)
+        # Детектор успокоения: settled-вес раньше флага стабильности весов
+        self.settle = SettleDetector(**(settle_kw or {}))
+        # Политика отправки scale:weight: лимит частоты, deadband, переходы — сразу
+        self.emitter = EmitPolicy(**(emit_kw or {}))
+        # История веса: скан берёт вес на момент нажатия курка
+        self.weight_history = WeightHistory()
+        # Офлайн — только последний вес
+        self.weight_buffer = LatestWeightBuffer()
+        self.barcode = make_barcode_reader(config)
+        self.last_weight = None
+        self.last_stable = None
+        self.last_reading_at = None   # time.time() последнего показания весов
+        self.last_scan = None
+        self.last_scan_at = None      # time.time() последнего скана
+        self.last_scan_check = None   # barcode_index.validate() последнего скана
+        self.errors = 0
+        if hotplug is not None:
+            hotplug.attach(f'{self.id}/scale', self.scale, config.scale_usb_ids)
+            if self.barcode is not None:
+                hotplug.attach(f'{self.id}/barcode', self.barcode, config.barcode_usb_ids)
+
+    def weight_payload(self, weight, unit, stable):
+        """scale:weight для показания (settle уже обновлён)."""
+        payload = {
+            'station': self.id,
+            'weight': weight,
+            'unit': unit,
+            'stable': stable,
+            'settled': self.settle.settled,
+        }
+        if self.settle.settled:
+            payload['settledWeight'] = self.settle.value
+            payload['confidence'] = self.settle.confidence
+        return payload
+
+    def debug_info(self):
+        return {
+            'station': self.id,
+            'scaleConnected': self.scale.is_connected(),
+            'serialPort': self.config.serial_port,
+            'barcodeConnected': self.barcode.is_connected() if self.barcode else False,
+            'lastWeight': self.last_weight,
+            'errorCount': self.errors,
+            'hasBufferedWeight': self.weight_buffer.has_value(),
+            'weightEmitted': self.emitter.emitted,
+            'weightSuppressed': self.emitter.suppressed,
+            'lastScanAt': self.last_scan_at,
+        }
+
+    def status(self):
+        """Живое состояние станции для status_socket (всё из памяти, без устройств)."""
+        barcode = self.barcode
+        device = getattr(barcode, 'device', None)  # evdev InputDevice; у hidpos — нет
+        return dict(
+            self.debug_info(),
+            stable=self.last_stable,
+            lastReadingAt=self.last_reading_at,
+            lastScan=self.last_scan,
+            lastScanCheck=self.last_scan_check,
+            barcodeMode=self.config.barcode_mode,
+            barcodeDevice=barcode.device_path if barcode else None,
+            barcodeName=device.name if device is not None else None,
+            barcodeGrabbed=barcode.is_grabbed() if barcode else None,
+            protocol=self.scale.decoder.name,
+        )
@@ -0,0 +1,97 @@
+"""
+Локальный Unix-сокет с живым состоянием pi_client (для pi-health-probe).
+
+Протокол — без запроса: подключился → получил одну строку JSON → сокет
+закрыт. Пример: `socat - UNIX-CONNECT:/run/scale-client/status.sock`.
+
+Снимок собирается из памяти процесса (состояние сканера и grab, последний
+скан, вес, глубина очереди, loop lag) — без SQLite, journalctl и без
+открытия устройств, которые держит pi_client.
+
+Путь — STATUS_SOCKET (по умолчанию /run/scale-client/status.sock, каталог
+создаёт systemd: RuntimeDirectory=scale-client). Права 0660 — читает тот же
+пользователь/группа (probe работает от stepan).
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+
+DEFAULT_PATH = '/run/scale-client/status.sock'
+
+
+def _prepare(path):
+    """Убрать сокет от прошлого запуска (после kill файл остаётся)."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class StatusSocket:
+    def __init__(self, path, snapshot):
+        """snapshot — функция без аргументов, возвращает dict (вызывается на каждое подключение)."""
+        self.path = path
+        self.snapshot = snapshot
+        self.requests = 0
+
+    def _payload(self):
+        self.requests += 1
+        try:
+            data = self.snapshot()
+        except Exception as e:
+            data = {'error': str(e)}
+        return (json.dumps(data, default=str) + '\n').encode()
+
+    def serve(self):
+        """Поток приёма (pi_client.py). Возвращает self или None, если сокет не создать."""
+        try:
+            _prepare(self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self.path)
+            os.chmod(self.path, 0o660)
+            sock.listen(8)
+        except OSError as e:
+            print(f'[Status] Cannot listen on {self.path}: {e}')
+            return None
+        self._sock = sock
+        threading.Thread(target=self._run, name='status-socket', daemon=True).start()
+        print(f'[Status] Unix socket {self.path}')
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError as e:
+                print(f'[Status] accept error: {e}')
+                return
+            with conn:
+                try:
+                    conn.settimeout(1.0)
+                    conn.sendall(self._payload())
+                except OSError:
+                    pass  # читатель ушёл раньше времени
+
+    async def serve_async(self):
+        """То же в event loop (pi_client_async.py)."""
+        async def handle(reader, writer):
+            try:
+                writer.write(self._payload())
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        try:
+            _prepare(self.path)
+            server = await asyncio.start_unix_server(handle, path=self.path)
+            os.chmod(self.path, 0o660)
+        except OSError as e:
+            print(f'[Status] Cannot listen on {self.path}: {e}')
+            return None
+        print(f'[Status] Unix socket {self.path}')
+        return server
@@ -0,0 +1,128 @@
+import { describe, test, expect, beforeAll, afterAll, beforeEach } from '@jest/globals';
+import { connectDB, closeDB, clearDB } from './testHelper.js';
+import FlowerRoom from '../models/FlowerRoom.js';
+import HarvestSession from '../models/HarvestSession.js';
+import { refreshBarcodeIndex, barcodeIndexDelta, strainForPlant } from '../utils/barcodeIndex.js';
+
+let db;
+
+beforeAll(async () => {
+  db = await connectDB();
+});
+
+afterAll(async () => {
+  await closeDB();
+});
+
+beforeEach(async () => {
+  await clearDB();
+  // Индекс живёт в памяти модуля: после очистки БД — пустой
+  await refreshBarcodeIndex();
+});
+
+// ── Helpers ──
+
+async function seedHarvest(roomOverrides = {}) {
+  const room = await FlowerRoom.create({
+    roomNumber: 2,
+    name: 'Room 2',
+    strain: 'OG Kush',
+    plantsCount: 3,
+    isActive: true,
+    ...roomOverrides
+  });
+  const session = await HarvestSession.create({
+    room: room._id,
+    roomNumber: room.roomNumber,
+    roomName: room.name,
+    strain: room.strain,
+    plantsCount: room.plantsCount,
+    status: 'in_progress',
+    plants: []
+  });
+  return { room, session };
+}
+
+function codes(delta) {
+  return delta.entries.map(([code]) => code).sort((a, b) => a - b);
+}
+
+// ── strainForPlant ──
+
+describe('strainForPlant', () => {
+  test('uses the flowerStrains range containing the plant', () => {
+    const room = { flowerStrains: [
+      { strain: 'A', startNumber: 1, endNumber: 10 },
+      { strain: 'B', startNumber: 11, endNumber: 20 }
+    ] };
+    expect(strainForPlant(room, 12)).toBe('B');
+    expect(strainForPlant(room, 30)).toBe('');
+  });
+
+  test('falls back to the single strain or room.strain', () => {
+    expect(strainForPlant({ flowerStrains: [{ strain: 'A' }] }, 5)).toBe('A');
+    expect(strainForPlant({ flowerStrains: [], strain: 'OG Kush' }, 5)).toBe('OG Kush');
+    expect(strainForPlant(null, 5)).toBe('');
+  });
+});
+
+// ── Индекс и дельты ──
+
+describe('barcode index', () => {
+  test('first sync is a full snapshot of active session plants', async () => {
+    await seedHarvest();
+    expect(await refreshBarcodeIndex()).toBe(true);
+
+    const delta = barcodeIndexDelta(undefined, undefined);
+    expect(delta.full).toBe(true);
+    expect(codes(delta)).toEqual(['1', '2', '3']);
+    expect(delta.entries.find(([code]) => code === '2')[1]).toEqual([
+      { room: 2, roomName: 'Room 2', strain: 'OG Kush', harvested: false }
+    ]);
+  });
+
+  test('delta carries only changed plants, then removals after completion', async () => {
+    const { session } = await seedHarvest();
+    await refreshBarcodeIndex();
+    const first = barcodeIndexDelta(undefined, undefined);
+
+    expect(await refreshBarcodeIndex()).toBe(false);
+    expect(barcodeIndexDelta(first.version, first.epoch)).toMatchObject({ full: false, entries: [], removed: [] });
+
+    session.plants.push({ plantNumber: 2, strain: 'OG Kush', wetWeight: 500 });
+    await session.save();
+    expect(await refreshBarcodeIndex()).toBe(true);
+    const second = barcodeIndexDelta(first.version, first.epoch);
+    expect(second.full).toBe(false);
+    expect(second.entries).toEqual([
+      ['2', [{ room: 2, roomName: 'Room 2', strain: 'OG Kush', harvested: true }]]
+    ]);
+
+    session.status = 'completed';
+    await session.save();
+    await refreshBarcodeIndex();
+    const third = barcodeIndexDelta(second.version, second.epoch);
+    expect(third.entries).toEqual([]);
+    expect(third.removed.sort()).toEqual(['1', '2', '3']);
+  });
+
+  test('the same plant number in two rooms lists both matches', async () => {
+    await seedHarvest();
+    await seedHarvest({ roomNumber: 5, name: 'Room 5', strain: 'Haze', plantsCount: 1 });
+    await refreshBarcodeIndex();
+
+    const delta = barcodeIndexDelta(undefined, undefined);
+    const plants = delta.entries.find(([code]) => code === '1')[1];
+    expect(plants.map(p => [p.room, p.strain])).toEqual([[2, 'OG Kush'], [5, 'Haze']]);
+  });
+
+  test('a version from another epoch gets a full snapshot', async () => {
+    await seedHarvest();
+    await refreshBarcodeIndex();
+    const { version } = barcodeIndexDelta(undefined, undefined);
+
+    const delta = barcodeIndexDelta(version, 'other-epoch');
+    expect(delta.full).toBe(true);
+    expect(codes(delta)).toEqual(['1', '2', '3']);
+  });
+});
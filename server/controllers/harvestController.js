@@ -9,10 +9,24 @@ import CloneCut from '../models/CloneCut.js';
 import User from '../models/User.js';
 import { createAuditLog } from '../utils/auditLog.js';
 import { getScaleState } from '../socket/index.js';
+import { refreshBarcodeIndex, strainForPlant } from '../utils/barcodeIndex.js';
 import { t } from '../utils/i18n.js';
 
 const VALID_CREW_ROLES = ['cutting', 'room', 'carrying', 'weighing', 'hooks', 'hanging', 'observer'];
 
+// Индекс штрихкодов на Pi: пересобрать после изменения сессии и, если
+// изменился, позвать Pi за дельтой (barcode:index_sync). Ответ не ждёт.
+function syncBarcodeIndex(req) {
+  const io = req.app?.get('io');
+  if (!io) return;
+  refreshBarcodeIndex()
+    .then((changed) => {
+      const { socketId } = getScaleState();
+      if (changed && socketId) io.to(socketId).emit('barcode:index_changed');
+    })
+    .catch((err) => console.error('Barcode index refresh error:', err));
+}
+
 // @desc    Получить текущее состояние весов (in-memory из Socket.io)
 // @route   GET /api/harvest/scale
 export const getScaleReading = async (req, res) => {
@@ -100,6 +114,7 @@ export const createSession = async (req, res) => {
       plants: []
     });
     await createAuditLog(req, { action: 'harvest.session_start', entityType: 'HarvestSession', entityId: session._id, details: { roomName: room.name, strain: room.strain, plantsCount: room.plantsCount } });
+    syncBarcodeIndex(req);
     res.status(201).json(session);
   } catch (error) {
     console.error('Create harvest session error:', error);
@@ -136,21 +151,8 @@ export const addPlant = async (req, res) => {
     }
 
     // Авто-определение сорта по номеру куста из диапазонов flowerStrains
-    let strainForPlant = '';
     const room = await FlowerRoom.findById(session.room);
-    if (room && room.flowerStrains && room.flowerStrains.length > 0) {
-      const match = room.flowerStrains.find(
-        fs => fs.startNumber != null && fs.endNumber != null &&
-              num >= fs.startNumber && num <= fs.endNumber
-      );
-      if (match) {
-        strainForPlant = match.strain || '';
-      } else if (room.flowerStrains.length === 1) {
-        strainForPlant = room.flowerStrains[0].strain || '';
-      }
-    } else if (room && room.strain) {
-      strainForPlant = room.strain;
-    }
+    const plantStrain = strainForPlant(room, num);
 
     // Определить кто записывает: overrideWorkerId (планшет) или req.user._id (телефон)
     let recorderId = req.user._id;
@@ -170,7 +172,7 @@ export const addPlant = async (req, res) => {
         $push: {
           plants: {
             plantNumber: num,
-            strain: strainForPlant,
+            strain: plantStrain,
             wetWeight: weight,
             recordedAt: new Date(),
             recordedBy: recorderId
@@ -188,6 +190,7 @@ export const addPlant = async (req, res) => {
     await updated.populate('plants.recordedBy', 'name email');
 
     await createAuditLog(req, { action: 'harvest.plant_add', entityType: 'HarvestSession', entityId: updated._id, details: { roomId: updated.room?.toString(), plantNumber: num, wetWeight: weight } });
+    syncBarcodeIndex(req);
     const added = updated.plants[updated.plants.length - 1];
     res.status(201).json({ session: updated, added });
   } catch (error) {
@@ -227,6 +230,7 @@ export const removePlant = async (req, res) => {
     await session.populate('plants.recordedBy', 'name email');
 
     await createAuditLog(req, { action: 'harvest.plant_remove', entityType: 'HarvestSession', entityId: session._id, details: { roomId: session.room?.toString(), plantNumber: num } });
+    syncBarcodeIndex(req);
 
     res.json(session);
   } catch (error) {
@@ -327,6 +331,7 @@ export const completeSession = async (req, res) => {
     }
 
     await session.save();
+    syncBarcodeIndex(req);
     await session.populate('crew.user', 'name email');
 
     // ── Собрать crewData ──
@@ -7,10 +7,13 @@ const alertLogSchema = new mongoose.Schema({
   value: { type: Number, default: null },
   threshold: { type: String, default: null }, // e.g. ">32" or "<18"
   message: { type: String, required: true },
+  source: { type: String, enum: ['server', 'bridge'], default: 'server' },
+  eventId: { type: String, default: undefined }, // set by mqtt_bridge, dedupes replays
   timestamp: { type: Date, default: Date.now }
 });
 
 alertLogSchema.index({ zoneId: 1, timestamp: -1 });
+alertLogSchema.index({ eventId: 1 }, { unique: true, sparse: true });
 alertLogSchema.index({ timestamp: 1 }, { expireAfterSeconds: 90 * 24 * 3600 }); // 90 days TTL
 
 export default mongoose.model('AlertLog', alertLogSchema);
@@ -13,6 +13,9 @@ const systemStatusSnapshotSchema = new mongoose.Schema({
   timestamp: { type: Date, required: true, default: Date.now },
   host: { type: String, required: true },       // 'farm' (main Pi hostname)
   durationMs: Number,                           // сколько probe выполнялся
+  // Чеки идут параллельно с дедлайнами: время каждого и те, что не уложились
+  checkDurationsMs: mongoose.Schema.Types.Mixed,   // { services: 40, piZero: 10012, ... }
+  timedOut: { type: [String], default: [] },
   checks: { type: mongoose.Schema.Types.Mixed, required: true },
   // rawPayload — целиком что прислал probe (для дебага новых чеков)
   rawPayload: mongoose.Schema.Types.Mixed,
@@ -2,6 +2,7 @@ import express from 'express';
 import SensorReading from '../models/SensorReading.js';
 import Zone from '../models/Zone.js';
 import HumidifierLog from '../models/HumidifierLog.js';
+import AlertLog from '../models/AlertLog.js';
 import { setZoneOnlineFromHttp, setZigbeeData, getZigbeeDevices } from '../mqtt/index.js';
 
 const router = express.Router();
@@ -232,6 +233,49 @@ router.post('/status', requireApiKey, async (req, res) => {
   }
 });
 
+// POST /api/sensor-data/alerts — alert/recovery events raised locally by
+// mqtt_bridge (bridge_alerts.py). Single event or batch; events buffered on
+// the Pi during an outage may be replayed, so eventId makes them idempotent.
+router.post('/alerts', requireApiKey, async (req, res) => {
+  try {
+    const events = Array.isArray(req.body) ? req.body : [req.body];
+    let stored = 0;
+    for (const ev of events) {
+      if (!ev?.zoneId || !ev.metric || !ev.message) continue;
+      const doc = {
+        zoneId: ev.zoneId,
+        metric: ev.metric,
+        type: ev.type === 'recovery' ? 'recovery' : 'alert',
+        value: ev.value ?? null,
+        threshold: ev.threshold ?? null,
+        message: ev.message,
+        source: 'bridge',
+        timestamp: ev.timestamp ? new Date(ev.timestamp) : new Date(),
+      };
+      if (ev.eventId) {
+        const result = await AlertLog.updateOne(
+          { eventId: ev.eventId },
+          { $setOnInsert: { ...doc, eventId: ev.eventId } },
+          { upsert: true }
+        );
+        if (!result.upsertedCount) continue; // replayed duplicate
+      } else {
+        await AlertLog.create(doc);
+      }
+      stored++;
+
+      const io = req.app.get('io');
+      if (io) {
+        io.emit('alert:event', doc);
+      }
+    }
+    res.status(201).json({ saved: stored });
+  } catch (error) {
+    console.error('Bridge alert ingest error:', error);
+    res.status(500).json({ message: 'Server error' });
+  }
+});
+
 // GET /api/sensor-data/display/:zoneId — compact data for e-ink display (API key auth)
 router.get('/display/:zoneId', requireApiKey, async (req, res) => {
   try {
@@ -250,7 +250,11 @@ async function seedCooldownsFromDb() {
   try {
     // For each zone+metric, get the last alert and last recovery
     const pipeline = [
-      { $match: { timestamp: { $gte: new Date(Date.now() - 24 * 3600 * 1000) } } },
+      // Bridge events (source: 'bridge') have their own state on the Pi
+      { $match: {
+        timestamp: { $gte: new Date(Date.now() - 24 * 3600 * 1000) },
+        source: { $ne: 'bridge' }
+      } },
       { $sort: { timestamp: -1 } },
       { $group: {
         _id: { zoneId: '$zoneId', metric: '$metric' },
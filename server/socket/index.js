@@ -2,6 +2,7 @@ import { Server as SocketIOServer } from 'socket.io';
 import { verifyAccessToken } from '../utils/jwt.js';
 import User from '../models/User.js';
 import { getZoneStates } from '../mqtt/index.js';
+import { refreshBarcodeIndex, barcodeIndexDelta } from '../utils/barcodeIndex.js';
 
 // ── In-memory состояние весов ──
 let scaleState = {
@@ -9,6 +10,10 @@ let scaleState = {
   lastWeight: null,
   unit: 'g',
   stable: false,
+  // Детектор успокоения на Pi (settle_detector.py): settled раньше флага весов
+  settled: false,
+  settledWeight: null,
+  confidence: null,
   lastUpdate: null,
   socketId: null,
   debug: null, // диагностика от Pi
@@ -16,6 +21,10 @@ let scaleState = {
   syncing: false,
   syncCount: 0,
   bufferedBarcodes: 0,
+  // Станции (весы + сканер) одного Pi: id → состояние как выше (connected, lastWeight, ...).
+  // Верхний уровень scaleState — основная станция (первая в pi:stations)
+  stationIds: [],
+  stations: {},
 };
 
 // Heartbeat: если Pi не шлёт weight > 20 сек — считаем весы отключёнными
@@ -27,8 +36,91 @@ let heartbeatTimer = null;
 const PI_DISCONNECT_GRACE_MS = 5000;
 let piDisconnectTimer = null;
 
+// Дедупликация barcode:scan_batch: Pi повторяет пачку, если ack потерялся.
+// Set хранит порядок вставки — старейшие id вытесняются первыми.
+const RECENT_SCAN_IDS_MAX = 5000;
+const recentScanIds = new Set();
+
+function rememberScanId(scanId) {
+  if (recentScanIds.has(scanId)) return false;
+  recentScanIds.add(scanId);
+  if (recentScanIds.size > RECENT_SCAN_IDS_MAX) {
+    recentScanIds.delete(recentScanIds.values().next().value);
+  }
+  return true;
+}
+
+// Состояние станции (создаётся при первом событии с её id)
+function stationState(id) {
+  if (!scaleState.stations[id]) {
+    scaleState.stations[id] = {
+      connected: false,
+      lastWeight: null,
+      unit: 'g',
+      stable: false,
+      settled: false,
+      settledWeight: null,
+      confidence: null,
+      lastUpdate: null,
+    };
+  }
+  return scaleState.stations[id];
+}
+
+// Событие без station (старый Pi) или от первой станции — обновляет верхний уровень
+function isPrimaryStation(station) {
+  return !station || !scaleState.stationIds.length || station === scaleState.stationIds[0];
+}
+
+function weightPayload(state, station) {
+  const payload = {
+    weight: state.lastWeight,
+    unit: state.unit,
+    stable: state.stable,
+    settled: state.settled,
+    settledWeight: state.settledWeight,
+    confidence: state.confidence
+  };
+  if (station) payload.station = station;
+  return payload;
+}
+
+// Все станции — оффлайн (heartbeat timeout / Pi не вернулся)
+function markStationsOffline() {
+  for (const state of Object.values(scaleState.stations)) {
+    state.connected = false;
+    state.lastWeight = null;
+    state.stable = false;
+    state.lastUpdate = new Date();
+  }
+}
+
+// Разослать скан браузерам (включая вес и флаг buffered)
+function broadcastScan(socket, data) {
+  const { barcode, buffered, weight, unit, stable, scannedAt, station, known, plants } = data;
+  const weightInfo = weight != null ? ` (weight: ${weight} ${unit || 'g'})` : '';
+  const stationInfo = station ? ` [${station}]` : '';
+  if (buffered) {
+    console.log(`Barcode scanned (buffered)${stationInfo}: ${barcode}${weightInfo}`);
+  } else {
+    console.log(`Barcode scanned${stationInfo}: ${barcode}${weightInfo}`);
+  }
+  const payload = { barcode, buffered: !!buffered };
+  if (station) payload.station = station;
+  if (weight != null) {
+    payload.weight = weight;
+    payload.unit = unit || 'g';
+    payload.stable = !!stable;
+  }
+  if (scannedAt) payload.scannedAt = scannedAt;
+  // Проверка по индексу штрихкодов на Pi (barcode_index.py): нет поля — индекса не было
+  if (known != null) payload.known = !!known;
+  if (Array.isArray(plants)) payload.plants = plants;
+  socket.broadcast.emit('barcode:scan', payload);
+}
+
 export function getScaleState() {
-  return { ...scaleState };
+  return { ...scaleState, stations: { ...scaleState.stations } };
 }
 
 // ── Инициализация Socket.io ──
@@ -154,6 +246,8 @@ function resetHeartbeat(io) {
       scaleState.lastWeight = null;
       scaleState.stable = false;
       scaleState.lastUpdate = new Date();
+      markStationsOffline();
+      // Без station — браузеры применяют ко всем станциям
       io.emit('scale:status', { connected: false });
     }
   }, HEARTBEAT_TIMEOUT_MS);
@@ -196,55 +290,88 @@ function handlePiConnection(io, socket) {
   // Запустить heartbeat
   resetHeartbeat(io);
 
-  // Получение веса от Pi
+  // Список станций Pi (при каждом подключении, до остальных событий)
+  socket.on('pi:stations', (data) => {
+    const ids = Array.isArray(data?.stations) ? data.stations.filter(Boolean).map(String) : [];
+    scaleState.stationIds = ids;
+    for (const id of Object.keys(scaleState.stations)) {
+      if (!ids.includes(id)) delete scaleState.stations[id];
+    }
+    ids.forEach(stationState);
+    console.log(`Pi stations: ${ids.join(', ') || '(none)'}`);
+    io.emit('scale:stations', { stations: ids, primary: ids[0] || null });
+  });
+
+  // Получение веса от Pi (data.station — станция; у старых Pi нет)
   socket.on('scale:weight', (data) => {
-    const { weight, unit, stable } = data;
-    scaleState.lastWeight = typeof weight === 'number' ? weight : null;
-    scaleState.unit = unit || 'g';
-    scaleState.stable = !!stable;
-    scaleState.lastUpdate = new Date();
-
-    // Если до этого connected был false (heartbeat timeout или scale:status false) — восстановить
-    if (!scaleState.connected) {
-      scaleState.connected = true;
-      io.emit('scale:status', { connected: true });
+    const { weight, unit, stable, settled, settledWeight, confidence, station } = data;
+    const targets = [];
+    if (station) targets.push(stationState(station));
+    if (isPrimaryStation(station)) targets.push(scaleState);
+    let revived = false;
+    for (const state of targets) {
+      if (!state.connected) revived = true;
+      state.lastWeight = typeof weight === 'number' ? weight : null;
+      state.unit = unit || 'g';
+      state.stable = !!stable;
+      state.settled = !!settled;
+      state.settledWeight = settled && typeof settledWeight === 'number' ? settledWeight : null;
+      state.confidence = settled && typeof confidence === 'number' ? confidence : null;
+      state.lastUpdate = new Date();
+
+      // Если до этого connected был false (heartbeat timeout или scale:status false) — восстановить
+      state.connected = true;
     }
+    if (revived) io.emit('scale:status', station ? { connected: true, station } : { connected: true });
 
     // Сбросить heartbeat таймер
     resetHeartbeat(io);
 
     // Broadcast всем (включая браузеры)
-    socket.broadcast.emit('scale:weight', {
-      weight: scaleState.lastWeight,
-      unit: scaleState.unit,
-      stable: scaleState.stable
-    });
+    socket.broadcast.emit('scale:weight', weightPayload(targets[0], station));
   });
 
   // Статус весов от Pi (весы подключены/отключены от Pi физически)
   socket.on('scale:status', (data) => {
-    const wasConnected = scaleState.connected;
-    scaleState.connected = !!data.connected;
-    scaleState.lastUpdate = new Date();
+    const station = data?.station;
+    const connected = !!data?.connected;
+    let changed = false;
+    if (station) {
+      const state = stationState(station);
+      changed = state.connected !== connected;
+      state.connected = connected;
+      state.lastUpdate = new Date();
+      if (!connected) {
+        state.lastWeight = null;
+        state.stable = false;
+      }
+    }
+    if (isPrimaryStation(station)) {
+      const wasConnected = scaleState.connected;
+      scaleState.connected = connected;
+      scaleState.lastUpdate = new Date();
 
-    if (!data.connected) {
-      scaleState.lastWeight = null;
-      scaleState.stable = false;
-      clearHeartbeat();
-    } else {
-      resetHeartbeat(io);
+      if (!connected) {
+        scaleState.lastWeight = null;
+        scaleState.stable = false;
+        clearHeartbeat();
+      } else {
+        resetHeartbeat(io);
+      }
+      if (!station) changed = wasConnected !== connected;
     }
 
     // Сообщить браузерам только если статус изменился
-    if (wasConnected !== scaleState.connected) {
-      console.log(`Scale status from Pi: connected=${data.connected}`);
-      io.emit('scale:status', { connected: scaleState.connected });
+    if (changed) {
+      console.log(`Scale status from Pi${station ? ` [${station}]` : ''}: connected=${connected}`);
+      io.emit('scale:status', station ? { connected, station } : { connected });
     }
   });
 
   // Ошибка от Pi
   socket.on('scale:error', (data) => {
-    console.warn('Scale error:', data?.message || data);
+    const station = data?.station ? ` [${data.station}]` : '';
+    console.warn(`Scale error${station}:`, data?.message || data);
   });
 
   // Диагностика от Pi (каждые 5 сек) — также служит heartbeat
@@ -255,25 +382,40 @@ function handlePiConnection(io, socket) {
     socket.broadcast.emit('scale:debug', scaleState.debug);
   });
 
-  // Получение скана штрихкода от Pi
+  // Получение скана штрихкода от Pi (старые клиенты, без подтверждения)
   socket.on('barcode:scan', (data) => {
-    const { barcode, buffered, weight, unit, stable, scannedAt } = data;
-    if (barcode) {
-      const weightInfo = weight != null ? ` (weight: ${weight} ${unit || 'g'})` : '';
-      if (buffered) {
-        console.log(`Barcode scanned (buffered): ${barcode}${weightInfo}`);
-      } else {
-        console.log(`Barcode scanned: ${barcode}${weightInfo}`);
-      }
-      // Broadcast всем браузерам (включая вес и флаг buffered)
-      const payload = { barcode, buffered: !!buffered };
-      if (weight != null) {
-        payload.weight = weight;
-        payload.unit = unit || 'g';
-        payload.stable = !!stable;
+    if (data?.barcode) broadcastScan(socket, data);
+  });
+
+  // Пачка сканов с подтверждением: Pi удаляет строки из очереди только после ack.
+  // Повторная доставка (ack потерялся) отбрасывается по scanId.
+  socket.on('barcode:scan_batch', (data, ack) => {
+    const scans = Array.isArray(data?.scans) ? data.scans : [];
+    let accepted = 0;
+    let duplicates = 0;
+    for (const scan of scans) {
+      if (!scan?.barcode) continue;
+      if (scan.scanId && !rememberScanId(scan.scanId)) {
+        duplicates++;
+        continue;
       }
-      if (scannedAt) payload.scannedAt = scannedAt;
-      socket.broadcast.emit('barcode:scan', payload);
+      broadcastScan(socket, scan);
+      accepted++;
+    }
+    if (duplicates) console.log(`Barcode batch: ${duplicates} duplicate scan(s) skipped`);
+    if (typeof ack === 'function') ack({ ok: true, accepted, duplicates });
+  });
+
+  // Индекс штрихкодов для Pi: изменения после его версии (или полный снимок) в ack
+  socket.on('barcode:index_sync', async (data, ack) => {
+    if (typeof ack !== 'function') return;
+    try {
+      await refreshBarcodeIndex();
+      const delta = barcodeIndexDelta(data?.version, data?.epoch);
+      ack({ ok: true, ...delta });
+    } catch (err) {
+      console.error('Barcode index sync error:', err);
+      ack({ ok: false, error: err.message });
     }
   });
 
@@ -318,6 +460,7 @@ function handlePiConnection(io, socket) {
           scaleState.syncing = false;
           scaleState.syncCount = 0;
           scaleState.bufferedBarcodes = 0;
+          markStationsOffline();
           io.emit('scale:status', { connected: false });
         }
       }, PI_DISCONNECT_GRACE_MS);
@@ -328,13 +471,21 @@ function handlePiConnection(io, socket) {
 // ── Браузер подключение ──
 function handleBrowserConnection(io, socket) {
   // Сразу отправить текущее состояние весов
+  if (scaleState.stationIds.length) {
+    socket.emit('scale:stations', { stations: scaleState.stationIds, primary: scaleState.stationIds[0] });
+  }
   socket.emit('scale:status', { connected: scaleState.connected });
   if (scaleState.connected && scaleState.lastWeight != null) {
-    socket.emit('scale:weight', {
-      weight: scaleState.lastWeight,
-      unit: scaleState.unit,
-      stable: scaleState.stable
-    });
+    socket.emit('scale:weight', weightPayload(scaleState, scaleState.stationIds[0]));
+  }
+  // Остальные станции
+  for (const id of scaleState.stationIds.slice(1)) {
+    const state = scaleState.stations[id];
+    if (!state) continue;
+    socket.emit('scale:status', { connected: state.connected, station: id });
+    if (state.connected && state.lastWeight != null) {
+      socket.emit('scale:weight', weightPayload(state, id));
+    }
   }
   // Отправить текущую диагностику (если есть)
   if (scaleState.debug) {
@@ -422,6 +573,8 @@ async function handleProbeConnection(io, socket) {
         timestamp: payload?.timestamp ? new Date(payload.timestamp) : new Date(),
         host: payload?.host || 'unknown',
         durationMs: payload?.durationMs,
+        checkDurationsMs: payload?.checkDurationsMs,
+        timedOut: Array.isArray(payload?.timedOut) ? payload.timedOut : [],
         checks: payload?.checks || {},
         rawPayload: payload,
       });
@@ -0,0 +1,152 @@
+import HarvestSession from '../models/HarvestSession.js';
+import FlowerRoom from '../models/FlowerRoom.js';
+
+// Индекс штрихкодов для Pi (pi-scale-client/barcode_index.py): номер куста →
+// комнаты активных сессий сбора, сорт, собран ли. Pi держит копию и проверяет
+// скан сразу, даже без связи; синхронизация — barcode:index_sync по версии.
+//
+// Штрихкод — номер куста (как на странице сбора). Номера в разных комнатах
+// повторяются, поэтому значение — список совпадений.
+
+// Защита от опечатки в диапазоне сорта (endNumber: 100000)
+const MAX_PLANT_NUMBER = 5000;
+// Сколько удалённых штрихкодов помнить для дельты; старше — полный снимок
+const TOMBSTONES_MAX = 5000;
+
+const index = {
+  // Меняется с рестартом сервера: версия Pi из другой эпохи → полный снимок
+  epoch: Date.now().toString(36),
+  version: 0,
+  floor: 0,               // дельта возможна только с версии >= floor
+  entries: new Map(),     // code → { plants, json, v }
+  removed: new Map()      // code → v удаления
+};
+
+let refreshing = null;
+
+/**
+ * Сорт куста по номеру: диапазоны flowerStrains комнаты, иначе единственный
+ * сорт / room.strain (так же определяется при записи куста в сессию).
+ */
+export function strainForPlant(room, num) {
+  if (room && room.flowerStrains && room.flowerStrains.length > 0) {
+    const match = room.flowerStrains.find(
+      fs => fs.startNumber != null && fs.endNumber != null &&
+            num >= fs.startNumber && num <= fs.endNumber
+    );
+    if (match) return match.strain || '';
+    if (room.flowerStrains.length === 1) return room.flowerStrains[0].strain || '';
+    return '';
+  }
+  return room?.strain || '';
+}
+
+// Номера кустов комнаты: 1..plantsCount, карта комнаты, диапазоны сортов, уже собранные
+function plantNumbers(room, session) {
+  const nums = new Set();
+  const count = Math.min(room?.plantsCount || session.plantsCount || 0, MAX_PLANT_NUMBER);
+  for (let n = 1; n <= count; n++) nums.add(n);
+  for (const p of room?.roomLayout?.plantPositions || []) nums.add(p.plantNumber);
+  for (const fs of room?.flowerStrains || []) {
+    if (fs.startNumber == null || fs.endNumber == null) continue;
+    const end = Math.min(fs.endNumber, MAX_PLANT_NUMBER);
+    for (let n = Math.max(fs.startNumber, 1); n <= end; n++) nums.add(n);
+  }
+  for (const p of session.plants || []) nums.add(p.plantNumber);
+  return [...nums].filter(n => Number.isInteger(n) && n > 0 && n <= MAX_PLANT_NUMBER);
+}
+
+// Полный индекс из БД: code → [{ room, roomName, strain, harvested }]
+async function buildEntries() {
+  const sessions = await HarvestSession.find({ status: 'in_progress' })
+    .select('room roomNumber roomName strain plantsCount plants.plantNumber plants.strain')
+    .lean();
+  const rooms = await FlowerRoom.find({ _id: { $in: sessions.map(s => s.room) } })
+    .select('roomNumber name strain plantsCount flowerStrains roomLayout.plantPositions')
+    .lean();
+  const roomById = new Map(rooms.map(r => [r._id.toString(), r]));
+
+  const entries = new Map();
+  for (const session of sessions) {
+    const room = roomById.get(session.room?.toString());
+    const harvested = new Map((session.plants || []).map(p => [p.plantNumber, p]));
+    for (const num of plantNumbers(room, session)) {
+      const plant = harvested.get(num);
+      const code = String(num);
+      if (!entries.has(code)) entries.set(code, []);
+      entries.get(code).push({
+        room: session.roomNumber || room?.roomNumber || null,
+        roomName: session.roomName || room?.name || '',
+        strain: plant?.strain || strainForPlant(room || session, num),
+        harvested: !!plant
+      });
+    }
+  }
+  for (const plants of entries.values()) plants.sort((a, b) => (a.room || 0) - (b.room || 0));
+  return entries;
+}
+
+async function rebuild() {
+  const fresh = await buildEntries();
+  const changed = [];
+  for (const [code, plants] of fresh) {
+    const json = JSON.stringify(plants);
+    if (index.entries.get(code)?.json !== json) changed.push([code, plants, json]);
+  }
+  const gone = [...index.entries.keys()].filter(code => !fresh.has(code));
+  if (!changed.length && !gone.length) return false;
+
+  index.version++;
+  for (const [code, plants, json] of changed) {
+    index.entries.set(code, { plants, json, v: index.version });
+    index.removed.delete(code);
+  }
+  for (const code of gone) {
+    index.entries.delete(code);
+    index.removed.set(code, index.version);
+  }
+  if (index.removed.size > TOMBSTONES_MAX) {
+    // Забыть удалённые: у кого версия старше — получат полный снимок
+    index.removed.clear();
+    index.floor = index.version;
+  }
+  console.log(`Barcode index v${index.version}: ${index.entries.size} barcode(s), ${changed.length} changed, ${gone.length} removed`);
+  return true;
+}
+
+/**
+ * Пересобрать индекс из активных сессий сбора. Параллельные вызовы ждут
+ * текущую пересборку и запускают ещё одну (изменение могло прийти во время неё).
+ * @returns {Promise<boolean>} индекс изменился
+ */
+export function refreshBarcodeIndex() {
+  const run = (refreshing || Promise.resolve()).then(() => rebuild());
+  const settled = run.catch(() => false);
+  refreshing = settled;
+  settled.then(() => {
+    if (refreshing === settled) refreshing = null;
+  });
+  return run;
+}
+
+/**
+ * Ответ на barcode:index_sync: изменения после версии Pi или полный снимок.
+ * @param {number} version - версия индекса на Pi
+ * @param {string} epoch - эпоха, в которой Pi получил эту версию
+ */
+export function barcodeIndexDelta(version, epoch) {
+  const full = epoch !== index.epoch || !Number.isInteger(version) ||
+               version < index.floor || version > index.version;
+  const since = full ? -1 : version;
+  const entries = [];
+  for (const [code, entry] of index.entries) {
+    if (entry.v > since) entries.push([code, entry.plants]);
+  }
+  const removed = [];
+  if (!full) {
+    for (const [code, v] of index.removed) {
+      if (v > since) removed.push(code);
+    }
+  }
+  return { epoch: index.epoch, version: index.version, full, entries, removed };
+}